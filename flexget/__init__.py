@@ -2,34 +2,52 @@
 
 from __future__ import unicode_literals, division, absolute_import
 import os
+import sys
 import logging
+from argparse import ArgumentParser
 from flexget import logger
 from flexget.options import get_parser
 from flexget import plugin
-from flexget.manager import Manager
+from flexget.manager import Manager, find_config_file, forward_to_daemon, start_logging
 
 __version__ = '{git}'
 
 log = logging.getLogger('main')
 
 
+def config_base(args=None):
+    """
+    Finds the directory of the config file given on the command line. Needed before plugins are loaded, so the
+    arguments cannot be parsed by the full parser yet.
+
+    :returns: Config directory, or None if the config file was not found
+    """
+    if args is None:
+        args = [unicode(arg, sys.getfilesystemencoding()) for arg in sys.argv[1:]]
+    parser = ArgumentParser(add_help=False)
+    parser.add_argument('-c', dest='config', default='config.yml')
+    config = find_config_file(os.path.expanduser(parser.parse_known_args(args)[0].config))[0]
+    return config and os.path.normpath(os.path.dirname(config))
+
+
 def main(args=None):
     """Main entry point for Command Line Interface"""
 
     logger.initialize()
 
-    plugin.load_plugins()
+    # Plugin modules not needed for the command line are only imported when a task uses them. The manifest of plugin
+    # modules is kept in the config directory.
+    plugin.load_plugins(lazy=True, manifest_dir=config_base(args))
 
     options = get_parser().parse_args(args)
 
+    # Hand execution over to a running daemon before loading the config and database
+    if forward_to_daemon(options):
+        return
+
     manager = Manager(options)
 
-    log_level = logging.getLevelName(options.loglevel.upper())
-    log_file = os.path.expanduser(manager.options.logfile)
-    # If an absolute path is not specified, use the config directory.
-    if not os.path.isabs(log_file):
-        log_file = os.path.join(manager.config_base, log_file)
-    logger.start(log_file, log_level)
+    start_logging(options, manager.config_base)
     if options.profile:
         try:
             import cProfile as profile
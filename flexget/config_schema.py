@@ -1,6 +1,7 @@
 from __future__ import unicode_literals, division, absolute_import
 from collections import defaultdict
 from datetime import datetime
+import copy
 import os
 import re
 import urlparse
@@ -10,9 +11,13 @@ from jsonschema.compat import str_types
 
 from flexget.event import fire_event
 from flexget.utils import qualities, template
-from flexget.utils.tools import parse_timedelta
+from flexget.utils.tools import parse_timedelta, config_fingerprint
 
 schema_paths = {}
+# Compiled validators for the root config schema, cleared whenever a schema is registered
+_validators = {}
+# Task configs which passed validation, {fingerprint: config with defaults}
+_task_results = {}
 
 
 # TODO: Rethink how config key and schema registration work
@@ -24,6 +29,8 @@ def register_schema(path, schema):
     :param schema: The schema, or function which returns the schema
     """
     schema_paths[path] = schema
+    _validators.clear()
+    _task_results.clear()
 
 
 # Validator that handles root structure of config.
@@ -94,15 +101,13 @@ def process_config(config, schema=None, set_defaults=True):
 
     """
     if schema is None:
-        schema = get_schema()
-    resolver = RefResolver.from_schema(schema)
-    validator = SchemaValidator(schema, resolver=resolver, format_checker=format_checker)
-    if set_defaults:
-        validator.VALIDATORS['properties'] = validate_properties_w_defaults
-    try:
-        errors = list(validator.iter_errors(config))
-    finally:
-        validator.VALIDATORS['properties'] = jsonschema.Draft4Validator.VALIDATORS['properties']
+        if set_defaults and isinstance(config, dict) and isinstance(config.get('tasks'), dict):
+            return _process_root_config(config)
+        validator = _get_validator(get_schema(), set_defaults)
+    else:
+        validator_class = DefaultsSchemaValidator if set_defaults else SchemaValidator
+        validator = validator_class(schema, resolver=RefResolver.from_schema(schema), format_checker=format_checker)
+    errors = list(validator.iter_errors(config))
     # Customize the error messages
     for e in errors:
         set_error_message(e)
@@ -110,6 +115,52 @@ def process_config(config, schema=None, set_defaults=True):
     return errors
 
 
+def _get_validator(schema, set_defaults):
+    """Returns a cached validator for `schema`, which must be a part of the root config schema."""
+    key = (id(schema), set_defaults)
+    if key not in _validators:
+        validator_class = DefaultsSchemaValidator if set_defaults else SchemaValidator
+        resolver = RefResolver.from_schema(get_schema())
+        # Keep a reference to the schema, so that its id cannot be reused while cached
+        _validators[key] = (schema, validator_class(schema, resolver=resolver, format_checker=format_checker))
+    return _validators[key][1]
+
+
+def _process_root_config(config):
+    """
+    Validates the root config, sets defaults within it, and returns the errors. Each task is validated on its own, and
+    valid task configs are remembered by their fingerprint, so unchanged tasks are not validated again. Invalid ones
+    are always validated again, the errors may go away when more plugins are loaded.
+    """
+    global _task_results
+    root = dict(config, tasks={})
+    errors = list(_get_validator(get_schema(), True).iter_errors(root))
+    for e in errors:
+        set_error_message(e)
+        e.json_pointer = '/' + '/'.join(map(unicode, e.path))
+    # Defaults may have been added at the root level
+    config.update((key, value) for key, value in root.iteritems() if key != 'tasks')
+    task_schema = get_schema()['properties']['tasks']['additionalProperties']
+    results = {}
+    for name, task_config in config['tasks'].iteritems():
+        fingerprint = config_fingerprint(task_config)
+        if fingerprint in _task_results:
+            # Cached results are copied so that they are never modified through the config
+            results[fingerprint] = _task_results[fingerprint]
+            config['tasks'][name] = copy.deepcopy(results[fingerprint])
+            continue
+        task_errors = list(_get_validator(task_schema, True).iter_errors(task_config))
+        if not task_errors:
+            results[fingerprint] = copy.deepcopy(task_config)
+        for e in task_errors:
+            set_error_message(e)
+            e.json_pointer = '/' + '/'.join(map(unicode, ['tasks', name] + list(e.path)))
+            errors.append(e)
+    # Only remember the tasks of the latest config
+    _task_results = results
+    return errors
+
+
 def parse_time(time_string):
     """Parse a time string from the config into a :class:`datetime.time` object."""
     formats = ['%I:%M %p', '%H:%M', '%H:%M:%S']
@@ -326,3 +377,4 @@ validators = {
 }
 
 SchemaValidator = jsonschema.validators.extend(jsonschema.Draft4Validator, validators)
+DefaultsSchemaValidator = jsonschema.validators.extend(SchemaValidator, {'properties': validate_properties_w_defaults})
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals, division, absolute_import
 import logging
 
+import sqlalchemy
 from sqlalchemy import Column, Integer, String
 
 from flexget.manager import Base, Session
@@ -12,6 +13,8 @@ log = logging.getLogger('schema')
 
 # Stores a mapping of {plugin: {'version': version, 'tables': ['table_names'])}
 plugin_schemas = {}
+# Cached mapping of {plugin: version} stored in the database, loaded on first use
+_versions = None
 
 
 class PluginSchema(Base):
@@ -30,54 +33,91 @@ class PluginSchema(Base):
         return '<PluginSchema(plugin=%s,version=%i)>' % (self.plugin, self.version)
 
 
+def reset_version_cache():
+    """Forgets the cached schema versions, must be called when connecting to a different database."""
+    global _versions
+    _versions = None
+
+
+def get_versions():
+    """
+    :returns: Dict mapping plugin names to their schema version stored in the database. Loaded with a single query the
+        first time it is needed, and kept up to date when changes by :func:`set_version` are committed.
+    """
+    global _versions
+    if _versions is None:
+        session = Session()
+        try:
+            _versions = dict(session.query(PluginSchema.plugin, PluginSchema.version).all())
+        finally:
+            session.close()
+    return _versions
+
+
 def get_version(plugin):
-    session = Session()
-    try:
-        schema = session.query(PluginSchema).filter(PluginSchema.plugin == plugin).first()
-        if not schema:
-            log.debug('No schema version stored for %s' % plugin)
-            return None
-        else:
-            return schema.version
-    finally:
-        session.close()
+    version = get_versions().get(plugin)
+    if version is None:
+        log.debug('No schema version stored for %s' % plugin)
+    return version
 
 
-def set_version(plugin, version):
+@with_session
+def set_version(plugin, version, session=None):
+    """
+    Stores the schema `version` for `plugin`.
+
+    :param session: If given, the change is added to this session and committed with it. Otherwise it is committed
+        immediately.
+    """
     if plugin not in plugin_schemas:
         raise ValueError('Tried to set schema version for %s plugin with no versioned_base.' % plugin)
     base_version = plugin_schemas[plugin]['version']
     if version != base_version:
         raise ValueError('Tried to set %s plugin schema version to %d when '
                          'it should be %d as defined in versioned_base.' % (plugin, version, base_version))
-    session = Session()
-    try:
-        schema = session.query(PluginSchema).filter(PluginSchema.plugin == plugin).first()
-        if not schema:
-            log.debug('Initializing plugin %s schema version to %i' % (plugin, version))
-            schema = PluginSchema(plugin, version)
-            session.add(schema)
+    schema = session.query(PluginSchema).filter(PluginSchema.plugin == plugin).first()
+    if not schema:
+        log.debug('Initializing plugin %s schema version to %i' % (plugin, version))
+        schema = PluginSchema(plugin, version)
+        session.add(schema)
+    else:
+        if version < schema.version:
+            raise ValueError('Tried to set plugin %s schema version to lower value' % plugin)
+        if version != schema.version:
+            log.debug('Updating plugin %s schema version to %i' % (plugin, version))
+            schema.version = version
+    # The cache is only updated once the session is committed
+    session.info.setdefault('schema_versions', {})[plugin] = version
+
+
+@sqlalchemy.event.listens_for(Session, 'after_commit')
+def update_version_cache(session):
+    """Applies the schema version changes of a committed session to the version cache."""
+    changes = session.info.pop('schema_versions', None)
+    if not changes or _versions is None:
+        return
+    for plugin, version in changes.iteritems():
+        if version is None:
+            _versions.pop(plugin, None)
         else:
-            if version < schema.version:
-                raise ValueError('Tried to set plugin %s schema version to lower value' % plugin)
-            if version != schema.version:
-                log.debug('Updating plugin %s schema version to %i' % (plugin, version))
-                schema.version = version
-        session.commit()
-    finally:
-        session.close()
+            _versions[plugin] = version
+
+
+@sqlalchemy.event.listens_for(Session, 'after_soft_rollback')
+def discard_version_changes(session, previous_transaction):
+    """Schema version changes of a rolled back session never reach the database, don't cache them."""
+    # Only once the outermost transaction has been rolled back
+    if session.is_active:
+        session.info.pop('schema_versions', None)
 
 
 def upgrade_required():
     """Returns true if an upgrade of the database is required."""
-    session = Session()
-    try:
-        for old_schema in session.query(PluginSchema).all():
-            if old_schema.plugin in plugin_schemas and old_schema.version < plugin_schemas[old_schema.plugin]['version']:
-                return True
-        return False
-    finally:
-        session.close()
+    versions = get_versions()
+    for plugin, info in plugin_schemas.iteritems():
+        if plugin in versions and versions[plugin] < info['version']:
+            return True
+    return False
 
 
 class UpgradeImpossible(Exception):
@@ -112,12 +152,16 @@ def upgrade(plugin):
         @event('manager.upgrade')
         def upgrade_wrapper(manager):
             ver = get_version(plugin)
+            if ver is not None and ver == plugin_schemas.get(plugin, {}).get('version'):
+                # Schema is current, nothing to do
+                return
             session = Session()
             try:
                 new_ver = func(ver, session)
                 if new_ver > ver:
                     log.info('Plugin `%s` schema upgraded successfully' % plugin)
-                    set_version(plugin, new_ver)
+                    # Upgrade and version change are committed in the same transaction
+                    set_version(plugin, new_ver, session=session)
                     session.commit()
                     manager.db_upgraded = True
                 elif new_ver < ver:
@@ -154,6 +198,7 @@ def reset_schema(plugin, session=None):
         table.drop()
     # Remove the plugin from schema table
     session.query(PluginSchema).filter(PluginSchema.plugin == plugin).delete()
+    session.info.setdefault('schema_versions', {})[plugin] = None
     # Create new empty tables
     Base.metadata.create_all(bind=session.bind)
     session.commit()
@@ -208,11 +253,18 @@ def after_table_create(event, target, bind, tables=None, **kw):
     if tables:
         # TODO: Detect if any database upgrading is needed and acquire the lock only in one place
         with manager.acquire_lock(event=False):
-            tables = [table.name for table in tables]
-            for plugin, info in plugin_schemas.iteritems():
-                # Only set the version if all tables for a given plugin are being created
-                if all(table in tables for table in info['tables']):
-                    set_version(plugin, info['version'])
+            tables = set(table.name for table in tables)
+            # Load the stored versions before this session starts writing
+            get_versions()
+            session = Session()
+            try:
+                for plugin, info in plugin_schemas.iteritems():
+                    # Only set the version if all tables for a given plugin are being created
+                    if tables.issuperset(info['tables']):
+                        set_version(plugin, info['version'], session=session)
+                session.commit()
+            finally:
+                session.close()
 
 # Register a listener to call our method after tables are created
 Base.metadata.append_ddl_listener('after-create', after_table_create)
@@ -3,11 +3,13 @@ import atexit
 import codecs
 from contextlib import contextmanager
 import signal
+import socket
 import os
 import sys
 import shutil
 import logging
 import threading
+import time
 import pkg_resources
 import yaml
 from datetime import datetime, timedelta
@@ -22,16 +24,54 @@ from sqlalchemy.exc import OperationalError
 Base = declarative_base()
 Session = sessionmaker()
 
-from flexget import config_schema, db_schema
-from flexget.event import fire_event
+from flexget import config_schema, db_schema, logger
+from flexget.event import fire_event, event, get_events
 from flexget.ipc import IPCServer, IPCClient
 from flexget.scheduler import Scheduler
-from flexget.utils.tools import pid_exists
+from flexget.utils.tools import pid_exists, parse_timedelta, config_fingerprint
 
 log = logging.getLogger('manager')
 
 manager = None
 DB_CLEANUP_INTERVAL = timedelta(days=7)
+# Default maximum amount of rows removed per transaction by cleanup handlers
+DB_CLEANUP_BATCH_SIZE = 1000
+
+# SQLite pragmas which can be set from the database config section, applied to each new connection
+DB_PRAGMAS = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout']
+# Settings used by the `tuned` database profile. Allows the webui, ipc server and scheduler to read while tasks write.
+TUNED_DB_SETTINGS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    # Negative values are in KiB instead of pages
+    'cache_size': -16000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+    'busy_timeout': '30 seconds'
+}
+
+database_config_schema = {
+    'type': 'object',
+    'properties': {
+        'profile': {'type': 'string', 'enum': ['default', 'tuned'], 'default': 'default'},
+        'journal_mode': {'type': 'string', 'enum': ['delete', 'truncate', 'persist', 'memory', 'wal']},
+        'synchronous': {'type': 'string', 'enum': ['off', 'normal', 'full']},
+        'cache_size': {'type': 'integer'},
+        'mmap_size': {'type': 'integer', 'minimum': 0},
+        'temp_store': {'type': 'string', 'enum': ['default', 'file', 'memory']},
+        'busy_timeout': {'type': 'string', 'format': 'interval'},
+        'cleanup': {
+            'type': 'object',
+            'properties': {
+                'batch_size': {'type': 'integer', 'minimum': 1},
+                # Hours of the day during which scheduled cleanups are allowed to run
+                'hours': {'type': 'array', 'items': {'type': 'integer', 'minimum': 0, 'maximum': 23}}
+            },
+            'additionalProperties': False
+        }
+    },
+    'additionalProperties': False
+}
 
 
 @sqlalchemy.event.listens_for(Session, 'before_commit')
@@ -40,6 +80,121 @@ def before_commit(session):
         log.debug('BUG?: Database writes should not be tried when there is no database lock.')
 
 
+def find_config_file(options_config):
+    """
+    Looks for the configuration file from the standard locations.
+
+    :param options_config: Config file name or path given on the command line
+    :returns: Tuple of the config file path, or None if it was not found, and the list of directories searched
+    """
+    if os.path.isabs(options_config):
+        # explicit path given, don't try anything
+        return (options_config if os.path.exists(options_config) else None), [options_config]
+    log.debug('Figuring out config load paths')
+    possible = []
+    try:
+        possible.append(os.getcwdu())
+    except OSError:
+        log.debug('current directory invalid, not searching for config there')
+    # for virtualenv / dev sandbox
+    if hasattr(sys, 'real_prefix'):
+        log.debug('Adding virtualenv path')
+        possible.append(sys.prefix.decode(sys.getfilesystemencoding()))
+    # normal lookup locations
+    possible.append(os.path.join(os.path.expanduser('~'), '.flexget'))
+    if sys.platform.startswith('win'):
+        # On windows look in ~/flexget as well, as explorer does not let you create a folder starting with a dot
+        possible.append(os.path.join(os.path.expanduser('~'), 'flexget'))
+    else:
+        # The freedesktop.org standard config location
+        xdg_config = os.environ.get('XDG_CONFIG_HOME', os.path.join(os.path.expanduser('~'), '.config'))
+        possible.append(os.path.join(xdg_config, 'flexget'))
+
+    for path in possible:
+        config = os.path.join(path, options_config)
+        if os.path.exists(config):
+            log.debug('Found config: %s' % config)
+            return config, possible
+    return None, possible
+
+
+def read_lock(lockfile):
+    """
+    Read the values from a lock file.
+
+    :returns: Dict of values in the lock file, or None if there is no current lock file.
+    """
+    if lockfile and os.path.exists(lockfile):
+        result = {}
+        with open(lockfile) as f:
+            lines = [l for l in f.readlines() if l]
+        for line in lines:
+            try:
+                key, value = line.split(b':', 1)
+            except ValueError:
+                log.debug('Invalid line in lock file: %s' % line)
+                continue
+            result[key.strip().lower()] = value.strip()
+        for key in result:
+            if result[key].isdigit():
+                result[key] = int(result[key])
+        result.setdefault('pid', None)
+        if not result['pid']:
+            log.error('Invalid lock file. Make sure FlexGet is not running, then delete it.')
+        elif not pid_exists(result['pid']):
+            return None
+        return result
+    return None
+
+
+def start_logging(options, config_base):
+    """
+    Starts logging to the log file given in `options`.
+
+    :param options: argparse parsed options object
+    :param config_base: Directory of the config file, relative log file paths are in it
+    """
+    log_file = os.path.expanduser(options.logfile)
+    if not os.path.isabs(log_file):
+        log_file = os.path.join(config_base, log_file)
+    logger.start(log_file, logging.getLevelName(options.loglevel.upper()))
+
+
+def forward_to_daemon(options):
+    """
+    Sends an execute command to a running daemon for the selected config, if there is one. Only the lock file is read,
+    the config and database are not loaded, so this is cheap to try before creating a :class:`Manager`.
+
+    :param options: argparse parsed options object
+    :returns: True if the command was handled by a daemon
+    """
+    if options.cli_command != 'execute':
+        return False
+    config, possible = find_config_file(os.path.expanduser(options.config))
+    if not config:
+        return False
+    config_base = os.path.normpath(os.path.dirname(config))
+    config_name = os.path.splitext(os.path.basename(config))[0]
+    # Test mode uses its own database and lock file
+    lock_name = '.test-%s-lock' if options.test else '.%s-lock'
+    ipc_info = read_lock(os.path.join(config_base, lock_name % config_name))
+    if not ipc_info or 'port' not in ipc_info:
+        return False
+    start_logging(options, config_base)
+    log.info('There is a daemon running for this config. Sending execution to running daemon.')
+    try:
+        client = IPCClient(ipc_info['port'], ipc_info['password'])
+    except ValueError as e:
+        log.error(e)
+    except socket.error as e:
+        log.debug('Unable to connect to daemon: %s' % e)
+        return False
+    else:
+        client.execute(dict(options.execute))
+        client.close()
+    return True
+
+
 class Manager(object):
 
     """Manager class for FlexGet
@@ -108,6 +263,10 @@ class Manager(object):
         self.lockfile = None
         self.database_uri = None
         self.db_upgraded = False
+        self.db_settings = {}
+        #: Config fingerprints of all tasks, computed when the config is loaded
+        self.task_fingerprints = {}
+        self.db_cleanup_batch_size = DB_CLEANUP_BATCH_SIZE
         self._has_lock = False
 
         self.config = {}
@@ -286,6 +445,9 @@ class Manager(object):
             return
         if options.daemonize:
             self.daemonize()
+        # The webui lists and configures all plugins
+        from flexget.plugin import load_lazy_plugins
+        load_lazy_plugins()
         from flexget.ui import webui
         with self.acquire_lock():
             webui.start(self)
@@ -326,50 +488,16 @@ class Manager(object):
 
         :param bool create: If a config file is not found, and create is True, one will be created in the home folder
         """
-        config = None
-        home_path = os.path.join(os.path.expanduser('~'), '.flexget')
         options_config = os.path.expanduser(self.options.config)
-
-        possible = []
-        if os.path.isabs(options_config):
-            # explicit path given, don't try anything
-            config = options_config
-            possible = [config]
-        else:
-            log.debug('Figuring out config load paths')
-            try:
-                possible.append(os.getcwdu())
-            except OSError:
-                log.debug('current directory invalid, not searching for config there')
-            # for virtualenv / dev sandbox
-            if hasattr(sys, 'real_prefix'):
-                log.debug('Adding virtualenv path')
-                possible.append(sys.prefix.decode(sys.getfilesystemencoding()))
-            # normal lookup locations
-            possible.append(home_path)
-            if sys.platform.startswith('win'):
-                # On windows look in ~/flexget as well, as explorer does not let you create a folder starting with a dot
-                home_path = os.path.join(os.path.expanduser('~'), 'flexget')
-                possible.append(home_path)
-            else:
-                # The freedesktop.org standard config location
-                xdg_config = os.environ.get('XDG_CONFIG_HOME', os.path.join(os.path.expanduser('~'), '.config'))
-                possible.append(os.path.join(xdg_config, 'flexget'))
-
-            for path in possible:
-                config = os.path.join(path, options_config)
-                if os.path.exists(config):
-                    log.debug('Found config: %s' % config)
-                    break
-            else:
-                config = None
-
-        if not (config and os.path.exists(config)):
+        config, possible = find_config_file(options_config)
+        if not config:
             if not create:
                 log.info('Tried to read from: %s' % ', '.join(possible))
                 log.critical('Failed to find configuration file %s' % options_config)
                 sys.exit(1)
-            config = os.path.join(home_path, options_config)
+            # On windows use ~/flexget, as explorer does not let you create a folder starting with a dot
+            home_dir = 'flexget' if sys.platform.startswith('win') else '.flexget'
+            config = os.path.join(os.path.expanduser('~'), home_dir, options_config)
             log.info('Config file %s not found. Creating new config %s' % (options_config, config))
             with open(config, 'w') as newconfig:
                 # Write empty tasks to the config
@@ -460,6 +588,9 @@ class Manager(object):
             self.config = old_config
             raise ValueError('Config did not pass schema validation')
         log.debug('New config data loaded.')
+        self.task_fingerprints = dict((name, config_fingerprint(task_config))
+                                      for name, task_config in self.config.get('tasks', {}).iteritems())
+        self.update_db_settings()
         fire_event('manager.config_updated', self)
 
     def save_config(self):
@@ -488,11 +619,49 @@ class Manager(object):
         fire_event('manager.before_config_validate', self)
         return config_schema.process_config(self.config)
 
+    def update_db_settings(self):
+        """
+        Updates the SQLite pragmas used for database connections from the database config section. Pooled connections
+        are not closed, as running tasks may be using them, they get the new settings when they are next checked out.
+        Pragmas removed from the config keep their value on a connection until it is reopened.
+        """
+        config = self.config.get('database', {})
+        self.db_cleanup_batch_size = config.get('cleanup', {}).get('batch_size', DB_CLEANUP_BATCH_SIZE)
+        settings = dict(TUNED_DB_SETTINGS) if config.get('profile') == 'tuned' else {}
+        settings.update((key, value) for key, value in config.iteritems() if key in DB_PRAGMAS)
+        if 'busy_timeout' in settings:
+            timeout = parse_timedelta(settings['busy_timeout'])
+            settings['busy_timeout'] = int((timeout.days * 86400 + timeout.seconds) * 1000 + timeout.microseconds / 1000)
+        if not self.db_filename:
+            # In memory databases don't support these
+            settings.pop('journal_mode', None)
+            settings.pop('mmap_size', None)
+        if settings == self.db_settings:
+            return
+        log.debug('Database settings: %s' % settings)
+        self.db_settings = settings
+
+    def _set_db_pragmas(self, dbapi_connection, connection_record):
+        """Applies :attr:`db_settings` to a new SQLite connection."""
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in DB_PRAGMAS:
+                if pragma in self.db_settings:
+                    cursor.execute('PRAGMA %s = %s' % (pragma, self.db_settings[pragma]))
+        finally:
+            cursor.close()
+        connection_record.info['db_settings'] = self.db_settings
+
+    def _update_db_pragmas(self, dbapi_connection, connection_record, connection_proxy):
+        """Applies :attr:`db_settings` to a pooled SQLite connection when they have changed since it was opened."""
+        if connection_record.info.get('db_settings') != self.db_settings:
+            self._set_db_pragmas(dbapi_connection, connection_record)
+
     def init_sqlalchemy(self):
         """Initialize SQLAlchemy"""
         try:
-            if [int(part) for part in sqlalchemy.__version__.split('.')] < [0, 7, 0]:
-                print('FATAL: SQLAlchemy 0.7.0 or newer required. Please upgrade your SQLAlchemy.', file=sys.stderr)
+            if [int(part) for part in sqlalchemy.__version__.split('.')] < [0, 9, 1]:
+                print('FATAL: SQLAlchemy 0.9.1 or newer required. Please upgrade your SQLAlchemy.', file=sys.stderr)
                 sys.exit(1)
         except ValueError as e:
             log.critical('Failed to check SQLAlchemy version, you may need to upgrade it')
@@ -520,6 +689,7 @@ class Manager(object):
         # fire up the engine
         log.debug('Connecting to: %s' % self.database_uri)
         try:
+            # One connection per thread, so that nested sessions within a thread do not lock each other out
             self.engine = sqlalchemy.create_engine(self.database_uri,
                                                    echo=self.options.debug_sql,
                                                    poolclass=SingletonThreadPool,
@@ -531,7 +701,12 @@ class Manager(object):
                   'You can try installing `pysqlite`. If you have compiled python yourself, '
                   'recompile it with SQLite support.', file=sys.stderr)
             sys.exit(1)
+        if self.database_uri.startswith('sqlite'):
+            sqlalchemy.event.listen(self.engine, 'connect', self._set_db_pragmas)
+            sqlalchemy.event.listen(self.engine, 'checkout', self._update_db_pragmas)
         Session.configure(bind=self.engine)
+        # Schema versions cached from a previous database are no longer valid
+        db_schema.reset_version_cache()
         # create all tables, doesn't do anything to existing tables
         try:
             def before_table_create(event, target, bind, tables=None, **kw):
@@ -555,27 +730,7 @@ class Manager(object):
         """
         Read the values from the lock file. Returns None if there is no current lock file.
         """
-        if self.lockfile and os.path.exists(self.lockfile):
-            result = {}
-            with open(self.lockfile) as f:
-                lines = [l for l in f.readlines() if l]
-            for line in lines:
-                try:
-                    key, value = line.split(b':', 1)
-                except ValueError:
-                    log.debug('Invalid line in lock file: %s' % line)
-                    continue
-                result[key.strip().lower()] = value.strip()
-            for key in result:
-                if result[key].isdigit():
-                    result[key] = int(result[key])
-            result.setdefault('pid', None)
-            if not result['pid']:
-                log.error('Invalid lock file. Make sure FlexGet is not running, then delete it.')
-            elif not pid_exists(result['pid']):
-                return None
-            return result
-        return None
+        return read_lock(self.lockfile)
 
     def check_lock(self):
         """Returns True if there is a lock on the database."""
@@ -696,24 +851,43 @@ class Manager(object):
 
         * manager.db_cleanup
 
-          If interval was met. Gives session to do the cleanup as a parameter.
+          If interval was met. Gives session to do the cleanup as a parameter. Each handler is committed separately,
+          and may return the names of tasks whose data it removed, those tasks are marked as config changed.
 
-        :param bool force: Run the cleanup no matter whether the interval has been met.
+        :param bool force: Run the cleanup no matter whether the interval has been met, or the configured hours.
         """
         expired = self.persist.get('last_cleanup', datetime(1900, 1, 1)) < datetime.now() - DB_CLEANUP_INTERVAL
-        if force or expired:
-            log.info('Running database cleanup.')
-            session = Session()
+        if not (force or expired):
+            log.debug('Not running db cleanup, last run %s' % self.persist.get('last_cleanup'))
+            return
+        hours = self.config.get('database', {}).get('cleanup', {}).get('hours')
+        if not force and hours and datetime.now().hour not in hours:
+            log.debug('Not running db cleanup outside of configured hours %s' % hours)
+            return
+        log.info('Running database cleanup.')
+        changed_tasks = set()
+        session = Session()
+        try:
             try:
-                fire_event('manager.db_cleanup', session)
+                handlers = get_events('manager.db_cleanup')
+            except KeyError:
+                handlers = []
+            for handler in handlers:
+                started = time.time()
+                result = handler(session)
                 session.commit()
-            finally:
-                session.close()
-            # Just in case some plugin was overzealous in its cleaning, mark the config changed
-            self.config_changed()
-            self.persist['last_cleanup'] = datetime.now()
-        else:
-            log.debug('Not running db cleanup, last run %s' % self.persist.get('last_cleanup'))
+                log.debug('Cleanup handler %s.%s took %.2f seconds' %
+                          (handler.func.__module__, handler.func.__name__, time.time() - started))
+                if result:
+                    changed_tasks.update(result)
+        finally:
+            session.close()
+        if changed_tasks:
+            from flexget.task import config_changed
+            log.debug('Cleanup changed data of tasks: %s' % ', '.join(sorted(changed_tasks)))
+            for task in changed_tasks:
+                config_changed(task)
+        self.persist['last_cleanup'] = datetime.now()
 
     def shutdown(self, finish_queue=True):
         """
@@ -744,3 +918,8 @@ class Manager(object):
                 log.info('Removed test database')
         if not self.unit_test:  # don't scroll "nosetests" summary results when logging is enabled
             log.debug('Shutdown completed')
+
+
+@event('config.register')
+def register_config():
+    config_schema.register_config_key('database', database_config_schema)
@@ -5,8 +5,11 @@ from __future__ import unicode_literals, division, absolute_import
 import sys
 import os
 import re
+import json
 import logging
+import threading
 import time
+import importlib
 import pkgutil
 import warnings
 from itertools import ifilter
@@ -14,7 +17,7 @@ from itertools import ifilter
 from requests import RequestException
 
 from flexget import config_schema
-from flexget.event import add_event_handler as add_phase_handler, fire_event, remove_event_handlers
+from flexget.event import add_event_handler as add_phase_handler, fire_event, remove_event_handlers, _events
 from flexget import plugins as plugins_pkg
 
 log = logging.getLogger('plugin')
@@ -182,6 +185,18 @@ _loaded_plugins = {}
 _plugin_options = []
 _new_phase_queue = {}
 
+# Version of the plugin manifest format
+MANIFEST_VERSION = 1
+# PluginInfo keys stored in the plugin manifest
+MANIFEST_PLUGIN_KEYS = ['name', 'groups', 'builtin', 'debug', 'api_ver', 'contexts', 'category', 'schema']
+
+# Manifest entries of plugin modules which have not been imported yet
+_lazy_modules = {}
+_lazy_lock = threading.RLock()
+
+# Sorted plugin chains returned by get_phase_plugins, cleared whenever the plugin registry changes
+_phase_plugins_cache = {}
+
 
 def register_task_phase(name, before=None, after=None):
     """Adds a new task phase to the available phases."""
@@ -206,6 +221,7 @@ def register_task_phase(name, before=None, after=None):
             task_phases.insert(task_phases.index(before), phase_name)
         return True
 
+    _phase_plugins_cache.clear()
     # if can't add yet (dependencies) queue addition
     if not add_phase(name, before, after):
         _new_phase_queue[name] = [before, after]
@@ -271,12 +287,13 @@ class PluginInfo(dict):
         self.plugin_class = plugin_class
         self.instance = None
 
-        if self.name in plugins:
+        if self.name in plugins and not isinstance(plugins[self.name], PluginStub):
             PluginInfo.dupe_counter += 1
             log.critical('Error while registering plugin %s. A plugin with the same name is already registered' %
                          self.name)
         else:
             plugins[self.name] = self
+            _phase_plugins_cache.clear()
 
     def initialize(self):
         if self.instance is not None:
@@ -327,6 +344,7 @@ class PluginInfo(dict):
                 # provides backwards compatibility
                 event.plugin = self
                 self.phase_handlers[phase] = event
+                _phase_plugins_cache.clear()
 
     def __getattr__(self, attr):
         if attr in self:
@@ -334,6 +352,8 @@ class PluginInfo(dict):
         return dict.__getattribute__(self, attr)
 
     def __setattr__(self, attr, value):
+        if attr == 'phase_handlers':
+            _phase_plugins_cache.clear()
         self[attr] = value
 
     def __str__(self):
@@ -342,6 +362,37 @@ class PluginInfo(dict):
     __repr__ = __str__
 
 
+class PluginStub(PluginInfo):
+    """
+    Placeholder for a plugin registered from the plugin manifest, whose module has not been imported yet. Provides
+    the plugin info, schema and the names of its phases, but no phase handlers or instance. Replaced by the real
+    :class:`PluginInfo` when the module is imported.
+    """
+
+    def __init__(self, info, module):
+        """
+        :param dict info: Plugin info from the manifest
+        :param string module: Name of the module registering this plugin
+        """
+        dict.__init__(self)
+        self.update(info)
+        self.module = module
+        self.plugin_class = None
+        self.instance = None
+        self.phase_handlers = {}
+        if self.schema is not None:
+            config_schema.register_schema(self.schema['id'], self.schema)
+        plugins.setdefault(self.name, self)
+
+    def initialize(self):
+        pass
+
+    def __str__(self):
+        return '<PluginStub(name=%s)>' % self.name
+
+    __repr__ = __str__
+
+
 register = PluginInfo
 
 
@@ -368,59 +419,179 @@ def _get_standard_plugins_path():
     return paths
 
 
-def _load_plugins_from_dirs(dirs):
+def _manifest_path(manifest_dir=None):
     """
-    :param list dirs: Directories from where plugins are loaded from
+    :param manifest_dir: Directory the manifest is kept in, normally the config directory. Defaults to ~/.flexget
+    :returns: Path of the plugin manifest file.
     """
+    return os.path.join(manifest_dir or os.path.join(os.path.expanduser('~'), '.flexget'), '.plugin_manifest.json')
 
-    log.debug('Trying to load plugins from: %s' % dirs)
+
+def _iter_plugin_modules(dirs):
+    """
+    :param list dirs: Directories from where plugins are loaded from
+    :returns: Iterator over (module name, loader) for each plugin module in `dirs`
+    """
     # add all dirs to plugins_pkg load path so that plugins are loaded from flexget and from ~/.flexget/plugins/
     plugins_pkg.__path__ = map(_strip_trailing_sep, dirs)
     for importer, name, ispkg in pkgutil.walk_packages(dirs, plugins_pkg.__name__ + '.'):
         if ispkg:
             continue
-        # Don't load any plugins again if they are already loaded
-        # This can happen if one plugin imports from another plugin
-        if name in sys.modules:
-            continue
         loader = importer.find_module(name)
         # Don't load from pyc files
         if not loader.filename.endswith('.py'):
             continue
-        try:
-            loaded_module = loader.load_module(name)
-        except DependencyError as e:
-            if e.has_message():
-                msg = e.message
-            else:
-                msg = 'Plugin `%s` requires `%s` to load.' % (e.issued_by or name, e.missing or 'N/A')
-            if not e.silent:
-                log.warning(msg)
-            else:
-                log.debug(msg)
-        except ImportError as e:
-            log.critical('Plugin `%s` failed to import dependencies' % name)
-            log.exception(e)
-        except Exception as e:
-            log.critical('Exception while loading plugin %s' % name)
-            log.exception(e)
-            raise
+        yield name, loader
+
+
+def _import_module(name, load):
+    """
+    Imports a plugin module, logging any problems.
+
+    :param name: Name of the module
+    :param load: Function doing the actual import
+    :returns: True if the module was imported successfully
+    """
+    try:
+        loaded_module = load()
+    except DependencyError as e:
+        if e.has_message():
+            msg = e.message
+        else:
+            msg = 'Plugin `%s` requires `%s` to load.' % (e.issued_by or name, e.missing or 'N/A')
+        if not e.silent:
+            log.warning(msg)
         else:
-            log.trace('Loaded module %s from %s' % (name, loaded_module.__file__))
+            log.debug(msg)
+    except ImportError as e:
+        log.critical('Plugin `%s` failed to import dependencies' % name)
+        log.exception(e)
+    except Exception as e:
+        log.critical('Exception while loading plugin %s' % name)
+        log.exception(e)
+        raise
+    else:
+        log.trace('Loaded module %s from %s' % (name, loaded_module.__file__))
+        return True
+    return False
+
+
+def _import_side_effects():
+    """
+    :returns: Tuple counting the things plugin modules can register on import, other than plugins. Modules which
+        change these must always be imported on startup.
+    """
+    from flexget.manager import Base
+    handlers = sum(len(handlers) for name, handlers in _events.iteritems() if name != 'plugin.register')
+    return handlers, len(Base.metadata.tables), len(task_phases) + len(_new_phase_queue)
+
+
+def _load_plugins_from_dirs(dirs):
+    """
+    :param list dirs: Directories from where plugins are loaded from
+    :returns: Dict mapping module name to a manifest dict for the module, without the plugin info
+    """
+
+    log.debug('Trying to load plugins from: %s' % dirs)
+    modules = {}
+    for name, loader in _iter_plugin_modules(dirs):
+        module = modules[name] = {'path': loader.filename, 'mtime': os.path.getmtime(loader.filename), 'eager': True}
+        # Don't load any plugins again if they are already loaded
+        # This can happen if one plugin imports from another plugin
+        if name in sys.modules:
+            continue
+        before = _import_side_effects()
+        if _import_module(name, lambda: loader.load_module(name)):
+            # Modules which only register plugins can be imported lazily next time
+            module['eager'] = _import_side_effects() != before
 
     if _new_phase_queue:
         for phase, args in _new_phase_queue.iteritems():
             log.error('Plugin %s requested new phase %s, but it could not be created at requested '
                       'point (before, after). Plugin is not working properly.' % (args[0], phase))
+    return modules
 
 
-def load_plugins():
-    """Load plugins from the standard plugin paths."""
-    global plugins_loaded
+def _write_manifest(dirs, modules, path):
+    """
+    Writes the plugin manifest, describing the plugins each module registers.
 
-    start_time = time.time()
-    # Import all the plugins
-    _load_plugins_from_dirs(_get_standard_plugins_path())
+    :param list dirs: Directories plugins were loaded from
+    :param dict modules: Modules as returned by :func:`_load_plugins_from_dirs`
+    :param path: Path of the manifest file
+    """
+    for plugin in plugins.itervalues():
+        module = modules.get(plugin.plugin_class.__module__)
+        if module is None:
+            continue
+        info = dict((key, plugin[key]) for key in MANIFEST_PLUGIN_KEYS)
+        info['phases'] = list(plugin.phase_handlers)
+        # Plugins that are used without being configured by name, or that are needed to prepare the task config,
+        # must be available immediately
+        if plugin.builtin or plugin.groups or 'start' in plugin.phase_handlers or 'root' in plugin.contexts:
+            module['eager'] = True
+        module.setdefault('plugins', []).append(info)
+    manifest = {'version': MANIFEST_VERSION, 'dirs': dirs, 'modules': modules}
+    try:
+        data = json.dumps(manifest)
+    except (TypeError, ValueError) as e:
+        log.debug('Plugin manifest not written, plugin info is not serializable: %s' % e)
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+    except (IOError, OSError) as e:
+        log.debug('Unable to write plugin manifest %s: %s' % (path, e))
+    else:
+        log.debug('Wrote plugin manifest %s' % path)
+
+
+def _read_manifest(dirs, path):
+    """
+    :param list dirs: Directories plugins are loaded from
+    :param path: Path of the manifest file
+    :returns: The plugin manifest, or None if there is no manifest or it does not match the plugin modules on disk.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError) as e:
+        log.debug('Unable to read plugin manifest %s: %s' % (path, e))
+        return None
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('dirs') != dirs:
+        return None
+    modules = manifest['modules']
+    found = 0
+    for name, loader in _iter_plugin_modules(dirs):
+        module = modules.get(name)
+        if not module or module['path'] != loader.filename or module['mtime'] != os.path.getmtime(loader.filename):
+            log.debug('Plugin manifest is outdated (%s)' % name)
+            return None
+        found += 1
+    if found != len(modules):
+        log.debug('Plugin manifest is outdated, plugin modules have been removed')
+        return None
+    return manifest
+
+
+def _load_plugins_from_manifest(manifest):
+    """Imports modules marked eager in `manifest`, and registers placeholders for plugins in the other modules."""
+    for name, module in sorted(manifest['modules'].iteritems()):
+        if module['eager']:
+            if name not in sys.modules:
+                _import_module(name, lambda: importlib.import_module(name))
+            continue
+        _lazy_modules[name] = module
+        for info in module.get('plugins', []):
+            PluginStub(info, name)
+
+
+def _register_plugins():
+    """Registers plugins from newly imported modules and instantiates them."""
     # Register them
     fire_event('plugin.register')
     # Plugins should only be registered once, remove their handlers after
@@ -428,9 +599,55 @@ def load_plugins():
     # After they have all been registered, instantiate them
     for plugin in plugins.values():
         plugin.initialize()
+
+
+def load_plugins(lazy=False, manifest_dir=None):
+    """
+    Load plugins from the standard plugin paths.
+
+    :param bool lazy: If True, use the plugin manifest to avoid importing modules which are not needed yet. Plugins from
+        those modules are imported on demand, see :func:`load_lazy_plugins`.
+    :param manifest_dir: Directory to keep the plugin manifest in, normally the config directory.
+    """
+    global plugins_loaded
+
+    start_time = time.time()
+    dirs = _get_standard_plugins_path()
+    path = _manifest_path(manifest_dir)
+    manifest = lazy and _read_manifest(dirs, path)
+    if manifest:
+        _load_plugins_from_manifest(manifest)
+        _register_plugins()
+    else:
+        # Import all the plugins
+        modules = _load_plugins_from_dirs(dirs)
+        _register_plugins()
+        if lazy:
+            _write_manifest(dirs, modules, path)
     took = time.time() - start_time
     plugins_loaded = True
-    log.debug('Plugins took %.2f seconds to load' % took)
+    log.debug('Plugins took %.2f seconds to load (%s modules not imported)' % (took, len(_lazy_modules)))
+
+
+def load_lazy_plugins(names=None):
+    """
+    Imports the modules of plugins that were registered from the plugin manifest but not imported yet.
+
+    :param names: Names of the plugins to load. If None, all plugins are loaded.
+    :returns: List of plugin names which could not be loaded.
+    """
+    if names is None:
+        names = list(plugins)
+    with _lazy_lock:
+        modules = set(plugins[name].module for name in names
+                      if isinstance(plugins.get(name), PluginStub) and plugins[name].module in _lazy_modules)
+        if modules:
+            for module in modules:
+                del _lazy_modules[module]
+                log.debug('Importing plugin module %s on demand' % module)
+                _import_module(module, lambda: importlib.import_module(module))
+            _register_plugins()
+    return [name for name in names if isinstance(plugins.get(name), PluginStub)]
 
 
 def get_plugins(phase=None, group=None, context=None, category=None, min_api=None):
@@ -449,7 +666,9 @@ def get_plugins(phase=None, group=None, context=None, category=None, min_api=Non
         if phase is not None and phase not in phase_methods:
             raise ValueError('Unknown phase %s' % phase)
         if phase and not phase in plugin.phase_handlers:
-            return False
+            # Plugins not imported yet only know their phases from the manifest
+            if not isinstance(plugin, PluginStub) or phase not in plugin.phases:
+                return False
         if group and not group in plugin.groups:
             return False
         if context and not context in plugin.contexts:
@@ -462,6 +681,28 @@ def get_plugins(phase=None, group=None, context=None, category=None, min_api=Non
     return ifilter(matches, plugins.itervalues())
 
 
+def clear_phase_cache():
+    """Must be called after changing the priority of phase handlers, so that plugins are sorted again."""
+    _phase_plugins_cache.clear()
+
+
+def get_phase_plugins(phase):
+    """
+    Get all plugins handling `phase`, sorted in phase order. The result is cached until the plugin registry changes.
+    Plugins which have not been imported yet are not included, see :func:`load_lazy_plugins`.
+
+    :param string phase: Name of the phase
+    :return: Tuple of PluginInfo instances.
+    :rtype: tuple
+    """
+    chain = _phase_plugins_cache.get(phase)
+    if chain is None:
+        chain = tuple(sorted((p for p in get_plugins(phase=phase) if not isinstance(p, PluginStub)),
+                             key=lambda p: p.phase_handlers[phase], reverse=True))
+        _phase_plugins_cache[phase] = chain
+    return chain
+
+
 def plugin_schemas(**kwargs):
     """Create a dict schema that matches plugins specified by `kwargs`"""
     return {'type': 'object',
@@ -510,6 +751,8 @@ def get_plugin_keywords():
 
 def get_plugin_by_name(name, issued_by='???'):
     """Get plugin by name, preferred way since this structure may be changed at some point."""
-    if not name in plugins:
+    if isinstance(plugins.get(name), PluginStub):
+        load_lazy_plugins([name])
+    if not name in plugins or isinstance(plugins[name], PluginStub):
         raise DependencyError(issued_by=issued_by, missing=name, message='Unknown plugin %s' % name)
     return plugins[name]
@@ -5,10 +5,12 @@ import os
 import posixpath
 from datetime import datetime, timedelta
 import random
+import zipfile
+from cStringIO import StringIO
 
 import xml.etree.ElementTree as ElementTree
 
-from sqlalchemy import Column, Integer, Float, String, Unicode, Boolean, DateTime, func
+from sqlalchemy import Column, Integer, Float, String, Unicode, Boolean, DateTime, Index, func
 from sqlalchemy.schema import ForeignKey
 from sqlalchemy.orm import relation
 from requests import RequestException
@@ -17,11 +19,11 @@ from flexget import db_schema
 from flexget.utils.tools import decode_html
 from flexget.utils.requests import Session as ReqSession
 from flexget.utils.database import with_session, pipe_list_synonym, text_date_synonym
-from flexget.utils.sqlalchemy_utils import table_add_column
+from flexget.utils.sqlalchemy_utils import table_add_column, create_index
 from flexget.manager import Session
 from flexget.utils.simple_persistence import SimplePersistence
 
-SCHEMA_VER = 3
+SCHEMA_VER = 4
 
 log = logging.getLogger('api_tvdb')
 Base = db_schema.versioned_base('api_tvdb', SCHEMA_VER)
@@ -33,6 +35,8 @@ language = 'en'
 server = 'http://www.thetvdb.com/api/'
 _mirrors = {}
 persist = SimplePersistence('api_tvdb')
+# Maximum amount of ids used in one IN query, sqlite can't handle more than 1000
+CHUNK_SIZE = 900
 
 
 @db_schema.upgrade('api_tvdb')
@@ -50,6 +54,11 @@ def upgrade(ver, session):
     if ver == 2:
         table_add_column('tvdb_series', 'overview', Unicode, session)
         ver = 3
+    if ver == 3:
+        table_add_column('tvdb_series', 'mirrored', Boolean, session)
+        create_index('tvdb_episodes', session, 'series_id', 'seasonnumber', 'episodenumber')
+        create_index('tvdb_episodes', session, 'series_id', 'firstaired')
+        ver = 4
 
     return ver
 
@@ -117,6 +126,8 @@ class TVDBSeries(TVDBContainer, Base):
     id = Column(Integer, primary_key=True, autoincrement=False)
     lastupdated = Column(Integer)
     expired = Column(Boolean)
+    # True when all episodes of the series have been loaded from a full series dump
+    mirrored = Column(Boolean)
     seriesname = Column(Unicode)
     language = Column(Unicode)
     rating = Column(Float)
@@ -230,6 +241,11 @@ class TVDBEpisode(TVDBContainer, Base):
                (self.series.seriesname, self.seasonnumber, self.episodenumber)
 
 
+Index('ix_tvdb_episodes_series_id_seasonnumber_episodenumber',
+      TVDBEpisode.series_id, TVDBEpisode.seasonnumber, TVDBEpisode.episodenumber)
+Index('ix_tvdb_episodes_series_id_firstaired', TVDBEpisode.series_id, TVDBEpisode._firstaired)
+
+
 class TVDBSearchResult(Base):
 
     __tablename__ = 'tvdb_search_results'
@@ -240,6 +256,157 @@ class TVDBSearchResult(Base):
     series = relation(TVDBSeries, backref='search_strings')
 
 
+def chunked(seq, size=CHUNK_SIZE):
+    """Helper to divide lists into sizes sqlite can handle in a query."""
+    for i in xrange(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def is_full_record(elem):
+    """Update files may only list the id and time of a changed record, full records contain the actual data."""
+    return any(child.tag not in ('id', 'time', 'Series') for child in elem)
+
+
+def _upsert_series(session, elems, known_only):
+    """Inserts or updates series from their xml records, with one query per chunk. Returns amount stored."""
+    count = 0
+    for chunk in chunked(elems):
+        ids = [int(elem.find('id').text) for elem in chunk]
+        existing = dict((series.id, series) for series in
+                        session.query(TVDBSeries).filter(TVDBSeries.id.in_(ids)))
+        for series_id, elem in zip(ids, chunk):
+            series = existing.get(series_id)
+            if series:
+                series.update_from_xml(elem)
+            elif not known_only:
+                session.add(TVDBSeries(elem))
+            else:
+                continue
+            count += 1
+    return count
+
+
+def _upsert_episodes(session, elems, known_only):
+    """Inserts or updates episodes from their xml records, with one query per chunk. Returns amount stored."""
+    count = 0
+    for chunk in chunked(elems):
+        ids = [int(elem.find('id').text) for elem in chunk]
+        series_ids = [int(elem.find('seriesid').text) for elem in chunk]
+        existing = dict((episode.id, episode) for episode in
+                        session.query(TVDBEpisode).filter(TVDBEpisode.id.in_(ids)))
+        if known_only:
+            # New episodes are only added for series which are mirrored locally
+            known_series = set(series_id for (series_id,) in session.query(TVDBSeries.id).
+                               filter(TVDBSeries.id.in_(set(series_ids))).filter(TVDBSeries.mirrored == True))
+        for episode_id, series_id, elem in zip(ids, series_ids, chunk):
+            episode = existing.get(episode_id)
+            if episode:
+                episode.update_from_xml(elem)
+            elif not known_only or series_id in known_series:
+                episode = TVDBEpisode(elem)
+                episode.series_id = series_id
+                session.add(episode)
+            else:
+                continue
+            count += 1
+    return count
+
+
+def ingest_xml(source, session, known_only=False):
+    """
+    Streams the Series and Episode records of a TheTVDB xml file into the database in bulk. Records only containing
+    an id, as found in some update files, are marked expired instead.
+
+    :param source: File name or file-like object with the xml
+    :param session: Session used to store the records, caller is responsible for commit
+    :param bool known_only: Only update series already in the database, and add episodes only to mirrored series.
+    :return: Tuple with the amount of series and episodes stored
+    """
+    pending = {'Series': [], 'Episode': []}
+    expired = {'Series': [], 'Episode': []}
+    stored = {'Series': 0, 'Episode': 0}
+
+    def flush(tag):
+        # Series must be stored before their episodes
+        if tag == 'Episode' and pending['Series']:
+            flush('Series')
+        upsert = _upsert_series if tag == 'Series' else _upsert_episodes
+        stored[tag] += upsert(session, pending[tag], known_only)
+        for elem in pending[tag]:
+            elem.clear()
+        pending[tag] = []
+
+    for event, elem in ElementTree.iterparse(source):
+        if elem.tag not in pending:
+            if elem.tag == 'Banner':
+                elem.clear()
+            continue
+        if elem.find('id') is None:
+            # Episode records nest a Series element with only the series id in some update files
+            continue
+        if is_full_record(elem):
+            pending[elem.tag].append(elem)
+            if len(pending[elem.tag]) >= CHUNK_SIZE:
+                flush(elem.tag)
+        else:
+            expired[elem.tag].append(int(elem.find('id').text))
+            elem.clear()
+    for tag in ('Series', 'Episode'):
+        flush(tag)
+
+    # Update our cache to mark the items that have expired
+    for chunk in chunked(expired['Series']):
+        num = session.query(TVDBSeries).filter(TVDBSeries.id.in_(chunk)).update({'expired': True}, 'fetch')
+        log.debug('%s series marked as expired' % num)
+    for chunk in chunked(expired['Episode']):
+        num = session.query(TVDBEpisode).filter(TVDBEpisode.id.in_(chunk)).update({'expired': True}, 'fetch')
+        log.debug('%s episodes marked as expired' % num)
+    return stored['Series'], stored['Episode']
+
+
+def get_root_attrib(source):
+    """Returns the attributes of the root element of xml in `source`, without parsing the rest of it."""
+    for event, elem in ElementTree.iterparse(source, events=('start',)):
+        return elem.attrib
+    return {}
+
+
+def download_zip(url, name):
+    """
+    Downloads zip file from `url` and checks that it contains `name`.
+
+    :return: The :class:`zipfile.ZipFile`
+    """
+    try:
+        content = requests.get(url).content
+    except RequestException as e:
+        raise LookupError('Request failed %s' % url)
+    try:
+        archive = zipfile.ZipFile(StringIO(content))
+        archive.getinfo(name)
+    except (zipfile.BadZipfile, KeyError) as e:
+        raise LookupError('Invalid zip file from thetvdb %s: %s' % (url, e))
+    return archive
+
+
+def mirror_series(tvdb_id, session):
+    """
+    Loads a series with all its episodes from TheTVDB full series dump.
+
+    :return: The mirrored :class:`TVDBSeries`
+    """
+    url = get_mirror('zip') + api_key + '/series/%s/all/%s.zip' % (tvdb_id, language)
+    log.debug('Mirroring series %s from %s' % (tvdb_id, url))
+    archive = download_zip(url, '%s.xml' % language)
+    series_count, episode_count = ingest_xml(archive.open('%s.xml' % language), session)
+    series = session.query(TVDBSeries).filter(TVDBSeries.id == tvdb_id).first()
+    if not series:
+        raise LookupError('Could not retrieve information from thetvdb')
+    series.mirrored = True
+    log.debug('Mirrored %s with %s episodes' % (series.seriesname, episode_count))
+    return series
+
+
 def find_series_id(name):
     """Looks up the tvdb id for a series"""
     url = server + 'GetSeries.php?seriesname=%s&language=%s' % (urllib.quote(name), language)
@@ -272,7 +439,11 @@ def find_series_id(name):
 
 
 @with_session
-def lookup_series(name=None, tvdb_id=None, only_cached=False, session=None):
+def lookup_series(name=None, tvdb_id=None, only_cached=False, mirror=False, session=None):
+    """
+    :param bool mirror: Load the series with all its episodes from the full series dump, so that episode lookups can
+        be answered locally. Updates are then also applied in bulk from the update files.
+    """
     if not name and not tvdb_id:
         raise LookupError('No criteria specified for tvdb lookup')
 
@@ -295,8 +466,14 @@ def lookup_series(name=None, tvdb_id=None, only_cached=False, session=None):
     if series:
         # Series found in cache, update if cache has expired.
         if not only_cached:
-            mark_expired(session=session)
-        if series.expired and not only_cached:
+            mark_expired(mirror=mirror, session=session)
+        if mirror and not series.mirrored and not only_cached:
+            log.verbose('Mirroring all data for %s from tvdb' % series.seriesname)
+            try:
+                series = mirror_series(series.id, session)
+            except LookupError as e:
+                log.warning('Error while mirroring from tvdb (%s), using cached data.' % e.args[0])
+        elif series.expired and not only_cached:
             log.verbose('Data for %s has expired, refreshing from tvdb' % series.seriesname)
             try:
                 series.update()
@@ -310,16 +487,21 @@ def lookup_series(name=None, tvdb_id=None, only_cached=False, session=None):
         # There was no series found in the cache, do a lookup from tvdb
         log.debug('Series %s not found in cache, looking up from tvdb.' % id_str())
         if tvdb_id:
-            series = TVDBSeries()
-            series.id = tvdb_id
-            series.update()
-            if series.seriesname:
-                session.add(series)
+            if mirror:
+                series = mirror_series(tvdb_id, session)
+            else:
+                series = TVDBSeries()
+                series.id = tvdb_id
+                series.update()
+                if series.seriesname:
+                    session.add(series)
         elif name:
             tvdb_id = find_series_id(name)
             if tvdb_id:
                 series = session.query(TVDBSeries).filter(TVDBSeries.id == tvdb_id).first()
-                if not series:
+                if mirror and (not series or not series.mirrored):
+                    series = mirror_series(tvdb_id, session)
+                elif not series:
                     series = TVDBSeries()
                     series.id = tvdb_id
                     series.update()
@@ -337,9 +519,9 @@ def lookup_series(name=None, tvdb_id=None, only_cached=False, session=None):
 
 @with_session
 def lookup_episode(name=None, seasonnum=None, episodenum=None, absolutenum=None, airdate=None,
-                   tvdb_id=None, only_cached=False, session=None):
+                   tvdb_id=None, only_cached=False, mirror=False, session=None):
     # First make sure we have the series data
-    series = lookup_series(name=name, tvdb_id=tvdb_id, only_cached=only_cached, session=session)
+    series = lookup_series(name=name, tvdb_id=tvdb_id, only_cached=only_cached, mirror=mirror, session=session)
     if not series:
         raise LookupError('Could not identify series')
     # Set variables depending on what type of identifier we are looking up
@@ -404,8 +586,13 @@ def lookup_episode(name=None, seasonnum=None, episodenum=None, absolutenum=None,
 
 
 @with_session
-def mark_expired(session=None):
-    """Marks series and episodes that have expired since we cached them"""
+def mark_expired(mirror=False, session=None):
+    """
+    Marks series and episodes that have expired since we cached them.
+
+    :param bool mirror: Use the update files with full records, and store the changes in bulk instead of only marking
+        the records expired.
+    """
     # Only get the expired list every hour
     last_server = persist.get('last_server')
     last_local = persist.get('last_local')
@@ -433,48 +620,35 @@ def mark_expired(session=None):
     elif last_update_days > 7:
         get_update = 'month'
 
+    # Get items that have changed since our last update
+    log.debug("Getting %s worth of updates from thetvdb" % get_update)
     try:
-        # Get items that have changed since our last update
-        log.debug("Getting %s worth of updates from thetvdb" % get_update)
-        content = requests.get(server + api_key + '/updates/updates_%s.xml' % get_update).content
-        if not isinstance(content, basestring):
-            raise Exception('expected string, got %s' % type(content))
-        updates = ElementTree.fromstring(content)
-    except RequestException as e:
+        if mirror:
+            # Zipped update files contain the full records of the changed items
+            name = 'updates_%s.xml' % get_update
+            archive = download_zip(get_mirror('zip') + api_key + '/updates/updates_%s.zip' % get_update, name)
+            open_source = lambda: archive.open(name)
+        else:
+            content = requests.get(server + api_key + '/updates/updates_%s.xml' % get_update).content
+            open_source = lambda: StringIO(content)
+    except (RequestException, LookupError) as e:
         log.error('Could not get update information from tvdb: %s' % e)
         return
 
-    if updates is not None:
-        new_server = int(updates.attrib['time'])
-
-        if new_server < last_server:
-            #nothing changed on the server, ignoring
-            log.debug("Not checking for expired as nothing has changed on server")
-            return
-
-        # Make lists of expired series and episode ids
-        expired_series = []
-        expired_episodes = []
-
-        for series in updates.findall('Series'):
-            expired_series.append(int(series.find("id").text))
-
-        for episode in updates.findall('Episode'):
-            expired_series.append(int(episode.find("id").text))
+    try:
+        new_server = int(get_root_attrib(open_source())['time'])
+    except (SyntaxError, KeyError, ValueError) as e:
+        log.error('Could not parse update information from tvdb: %s' % e)
+        return
 
-        def chunked(seq):
-            """Helper to divide our expired lists into sizes sqlite can handle in a query. (<1000)"""
-            for i in xrange(0, len(seq), 900):
-                yield seq[i:i + 900]
+    if new_server < last_server:
+        #nothing changed on the server, ignoring
+        log.debug("Not checking for expired as nothing has changed on server")
+        return
 
-        # Update our cache to mark the items that have expired
-        for chunk in chunked(expired_series):
-            num = session.query(TVDBSeries).filter(TVDBSeries.id.in_(chunk)).update({'expired': True}, 'fetch')
-            log.debug('%s series marked as expired' % num)
-        for chunk in chunked(expired_episodes):
-            num = session.query(TVDBEpisode).filter(TVDBEpisode.id.in_(chunk)).update({'expired': True}, 'fetch')
-            log.debug('%s episodes marked as expired' % num)
+    series_count, episode_count = ingest_xml(open_source(), session, known_only=True)
+    log.debug('Updated %s series and %s episodes from tvdb update file' % (series_count, episode_count))
 
-        # Save the time of this update
-        persist['last_local'] = datetime.now()
-        persist['last_server'] = new_server
+    # Save the time of this update
+    persist['last_local'] = datetime.now()
+    persist['last_server'] = new_server
@@ -10,7 +10,7 @@ import tvrage.api
 import tvrage.feeds
 
 from flexget.event import event
-from flexget.utils.database import with_session
+from flexget.utils.database import with_session, batched_delete
 from flexget import db_schema
 from flexget.utils.database import pipe_list_synonym
 from flexget.utils.sqlalchemy_utils import table_schema
@@ -29,9 +29,11 @@ tvrage.feeds.BASE_URL = 'http://services.tvrage.com/feeds/%s.php?%s=%s'
 @event('manager.db_cleanup')
 def db_cleanup(session):
     value = datetime.datetime.now() - parse_timedelta('30 days')
-    for de in session.query(TVRageSeries).filter(TVRageSeries.last_update <= value).all():
-        log.debug('deleting %s' % de)
-        session.delete(de)
+    # Episodes are removed through the relationship cascade
+    result = batched_delete(session, session.query(TVRageSeries).filter(TVRageSeries.last_update <= value),
+                            orm_delete=True)
+    if result:
+        log.verbose('Removed %d outdated series from tvrage cache.' % result)
 
 
 @db_schema.upgrade('tvrage')
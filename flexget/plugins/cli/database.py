@@ -3,7 +3,7 @@ from __future__ import unicode_literals, division, absolute_import
 from flexget import options
 from flexget.db_schema import reset_schema, plugin_schemas
 from flexget.event import event
-from flexget.manager import Base, Session
+from flexget.manager import Base, Session, DB_PRAGMAS
 from flexget.utils.tools import console
 
 
@@ -17,6 +17,8 @@ def do_cli(manager, options):
             reset(manager)
         elif options.db_action == 'reset-plugin':
             reset_plugin(options)
+        elif options.db_action == 'tune':
+            tune(manager)
 
 
 def cleanup(manager):
@@ -35,6 +37,24 @@ def vacuum():
     console('VACUUM complete.')
 
 
+def tune(manager):
+    console('Database: %s' % manager.database_uri)
+    console('Connection pool: %s' % manager.engine.pool.__class__.__name__)
+    if not manager.database_uri.startswith('sqlite'):
+        return
+    console('%-20s %-15s %s' % ('Pragma', 'Effective', 'Configured'))
+    console('-' * 79)
+    session = Session()
+    try:
+        for pragma in DB_PRAGMAS:
+            result = session.execute('PRAGMA %s' % pragma)
+            # Pragmas not supported by the database return nothing
+            value = result.scalar() if result.returns_rows else 'n/a'
+            console('%-20s %-15s %s' % (pragma, value, manager.db_settings.get(pragma, '')))
+    finally:
+        session.close()
+
+
 def reset(manager):
     Base.metadata.drop_all(bind=manager.engine)
     Base.metadata.create_all(bind=manager.engine)
@@ -73,6 +93,7 @@ def register_parser_arguments():
     subparsers = parser.add_subparsers(title='Actions', metavar='<action>', dest='db_action')
     subparsers.add_parser('cleanup', help='make all plugins clean un-needed data from the database')
     subparsers.add_parser('vacuum', help='running vacuum can increase performance and decrease database size')
+    subparsers.add_parser('tune', help='show the effective database settings')
     reset_parser = subparsers.add_parser('reset', add_help=False, help='reset the entire database (DANGEROUS!)')
     reset_parser.add_argument('--sure', action='store_true', required=True,
                               help='you must use this flag to indicate you REALLY want to do this')
@@ -1,20 +1,58 @@
 from __future__ import unicode_literals, division, absolute_import
+import gc
 import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-from flexget import options
+import sqlalchemy
+
+import flexget
+from flexget import db_schema, options, plugin
+from flexget.entry import Entry
 from flexget.event import event
 from flexget.manager import Session
+from flexget.task import Task, TaskAbort
+from flexget.utils import json
 from flexget.utils.tools import console
 
+try:
+    import resource
+except ImportError:
+    # Not available on windows
+    resource = None
+
 log = logging.getLogger('perftests')
 
-TESTS = ['imdb_query']
+TESTS = ['imdb_query', 'benchmark']
+
+# Benchmark scenarios, see `scenario_config`
+SCENARIOS = ['series', 'seen', 'regexp', 'template', 'backlog', 'full']
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+WORDS = ['alpha', 'bravo', 'castle', 'dark', 'eagle', 'falcon', 'ghost', 'harbor', 'island', 'jungle', 'king',
+         'legend', 'mountain', 'night', 'ocean', 'planet', 'queen', 'river', 'shadow', 'tiger', 'union', 'valley',
+         'winter', 'xenon', 'yellow', 'zero', 'empire', 'house', 'street', 'family', 'doctor', 'lost', 'game',
+         'city', 'secret', 'world', 'black', 'silver', 'storm', 'fire']
+EPISODE_QUALITIES = ['HDTV x264', '720p HDTV x264', '1080p WEB-DL DD5.1 H.264', '480p WEB-DL x264', 'HDTV XviD']
+MOVIE_QUALITIES = ['1080p BluRay x264', '720p BRRip x264', 'DVDRip XviD', 'CAM XviD', 'TS x264']
+GROUPS = ['LOL', 'DIMENSION', 'KILLERS', 'FQM', 'SPARKS', 'AMIABLE', 'NTb']
 
 
 def cli_perf_test(manager, options):
     if options.test_name not in TESTS:
         console('Unknown performance test %s' % options.test_name)
         return
+    if options.test_name == 'benchmark':
+        with manager.acquire_lock():
+            benchmark(manager, options)
+        return
     session = Session()
     try:
         if options.test_name == 'imdb_query':
@@ -23,6 +61,240 @@ def cli_perf_test(manager, options):
         session.close()
 
 
+def generate(amount, seed=0):
+    """
+    Generates synthetic feed contents, same *seed* always gives the same contents.
+
+    :return: Tuple of list of entry dicts and list of series names used in them
+    """
+    rand = random.Random(seed)
+    shows = set()
+    while len(shows) < max(10, amount // 100):
+        shows.add(' '.join(rand.sample(WORDS, rand.randint(1, 3))).title())
+    shows = sorted(shows)
+    entries = []
+    for i in xrange(amount):
+        if rand.random() < 0.6:
+            title = '%s S%02dE%02d %s-%s' % (rand.choice(shows), rand.randint(1, 3), rand.randint(1, 12),
+                                             rand.choice(EPISODE_QUALITIES), rand.choice(GROUPS))
+        else:
+            title = '%s %s %s-%s' % (' '.join(rand.sample(WORDS, rand.randint(1, 4))).title(),
+                                     rand.randint(1980, 2014), rand.choice(MOVIE_QUALITIES), rand.choice(GROUPS))
+        entries.append({'title': title,
+                        'url': 'http://localhost/perf/%s/%s.torrent' % (i, title.replace(' ', '.')),
+                        'description': ' '.join(rand.choice(WORDS) for _ in xrange(30))})
+    return entries, shows
+
+
+def seed_database(entries, shows):
+    """Fills seen, series, archive and backlog tables with history matching the generated *entries*."""
+    from flexget.plugins.filter.seen import SeenEntry, SeenField
+    from flexget.plugins.filter.series import Series, SeriesTask, Episode, Release, normalize_series_name
+    from flexget.plugins.generic.archive import (ArchiveEntry, ArchiveTag, ArchiveSource, archive_tags_table,
+                                                 archive_sources_table)
+    from flexget.plugins.input.backlog import BacklogEntry
+
+    now = datetime.now()
+    session = Session()
+    try:
+        # Every other entry has been seen before, along with as many releases no longer in the feed
+        seen = entries[::2] + [{'title': 'Old Release %s' % i, 'url': 'http://localhost/perf/old/%s' % i}
+                               for i in xrange(len(entries) // 2)]
+        session.execute(SeenEntry.__table__.insert(), [
+            {'id': i + 1, 'title': item['title'], 'reason': 'perf', 'feed': 'perf', 'added': now, 'local': False}
+            for i, item in enumerate(seen)])
+        session.execute(SeenField.__table__.insert(), [
+            {'seen_entry_id': i + 1, 'field': field, 'value': item[field], 'added': now}
+            for i, item in enumerate(seen) for field in ('title', 'url')])
+
+        # First five episodes of each series have been downloaded
+        session.execute(Series.__table__.insert(), [
+            {'id': i + 1, 'name': name, 'name_lower': normalize_series_name(name), 'identified_by': 'ep'}
+            for i, name in enumerate(shows)])
+        session.execute(SeriesTask.__table__.insert(), [
+            {'series_id': i + 1, 'name': 'perf_%s' % task} for i in xrange(len(shows)) for task in ('series', 'full')])
+        session.execute(Episode.__table__.insert(), [
+            {'id': i * 5 + number, 'identifier': 'S01E%02d' % number, 'season': 1, 'number': number,
+             'identified_by': 'ep', 'series_id': i + 1}
+            for i in xrange(len(shows)) for number in xrange(1, 6)])
+        session.execute(Release.__table__.insert(), [
+            {'episode_id': i * 5 + number, 'quality': '720p hdtv', 'downloaded': True, 'proper_count': 0,
+             'title': '%s S01E%02d 720p HDTV x264-LOL' % (name, number), 'first_seen': now - timedelta(days=30)}
+            for i, name in enumerate(shows) for number in xrange(1, 6)])
+
+        session.execute(ArchiveTag.__table__.insert(), [{'id': 1, 'name': 'perf'}])
+        session.execute(ArchiveSource.__table__.insert(), [{'id': 1, 'name': 'perf'}])
+        session.execute(ArchiveEntry.__table__.insert(), [
+            {'id': i + 1, 'title': item['title'], 'url': item['url'], 'description': item['description'],
+             'added': now} for i, item in enumerate(entries)])
+        session.execute(archive_tags_table.insert(), [{'entry_id': i + 1, 'tag_id': 1} for i in xrange(len(entries))])
+        session.execute(archive_sources_table.insert(), [
+            {'entry_id': i + 1, 'source_id': 1} for i in xrange(len(entries))])
+
+        session.execute(BacklogEntry.__table__.insert(), [
+            {'feed': 'perf_backlog', 'title': item['title'], 'expire': now + timedelta(days=1), 'entry': item}
+            for item in entries])
+        session.commit()
+    finally:
+        session.close()
+
+
+def scenario_config(name, entries, shows):
+    """
+    :return: Tuple of task config and list of entries to inject, None when entries are produced by the input phase
+    """
+    # Isolated scenarios do not run any builtins, nor templates from the user config
+    config = {'template': False, 'disable_builtins': True}
+    movie_words = [word.title() for word in WORDS[::4]]
+    if name == 'series':
+        config['series'] = list(shows)
+    elif name == 'seen':
+        config['seen'] = True
+    elif name == 'regexp':
+        config['regexp'] = {'accept': [re.escape(show) for show in shows[:100]] + movie_words,
+                            'reject': [r'\bCAM\b', r'\bTS\b']}
+    elif name == 'template':
+        config['accept_all'] = True
+        config['set'] = {'path': '/media/{{ title|lower|replace(" ", ".") }}',
+                         'comment': '{{ url|replace("http://", "") }} {{ description|truncate(40) }}'}
+    elif name == 'backlog':
+        # Builtin backlog restores the seeded entries, configuring it would learn them again
+        config['disable_builtins'] = [p.name for p in plugin.plugins.itervalues() if p.builtin and p.name != 'backlog']
+        config['mock'] = [{'title': 'perf backlog', 'url': 'http://localhost/perf/backlog'}]
+        return config, None
+    elif name == 'full':
+        # Typical task with builtins enabled
+        del config['disable_builtins']
+        config.update(mock=entries, series=list(shows), archive=['perf'],
+                      regexp={'accept': movie_words, 'reject': [r'\bCAM\b', r'\bTS\b']},
+                      set={'path': '/media/{{ series_name|default("movies") }}'})
+        return config, None
+    return config, entries
+
+
+@contextmanager
+def temporary_database(manager, filename):
+    """Points the manager and new sessions at SQLite database *filename* for the duration of the block."""
+    original = manager.db_filename, manager.database_uri, manager.engine
+    manager.db_filename = filename
+    manager.database_uri = 'sqlite:///%s' % filename.replace('\\', '\\\\')
+    manager.init_sqlalchemy()
+    try:
+        yield manager.engine
+    finally:
+        manager.engine.dispose()
+        manager.db_filename, manager.database_uri, manager.engine = original
+        Session.configure(bind=manager.engine)
+        db_schema.reset_version_cache()
+
+
+def memory_usage():
+    """
+    :return: Tuple of current and peak resident set size in KiB, None when not available on this platform
+    """
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf(str('SC_PAGE_SIZE')) // 1024
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            # Reported in bytes
+            peak //= 1024
+    return current, peak
+
+
+def run_scenario(manager, name, entries, shows):
+    """Runs scenario task once against current database, returns dict of measurements."""
+    config, inject = scenario_config(name, entries, shows)
+    options = {'inject': [Entry(item) for item in inject]} if inject is not None else None
+    task = Task(manager, 'perf_%s' % name, config=config, options=options)
+    if options:
+        # Injected entries skip the input phase, which normally tells entries their task
+        for entry in options['inject']:
+            entry.task = task
+
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    sqlalchemy.event.listen(manager.engine, 'before_cursor_execute', count_query)
+    gc.collect()
+    error = None
+    start = time.time()
+    try:
+        task.execute()
+    except TaskAbort as e:
+        error = e.reason
+    took = time.time() - start
+    rss, peak_rss = memory_usage()
+    return {'seconds': took, 'queries': queries[0], 'entries': len(task.all_entries),
+            'accepted': len(task.accepted), 'rejected': len(task.rejected), 'rss_kb': rss,
+            'peak_rss_kb': peak_rss, 'error': error}
+
+
+def benchmark(manager, options):
+    """Runs scenarios against fresh temporary databases seeded with synthetic history."""
+    scales = options.scales or ['1k']
+    scenarios = options.scenarios or SCENARIOS
+    report = {'version': flexget.__version__, 'python': sys.version.split()[0],
+              'platform': sys.platform, 'seed': options.seed, 'repeat': options.repeat,
+              'started': datetime.now().isoformat(), 'results': []}
+    tmpdir = tempfile.mkdtemp(prefix='flexget-perf-')
+    try:
+        for scale in scales:
+            log.info('Generating %s entries and seeding database ...' % scale)
+            entries, shows = generate(SCALES[scale], options.seed)
+            seeded = os.path.join(tmpdir, 'seed-%s.sqlite' % scale)
+            with temporary_database(manager, seeded):
+                seed_database(entries, shows)
+            for name in scenarios:
+                runs = []
+                for i in range(options.repeat):
+                    # Each run starts from the same database, tasks may have learned entries in the previous run
+                    filename = os.path.join(tmpdir, 'run.sqlite')
+                    shutil.copy(seeded, filename)
+                    with temporary_database(manager, filename):
+                        runs.append(run_scenario(manager, name, entries, shows))
+                    os.remove(filename)
+                    if runs[-1]['error']:
+                        log.error('%s %s run %s aborted: %s' % (name, scale, i + 1, runs[-1]['error']))
+                    else:
+                        log.info('%s %s run %s: %.3f seconds' % (name, scale, i + 1, runs[-1]['seconds']))
+                # Aborted runs skip most of the task, their measurements would make the scenario look faster
+                completed = [run for run in runs if not run['error']]
+                errors = [run['error'] for run in runs if run['error']]
+                result = dict((completed or runs)[-1], scenario=name, scale=scale)
+                times = [run['seconds'] for run in completed]
+                result.update(seconds=times, aborted=len(errors), error=errors[-1] if errors else None,
+                              best=min(times) if times else None, mean=sum(times) / len(times) if times else None)
+                report['results'].append(result)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    console('%-10s %-6s %10s %10s %9s %8s %12s' % ('Scenario', 'Scale', 'Best (s)', 'Mean (s)', 'Queries',
+                                                    'Entries', 'Peak RSS kB'))
+    console('-' * 79)
+    for result in report['results']:
+        if not result['seconds']:
+            console('%-10s %-6s aborted: %s' % (result['scenario'], result['scale'], result['error']))
+            continue
+        console('%-10s %-6s %10.3f %10.3f %9s %8s %12s' % (result['scenario'], result['scale'], result['best'],
+                                                           result['mean'], result['queries'], result['entries'],
+                                                           result['peak_rss_kb']))
+        if result['aborted']:
+            console('  %s run(s) aborted and left out: %s' % (result['aborted'], result['error']))
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        console('Results written to %s' % options.output)
+    else:
+        console(json.dumps(report, indent=2, sort_keys=True))
+
+
 def imdb_query(session):
     import time
     from flexget.plugins.metainfo.imdb_lookup import Movie
@@ -75,3 +347,10 @@ def imdb_query(session):
 def register_parser_arguments():
     perf_parser = options.register_command('perf-test', cli_perf_test)
     perf_parser.add_argument('test_name', metavar='<test name>', choices=TESTS)
+    perf_parser.add_argument('--scale', dest='scales', nargs='+', choices=sorted(SCALES, key=SCALES.get),
+                             help='numbers of generated entries for benchmark (default: 1k)')
+    perf_parser.add_argument('--scenario', dest='scenarios', nargs='+', choices=SCENARIOS,
+                             help='benchmark scenarios to run (default: all)')
+    perf_parser.add_argument('--repeat', type=int, default=3, help='runs of each benchmark scenario (default: 3)')
+    perf_parser.add_argument('--seed', type=int, default=0, help='random seed for generated entries (default: 0)')
+    perf_parser.add_argument('--output', metavar='FILE', help='write benchmark results as json to FILE')
@@ -3,13 +3,14 @@ import logging
 
 from flexget import options
 from flexget.event import event
-from flexget.plugin import get_plugins
+from flexget.plugin import get_plugins, load_lazy_plugins
 
 log = logging.getLogger('plugins')
 
 
 @event('manager.subcommand.plugins')
 def plugins_summary(manager, options):
+    load_lazy_plugins()
     print('-' * 79)
     print('%-20s%-30s%s' % ('Name', 'Roles (priority)', 'Info'))
     print('-' * 79)
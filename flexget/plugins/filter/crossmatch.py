@@ -1,12 +1,36 @@
 from __future__ import unicode_literals, division, absolute_import
 import logging
+import threading
+from datetime import date, time, timedelta
+from Queue import Queue, Empty
 
-from flexget import plugin
+from flexget import logger, plugin
 from flexget.event import event
 
 log = logging.getLogger('crossmatch')
 
 
+# Types whose hash is consistent with their equality, other objects may only define __eq__
+HASHABLE_TYPES = (basestring, int, long, float, bool, date, time, timedelta, type(None))
+
+
+def hashable(value):
+    """
+    Returns a hashable key for *value*, keys of values comparing equal are equal as well.
+
+    :return: Key, or None if it cannot be safely made.
+    """
+    if isinstance(value, list):
+        items = [hashable(item) for item in value]
+        return None if None in items else ('list', tuple(items))
+    if isinstance(value, dict):
+        items = [(key, hashable(item)) for key, item in value.iteritems()]
+        return None if any(item is None for key, item in items) else ('dict', frozenset(items))
+    if isinstance(value, HASHABLE_TYPES):
+        return ('value', value)
+    return None
+
+
 class CrossMatch(object):
     """
     Perform action based on item on current task and other inputs.
@@ -19,6 +43,8 @@ class CrossMatch(object):
         fields:
           - title
         action: reject
+
+    Inputs listed in `from` can be run in parallel by setting `threads`.
     """
 
     schema = {
@@ -26,79 +52,114 @@ class CrossMatch(object):
         'properties': {
             'fields': {'type': 'array', 'items': {'type': 'string'}},
             'action': {'enum': ['accept', 'reject']},
-            'from': {'type': 'array', 'items': {'$ref': '/schema/plugins?phase=input'}}
+            'from': {'type': 'array', 'items': {'$ref': '/schema/plugins?phase=input'}},
+            'threads': {'type': 'integer', 'minimum': 1, 'default': 1}
         },
         'required': ['fields', 'action', 'from'],
         'additionalProperties': False
     }
 
+    def run_input(self, task, input_name, input_config):
+        """Returns entries produced by an input plugin, or None if it failed."""
+        input = plugin.get_plugin_by_name(input_name)
+        if input.api_ver == 1:
+            raise plugin.PluginError('Plugin %s does not support API v2' % input_name)
+        method = input.phase_handlers['input']
+        try:
+            result = method(task, input_config)
+        except plugin.PluginError as e:
+            log.warning('Error during input plugin %s: %s' % (input_name, e))
+            return None
+        if not result:
+            log.warning('Input %s did not return anything' % input_name)
+        return result
+
+    def run_inputs(self, task, config):
+        """Runs all inputs from `from`, in a pool of `threads` worker threads, results are kept in configured order."""
+        inputs = [(name, input_config) for item in config['from'] for name, input_config in item.iteritems()]
+        threads = min(config.get('threads', 1), len(inputs))
+        if threads <= 1:
+            return [self.run_input(task, input_name, input_config) for input_name, input_config in inputs]
+
+        results = [None] * len(inputs)
+        errors = []
+        jobs = Queue()
+        for position in range(len(inputs)):
+            jobs.put(position)
+
+        def worker():
+            logger.set_task(task.name)
+            while True:
+                try:
+                    position = jobs.get_nowait()
+                except Empty:
+                    return
+                try:
+                    results[position] = self.run_input(task, *inputs[position])
+                except Exception as e:
+                    errors.append(e)
+
+        workers = [threading.Thread(target=worker, name='crossmatch-input-%d' % i) for i in range(threads)]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
     def on_task_filter(self, task, config):
 
         fields = config['fields']
         action = config['action']
 
         match_entries = []
-
-        # TODO: xxx
-        # we probably want to have common "run and combine inputs" function sometime soon .. this code is in
-        # few places already (discover, inputs, ...)
-        # code written so that this can be done easily ...
-        for item in config['from']:
-            for input_name, input_config in item.iteritems():
-                input = plugin.get_plugin_by_name(input_name)
-                if input.api_ver == 1:
-                    raise plugin.PluginError('Plugin %s does not support API v2' % input_name)
-                method = input.phase_handlers['input']
-                try:
-                    result = method(task, input_config)
-                except plugin.PluginError as e:
-                    log.warning('Error during input plugin %s: %s' % (input_name, e))
+        for result in self.run_inputs(task, config):
+            if result:
+                match_entries.extend(result)
+
+        # field -> value -> positions of generated entries with that value
+        index = dict((field, {}) for field in fields)
+        # field -> list of (position, value) for values which cannot be hashed
+        unhashable = dict((field, []) for field in fields)
+        missing = object()
+        for position, generated_entry in enumerate(match_entries):
+            for field in fields:
+                value = generated_entry.get(field, missing)
+                if value is missing:
                     continue
-                if result:
-                    match_entries.extend(result)
+                key = hashable(value)
+                if key is None:
+                    unhashable[field].append((position, value))
                 else:
-                    log.warning('Input %s did not return anything' % input_name)
-                    continue
+                    index[field].setdefault(key, []).append(position)
+        # Fields no generated entry has can never match, no need to evaluate them on task entries
+        fields = [field for field in fields if index[field] or unhashable[field]]
 
         # perform action on intersecting entries
         for entry in task.entries:
-            for generated_entry in match_entries:
-                log.trace('checking if %s matches %s' % (entry['title'], generated_entry['title']))
-                common = self.entry_intersects(entry, generated_entry, fields)
-                if common:
-                    msg = 'intersects with %s on field(s) %s' % \
-                          (generated_entry['title'], ', '.join(common))
-                    if action == 'reject':
-                        entry.reject(msg)
-                    if action == 'accept':
-                        entry.accept(msg)
-
-    def entry_intersects(self, e1, e2, fields=None):
-        """
-        :param e1: First :class:`flexget.entry.Entry`
-        :param e2: Second :class:`flexget.entry.Entry`
-        :param fields: List of fields which are checked
-        :return: List of field names in common
-        """
-
-        if fields is None:
-            fields = []
-
-        common_fields = []
-
-        for field in fields:
-            # TODO: simplify if seems to work (useless debug)
-            log.trace('checking field %s' % field)
-            v1 = e1.get(field, object())
-            v2 = e2.get(field, object())
-            log.trace('v1: %r' % v1)
-            log.trace('v2: %r' % v2)
-
-            if v1 == v2:
-                common_fields.append(field)
-            else:
-                log.trace('not matching')
-        return common_fields
+            # position of generated entry -> fields in common
+            common = {}
+            for field in fields:
+                value = entry.get(field, missing)
+                if value is missing:
+                    continue
+                key = hashable(value)
+                positions = index[field].get(key, []) if key is not None else []
+                positions = positions + [position for position, other in unhashable[field] if other == value]
+                for position in positions:
+                    common.setdefault(position, []).append(field)
+            for position in sorted(common):
+                generated_entry = match_entries[position]
+                # keep fields in configured order
+                common_fields = [field for field in config['fields'] if field in common[position]]
+                msg = 'intersects with %s on field(s) %s' % \
+                      (generated_entry['title'], ', '.join(common_fields))
+                if action == 'reject':
+                    entry.reject(msg)
+                if action == 'accept':
+                    entry.accept(msg)
 
 
 @event('plugin.register')
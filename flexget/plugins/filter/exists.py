@@ -5,6 +5,7 @@ import logging
 from flexget import plugin
 from flexget.event import event
 from flexget.config_schema import one_or_more
+from flexget.utils.library_index import LibraryIndex
 
 log = logging.getLogger('exists')
 
@@ -34,21 +35,23 @@ class FilterExists(object):
             return
         log.verbose('Scanning path(s) for existing files.')
         config = self.prepare_config(config)
+        index = LibraryIndex(task.session)
         for path in config:
             # unicode path causes crashes on some paths
             path = str(os.path.expanduser(path))
             if not os.path.exists(path):
                 raise plugin.PluginWarning('Path %s does not exist' % path, log)
-            # scan through
-            for root, dirs, files in os.walk(path, followlinks=True):
-                # convert filelists into utf-8 to avoid unicode problems
-                dirs = [x.decode('utf-8', 'ignore') for x in dirs]
-                files = [x.decode('utf-8', 'ignore') for x in files]
-                for entry in task.accepted:
-                    name = entry['title']
-                    if name in dirs or name in files:
-                        log.debug('Found %s in %s' % (name, root))
-                        entry.reject(os.path.join(root, name))
+            # map all names under the path to the directory containing them
+            existing = {}
+            for record in index.walk(path):
+                for name in record.dirs + record.files:
+                    existing.setdefault(name, record.path)
+            for entry in task.accepted:
+                name = entry['title']
+                if name in existing:
+                    log.debug('Found %s in %s' % (name, existing[name]))
+                    entry.reject(os.path.join(existing[name], name))
+
 
 @event('plugin.register')
 def register_plugin():
@@ -5,8 +5,8 @@ import logging
 from flexget import plugin
 from flexget.event import event
 from flexget.config_schema import one_or_more
+from flexget.utils.library_index import LibraryIndex
 from flexget.utils.titles.movie import MovieParser
-from flexget.utils.tools import TimedDict
 
 log = logging.getLogger('exists_movie')
 
@@ -25,9 +25,6 @@ class FilterExistsMovie(object):
 
     skip = ['cd1', 'cd2', 'subs', 'sample']
 
-    def __init__(self):
-        self.cache = TimedDict(cache_time='1 hour')
-
     def build_config(self, config):
         # if only a single path is passed turn it into a 1 element list
         if isinstance(config, basestring):
@@ -48,18 +45,11 @@ class FilterExistsMovie(object):
         count_entries = 0
         count_dirs = 0
 
-        # list of imdb ids gathered from paths / cache
-        imdb_ids = []
+        # imdb ids gathered from paths
+        imdb_ids = set()
 
+        index = LibraryIndex(task.session)
         for path in config:
-            # see if this path has already been scanned
-            if path in self.cache:
-                log.verbose('Using cached scan for %s ...' % path)
-                imdb_ids.extend(self.cache[path])
-                continue
-
-            path_ids = []
-
             # with unicode it crashes on some paths ..
             path = str(os.path.expanduser(path))
             if not os.path.exists(path):
@@ -68,42 +58,21 @@ class FilterExistsMovie(object):
 
             log.verbose('Scanning path %s ...' % path)
 
-            # Help debugging by removing a lot of noise
-            #logging.getLogger('movieparser').setLevel(logging.WARNING)
-            #logging.getLogger('imdb_lookup').setLevel(logging.WARNING)
-
-            # scan through
-            for root, dirs, files in os.walk(path, followlinks=True):
-                # convert filelists into utf-8 to avoid unicode problems
-                dirs = [x.decode('utf-8', 'ignore') for x in dirs]
-                # files = [x.decode('utf-8', 'ignore') for x in files]
-
-                # TODO: add also video files?
-                for item in dirs:
-                    if item.lower() in self.skip:
-                        continue
+            # directories are only looked up again when their parent directory has changed
+            for record in index.walk(path):
+                found = index.get_parsed(record, 'imdb')
+                if found is None:
+                    found, failed = self.lookup_dirs(imdb_lookup, record, task.session)
+                    # Failed lookups may succeed next time, the directory is looked up again then
+                    if not failed:
+                        index.set_parsed(record, 'imdb', found)
+                for item, imdb_id in found.iteritems():
                     count_dirs += 1
-
-                    movie = MovieParser()
-                    movie.parse(item)
-
-                    try:
-                        imdb_id = imdb_lookup.imdb_id_lookup(movie_title=movie.name,
-                                                             raw_title=item,
-                                                             session=task.session)
-                        if imdb_id in path_ids:
-                            log.trace('duplicate %s' % item)
-                            continue
-                        if imdb_id is not None:
-                            log.trace('adding: %s' % imdb_id)
-                            path_ids.append(imdb_id)
-                    except plugin.PluginError as e:
-                        log.trace('%s lookup failed (%s)' % (item, e.value))
+                    if imdb_id is None:
                         incompatible_dirs += 1
-
-            # store to cache and extend to found list
-            self.cache[path] = path_ids
-            imdb_ids.extend(path_ids)
+                    elif imdb_id not in imdb_ids:
+                        log.trace('adding: %s' % imdb_id)
+                        imdb_ids.add(imdb_id)
 
         log.debug('-- Start filtering entries ----------------------------------')
 
@@ -129,6 +98,27 @@ class FilterExistsMovie(object):
 
         log.debug('-- Finished filtering entries -------------------------------')
 
+    def lookup_dirs(self, imdb_lookup, record, session):
+        """
+        :return: Tuple of dict of directory name -> imdb id for directories in *record*, id is None when there is no
+            imdb id for the name, and True if any of the lookups failed.
+        """
+        found = {}
+        failed = False
+        # TODO: add also video files?
+        for item in record.dirs:
+            if item.lower() in self.skip:
+                continue
+            movie = MovieParser()
+            movie.parse(item)
+            try:
+                found[item] = imdb_lookup.imdb_id_lookup(movie_title=movie.name, raw_title=item, session=session)
+            except plugin.PluginError as e:
+                log.trace('%s lookup failed (%s)' % (item, e.value))
+                found[item] = None
+                failed = True
+        return found, failed
+
 @event('plugin.register')
 def register_plugin():
     plugin.register(FilterExistsMovie, 'exists_movie', groups=['exists'], api_ver=2)
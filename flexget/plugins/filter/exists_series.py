@@ -6,12 +6,29 @@ import logging
 from flexget import plugin
 from flexget.event import event
 from flexget.config_schema import one_or_more
+from flexget.utils import qualities
+from flexget.utils.library_index import LibraryIndex
 from flexget.utils.log import log_once
 from flexget.utils.template import RenderError
 from flexget.utils.titles import ParseWarning
+from flexget.utils.tools import config_fingerprint
 
 log = logging.getLogger('exists_series')
 
+# Parser attributes which affect the outcome of parsing
+PARSER_SETTINGS = ['name', 'alternate_names', 'identified_by', 'strict_name', 'allow_groups', 'allow_seasonless',
+                   'date_dayfirst', 'date_yearfirst', 'specials', 'prefer_specials', 'assume_special']
+PARSER_REGEXPS = ['ep_regexps', 'date_regexps', 'sequence_regexps', 'id_regexps']
+
+
+def parser_fingerprint(parser):
+    """Returns a key identifying parsers which produce the same results."""
+    settings = dict((attr, getattr(parser, attr, None)) for attr in PARSER_SETTINGS)
+    regexps = PARSER_REGEXPS if parser.re_from_name else PARSER_REGEXPS + ['name_regexps']
+    for attr in regexps:
+        settings[attr] = [getattr(regexp, 'pattern', regexp) for regexp in getattr(parser, attr)]
+    return config_fingerprint(settings)
+
 
 class FilterExistsSeries(object):
     """
@@ -69,55 +86,67 @@ class FilterExistsSeries(object):
             log.warning('No accepted entries have series information. exists_series cannot filter them')
             return
 
+        # make new parser from parser in entry, identified by the settings affecting parse results
+        parsers = {}
+        for series, entries in accepted_series.iteritems():
+            disk_parser = copy.copy(entries[0]['series_parser'])
+            parsers[series] = (disk_parser, 'series:%s' % parser_fingerprint(disk_parser))
+
+        # series name -> identifier -> list of (quality, proper_count) found on disk
+        existing = dict((series, {}) for series in accepted_series)
+        index = LibraryIndex(task.session)
         for path in paths:
             log.verbose('Scanning %s', path)
             # crashes on some paths with unicode
             path = str(os.path.expanduser(path))
             if not os.path.exists(path):
                 raise plugin.PluginWarning('Path %s does not exist' % path, log)
-            # scan through
-            for root, dirs, files in os.walk(path, followlinks=True):
-                # convert filelists into utf-8 to avoid unicode problems
-                dirs = [x.decode('utf-8', 'ignore') for x in dirs]
-                files = [x.decode('utf-8', 'ignore') for x in files]
+            for record in index.walk(path):
                 # For speed, only test accepted entries since our priority should be after everything is accepted.
-                for series in accepted_series:
-                    # make new parser from parser in entry
-                    disk_parser = copy.copy(accepted_series[series][0]['series_parser'])
-                    for name in files + dirs:
-                        # run parser on filename data
-                        disk_parser.data = name
-                        try:
-                            disk_parser.parse(data=name)
-                        except ParseWarning as pw:
-                            log_once(pw.value, logger=log)
-                        if disk_parser.valid:
-                            log.debug('name %s is same series as %s', name, series)
-                            log.debug('disk_parser.identifier = %s', disk_parser.identifier)
-                            log.debug('disk_parser.quality = %s', disk_parser.quality)
-                            log.debug('disk_parser.proper_count = %s', disk_parser.proper_count)
-
-                            for entry in accepted_series[series]:
-                                log.debug('series_parser.identifier = %s', entry['series_parser'].identifier)
-                                if disk_parser.identifier != entry['series_parser'].identifier:
-                                    log.trace('wrong identifier')
-                                    continue
-                                log.debug('series_parser.quality = %s', entry['series_parser'].quality)
-                                if config.get('allow_different_qualities') == 'better':
-                                    if entry['series_parser'].quality > disk_parser.quality:
-                                        log.trace('better quality')
-                                        continue
-                                elif config.get('allow_different_qualities'):
-                                    if disk_parser.quality != entry['series_parser'].quality:
-                                        log.trace('wrong quality')
-                                        continue
-                                log.debug('entry parser.proper_count = %s', entry['series_parser'].proper_count)
-                                if disk_parser.proper_count >= entry['series_parser'].proper_count:
-                                    entry.reject('proper already exists')
-                                    continue
-                                else:
-                                    log.trace('new one is better proper, allowing')
-                                    continue
+                for series, (disk_parser, key) in parsers.iteritems():
+                    found = index.parsed(record, key,
+                                         lambda record, parser=disk_parser: self.parse_names(parser, record))
+                    for name, identifier, quality, proper_count in found:
+                        log.debug('name %s is same series as %s', name, series)
+                        existing[series].setdefault(identifier, []).append((qualities.Quality(quality), proper_count))
+
+        for series, entries in accepted_series.iteritems():
+            for entry in entries:
+                log.debug('series_parser.identifier = %s', entry['series_parser'].identifier)
+                for disk_quality, disk_proper_count in existing[series].get(entry['series_parser'].identifier, []):
+                    log.debug('series_parser.quality = %s', entry['series_parser'].quality)
+                    if config.get('allow_different_qualities') == 'better':
+                        if entry['series_parser'].quality > disk_quality:
+                            log.trace('better quality')
+                            continue
+                    elif config.get('allow_different_qualities'):
+                        if disk_quality != entry['series_parser'].quality:
+                            log.trace('wrong quality')
+                            continue
+                    log.debug('entry parser.proper_count = %s', entry['series_parser'].proper_count)
+                    if disk_proper_count >= entry['series_parser'].proper_count:
+                        entry.reject('proper already exists')
+                        break
+                    else:
+                        log.trace('new one is better proper, allowing')
+
+    def parse_names(self, disk_parser, record):
+        """Returns (name, identifier, quality, proper_count) for the names in directory matching the series."""
+        found = []
+        for name in record.files + record.dirs:
+            # run parser on filename data
+            disk_parser.data = name
+            try:
+                disk_parser.parse(data=name)
+            except ParseWarning as pw:
+                log_once(pw.value, logger=log)
+            if disk_parser.valid:
+                log.debug('disk_parser.identifier = %s', disk_parser.identifier)
+                log.debug('disk_parser.quality = %s', disk_parser.quality)
+                log.debug('disk_parser.proper_count = %s', disk_parser.proper_count)
+                found.append((name, disk_parser.identifier, disk_parser.quality.name, disk_parser.proper_count))
+        return found
+
 
 @event('plugin.register')
 def register_plugin():
@@ -1,5 +1,7 @@
 from __future__ import unicode_literals, division, absolute_import
 import logging
+import re
+import unicodedata
 
 from sqlalchemy import Column, Integer, String, ForeignKey, or_, and_, select, update
 from sqlalchemy.orm.exc import NoResultFound
@@ -78,7 +80,79 @@ class QueuedMovie(queue_base.QueuedItem, Base):
     quality_req = quality_requirement_property('quality')
 
 
+def title_words(title):
+    """
+    Returns list of lowercase words in *title*, with accents and punctuation removed. Apostrophes are dropped and
+    hyphenated words joined, so "Ocean's" becomes "oceans" and "Spider-Man" becomes "spiderman".
+    """
+    title = unicodedata.normalize('NFKD', unicode(title))
+    title = ''.join(char for char in title if not unicodedata.combining(char)).lower().replace('&', ' and ')
+    title = re.sub('[\'\u2019`]', '', title)
+    title = re.sub(r'(?<=[^\W_])-(?=[^\W_])', '', title, flags=re.UNICODE)
+    return re.findall(r'[^\W_]+', title, re.UNICODE)
+
+
+class MovieQueueIndex(object):
+    """Undownloaded queue items loaded in one query, indexed by movie ids and significant title words."""
+
+    # Words too common to index titles by
+    skip_words = ['the', 'a', 'an', 'and', 'of']
+
+    def __init__(self, session):
+        self.imdb_ids = {}
+        self.tmdb_ids = {}
+        # significant title word -> list of movies
+        self.words = {}
+        for movie in session.query(QueuedMovie).filter(QueuedMovie.downloaded == None).order_by(QueuedMovie.id):
+            if movie.imdb_id:
+                self.imdb_ids.setdefault(movie.imdb_id, movie)
+            if movie.tmdb_id:
+                self.tmdb_ids.setdefault(movie.tmdb_id, movie)
+            words = title_words(movie.title or '')
+            # Release names do not always include the year
+            words = [word for word in words if not re.match(r'(19|20)\d\d$', word)] or words
+            # Sequel numbers appear in too many release names to go by
+            significant = [word for word in words if word not in self.skip_words and not word.isdigit()] or words
+            if not significant:
+                # No title to go by, any entry could be this movie
+                significant = [None]
+            for word in set(significant):
+                self.words.setdefault(word, []).append(movie)
+
+    def __len__(self):
+        return len(set(self.imdb_ids.values() + self.tmdb_ids.values()))
+
+    def title_matches(self, entry):
+        """
+        Tells whether the entry title shares a significant word with a queued movie title. This is only a rough check
+        to avoid pointless lookups, release names often use an alternate or abbreviated title.
+        """
+        if self.words.get(None):
+            return True
+        words = title_words(entry['title'])
+        # "Spider.Man" should match "Spiderman" as well
+        words += [first + second for first, second in zip(words, words[1:])]
+        return any(word in self.words for word in words)
+
+    def find(self, entry, eval_lazy):
+        """Returns queue item matching the movie ids on *entry*."""
+        imdb_id = entry.get('imdb_id', eval_lazy=eval_lazy)
+        if imdb_id and imdb_id in self.imdb_ids:
+            return self.imdb_ids[imdb_id]
+        # Only incur a lazy tmdb lookup if no imdb id was found
+        tmdb_id = entry.get('tmdb_id', eval_lazy=eval_lazy and not imdb_id)
+        if tmdb_id:
+            try:
+                return self.tmdb_ids.get(int(tmdb_id))
+            except ValueError:
+                return None
+
+
 class FilterMovieQueue(queue_base.FilterQueueBase):
+    def prepare_matching(self, task, config):
+        self.index = MovieQueueIndex(task.session)
+        log.debug('%s movies in queue' % len(self.index))
+
     def matches(self, task, config, entry):
         # Tell tmdb_lookup to add lazy lookup fields if not already present
         try:
@@ -89,25 +163,26 @@ class FilterMovieQueue(queue_base.FilterQueueBase):
             plugin.get_plugin_by_name('tmdb_lookup').instance.lookup(entry)
         except plugin.DependencyError:
             log.debug('tmdb_lookup is not available, queue will not work if movie ids are not populated')
-    
-        conditions = []
+
+        if not self.index.imdb_ids and not self.index.tmdb_ids:
+            return
         # Check if a movie id is already populated before incurring a lazy lookup
-        for lazy in [False, True]:
-            if entry.get('imdb_id', eval_lazy=lazy):
-                conditions.append(QueuedMovie.imdb_id == entry['imdb_id'])
-            if entry.get('tmdb_id', eval_lazy=lazy and not conditions):
-                conditions.append(QueuedMovie.tmdb_id == entry['tmdb_id'])
-            if conditions:
-                break
-        if not conditions:
-            log_once('IMDB and TMDB lookups failed for %s.' % entry['title'], log, logging.WARN)
+        movie = self.index.find(entry, eval_lazy=False)
+        if not movie:
+            if not entry.get('imdb_id', eval_lazy=False) and not entry.get('tmdb_id', eval_lazy=False):
+                # Lookups are expensive, only do them if the title looks like one of the queued movies
+                if not self.index.title_matches(entry):
+                    log.trace('%s does not look like any queued movie' % entry['title'])
+                    return
+                movie = self.index.find(entry, eval_lazy=True)
+                if not entry.get('imdb_id', eval_lazy=False) and not entry.get('tmdb_id', eval_lazy=False):
+                    log_once('IMDB and TMDB lookups failed for %s.' % entry['title'], log, logging.WARN)
+                    return
+        if not movie:
             return
 
         quality = entry.get('quality', qualities.Quality())
-
-        movie = task.session.query(QueuedMovie).filter(QueuedMovie.downloaded == None). \
-            filter(or_(*conditions)).first()
-        if movie and movie.quality_req.allows(quality):
+        if movie.quality_req.allows(quality):
             return movie
 
 
@@ -51,6 +51,9 @@ class FilterQueueBase(object):
         # Dict of entries accepted by this plugin {imdb_id: entry} format
         self.accepted_entries = {}
 
+    def prepare_matching(self, task, config):
+        """Called before :meth:`matches` is run for the entries of a task, can be used to load the queue in bulk."""
+
     def matches(self, task, config, entry):
         """This should return the QueueItem object for the match, if this entry is in the queue."""
         raise NotImplementedError
@@ -60,6 +63,7 @@ class FilterQueueBase(object):
         if config is False:
             return
 
+        self.prepare_matching(task, config)
         for entry in task.entries:
             item = self.matches(task, config, entry)
             if item and item.id not in self.accepted_entries:
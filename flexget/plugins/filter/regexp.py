@@ -7,9 +7,13 @@ from flexget import plugin
 from flexget.config_schema import one_or_more
 from flexget.entry import Entry
 from flexget.event import event
+from flexget.utils.tools import config_fingerprint
 
 log = logging.getLogger('regexp')
 
+# Patterns using backreferences or global inline flags would change meaning when combined with other patterns
+UNCOMBINABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]')
+
 
 class FilterRegexp(object):
 
@@ -39,6 +43,10 @@ class FilterRegexp(object):
         Possible operations: accept, reject, accept_excluding, reject_excluding
     """
 
+    def __init__(self):
+        # config fingerprint -> prepared config, compiling hundreds of regexps on every run is expensive
+        self.prepared = {}
+
     schema = {
         'type': 'object',
         'properties': {
@@ -133,24 +141,61 @@ class FilterRegexp(object):
                 out_config.setdefault(operation, []).append({regexp: opts})
         return out_config
 
+    def combine(self, regexps):
+        """
+        Splits list of {compiled regexp: options} dictionaries into runs of regexps searching from the same fields.
+
+        :return: List of (fields, combined, regexps) tuples. `combined` is a single compiled regexp matching whenever
+            any of the regexps in the run match, or None if they cannot be combined.
+        """
+        groups = []
+        for regexp_opts in regexps:
+            regexp, opts = regexp_opts.items()[0]
+            find_from = opts.get('from')
+            combinable = not UNCOMBINABLE.search(regexp.pattern)
+            if combinable and groups and groups[-1][1] and groups[-1][0] == find_from:
+                groups[-1][2].append((regexp, opts))
+            else:
+                groups.append((find_from, combinable, [(regexp, opts)]))
+        result = []
+        for find_from, combinable, items in groups:
+            combined = None
+            if combinable and len(items) > 1:
+                try:
+                    combined = re.compile('|'.join('(?:%s)' % regexp.pattern for regexp, opts in items),
+                                          re.IGNORECASE | re.UNICODE)
+                except (re.error, AssertionError, OverflowError) as e:
+                    # e.g. too many groups, just try them one by one
+                    log.debug('Could not combine %s regexps: %s' % (len(items), e))
+            result.append((find_from, combined, items))
+        return result
+
     @plugin.priority(172)
     def on_task_filter(self, task, config):
         # TODO: what if accept and accept_excluding configured? Should raise error ...
-        config = self.prepare_config(config)
-        rest = []
-        for operation, regexps in config.iteritems():
+        fingerprint = config_fingerprint(config)
+        if fingerprint not in self.prepared:
+            prepared = self.prepare_config(config)
+            for operation, regexps in prepared.iteritems():
+                if operation != 'rest':
+                    prepared[operation] = self.combine(regexps)
+            self.prepared[fingerprint] = prepared
+        config = self.prepared[fingerprint]
+        rest = None
+        for operation, groups in config.iteritems():
             if operation == 'rest':
                 continue
-            leftovers = self.filter(task, operation, regexps)
-            if not rest:
+            leftovers = self.filter(task, operation, groups)
+            if rest is None:
                 rest = leftovers
             else:
-                # If there is already something in rest, take the intersection with r (entries no operations matched)
-                rest = [entry for entry in leftovers if entry in rest]
+                # Take the intersection with entries no operations matched
+                leftover_ids = set(id(entry) for entry in leftovers)
+                rest = [entry for entry in rest if id(entry) in leftover_ids]
 
         if 'rest' in config:
             rest_method = Entry.accept if config['rest'] == 'accept' else Entry.reject
-            for entry in rest:
+            for entry in rest or []:
                 log.debug('Rest method %s for %s' % (config['rest'], entry['title']))
                 rest_method(entry, 'regexp `rest`')
 
@@ -188,41 +233,39 @@ class FilterRegexp(object):
                     else:  # None of the not_regexps matched
                         return field
 
-    def filter(self, task, operation, regexps):
+    def filter(self, task, operation, groups):
         """
         :param task: Task instance
         :param operation: one of 'accept' 'reject' 'accept_excluding' and 'reject_excluding'
                           accept and reject will be called on the entry if any of the regxps match
                           *_excluding operations will be called if any of the regexps don't match
-        :param regexps: list of {compiled_regexp: options} dictionaries
+        :param groups: list of (fields, combined regexp, [(compiled_regexp, options)]) as returned from `combine`
         :return: Return list of entries that didn't match regexps
         """
         rest = []
         method = Entry.accept if 'accept' in operation else Entry.reject
         match_mode = 'excluding' not in operation
+        count = sum(len(items) for find_from, combined, items in groups)
         for entry in task.entries:
-            log.trace('testing %i regexps to %s' % (len(regexps), entry['title']))
-            for regexp_opts in regexps:
-                regexp, opts = regexp_opts.items()[0]
-
-                # check if entry matches given regexp configuration
-                field = self.matches(entry, regexp, opts.get('from'), opts.get('not'))
-
-                # Run if we are in match mode and have a hit, or are in non-match mode and don't have a hit
-                if match_mode == bool(field):
-                    # Creates the string with the reason for the hit
-                    matchtext = 'regexp \'%s\' ' % regexp.pattern + ('matched field \'%s\'' %
-                                                                     field if match_mode else 'didn\'t match')
-                    log.debug('%s for %s' % (matchtext, entry['title']))
-                    # apply settings to entry and run the method on it
-                    if opts.get('path'):
-                        entry['path'] = opts['path']
-                    if opts.get('set'):
-                        # invoke set plugin with given configuration
-                        log.debug('adding set: info to entry:"%s" %s' % (entry['title'], opts['set']))
-                        set = plugin.get_plugin_by_name('set')
-                        set.instance.modify(entry, opts['set'])
-                    method(entry, matchtext)
+            log.trace('testing %i regexps to %s' % (count, entry['title']))
+            for find_from, combined, items in groups:
+                if combined is not None and not self.matches(entry, combined, find_from):
+                    # None of the regexps in this group match, each field was only searched once
+                    if match_mode:
+                        continue
+                    self.apply(entry, method, match_mode, items[0][0], items[0][1], None)
+                    break
+                hit = False
+                for regexp, opts in items:
+                    # check if entry matches given regexp configuration
+                    field = self.matches(entry, regexp, find_from, opts.get('not'))
+
+                    # Run if we are in match mode and have a hit, or are in non-match mode and don't have a hit
+                    if match_mode == bool(field):
+                        self.apply(entry, method, match_mode, regexp, opts, field)
+                        hit = True
+                        break
+                if hit:
                     # We had a match so break out of the regexp loop.
                     break
             else:
@@ -231,6 +274,23 @@ class FilterRegexp(object):
                 rest.append(entry)
         return rest
 
+    def apply(self, entry, method, match_mode, regexp, opts, field):
+        """Runs the operation *method* on entry which hit *regexp*."""
+        # Creates the string with the reason for the hit
+        matchtext = 'regexp \'%s\' ' % regexp.pattern + ('matched field \'%s\'' %
+                                                         field if match_mode else 'didn\'t match')
+        log.debug('%s for %s' % (matchtext, entry['title']))
+        # apply settings to entry and run the method on it
+        if opts.get('path'):
+            entry['path'] = opts['path']
+        if opts.get('set'):
+            # invoke set plugin with given configuration
+            log.debug('adding set: info to entry:"%s" %s' % (entry['title'], opts['set']))
+            set = plugin.get_plugin_by_name('set')
+            set.instance.modify(entry, opts['set'])
+        method(entry, matchtext)
+
+
 @event('plugin.register')
 def register_plugin():
     plugin.register(FilterRegexp, 'regexp', api_ver=2)
@@ -8,6 +8,7 @@ from sqlalchemy.orm import relation
 from flexget import db_schema, options, plugin
 from flexget.event import event
 from flexget.manager import Session
+from flexget.utils.database import batched_delete
 from flexget.utils.sqlalchemy_utils import table_columns, drop_tables, table_add_column
 from flexget.utils.tools import console, parse_timedelta
 
@@ -173,9 +174,13 @@ def clear_rejected(manager):
 @event('manager.db_cleanup')
 def db_cleanup(session):
     # Remove entries older than 30 days
-    result = session.query(RememberEntry).filter(RememberEntry.added < datetime.now() - timedelta(days=30)).delete()
+    expired = session.query(RememberEntry).filter(RememberEntry.added < datetime.now() - timedelta(days=30))
+    tasks = set(name for name, in expired.join(RememberTask).with_entities(RememberTask.name).distinct())
+    result = batched_delete(session, expired)
     if result:
         log.verbose('Removed %d entries from remember rejected table.' % result)
+    # Tasks which had rejections removed should reconsider their entries
+    return tasks
 
 @event('plugin.register')
 def register_plugin():
@@ -22,7 +22,7 @@ from flexget.utils.titles import SeriesParser, ParseWarning, ID_TYPES
 from flexget.utils.sqlalchemy_utils import (table_columns, table_exists, drop_tables, table_schema, table_add_column,
                                             create_index)
 from flexget.utils.tools import merge_dict_from_to, parse_timedelta
-from flexget.utils.database import quality_property
+from flexget.utils.database import quality_property, batched_delete
 
 SCHEMA_VER = 11
 
@@ -148,17 +148,19 @@ def upgrade(ver, session):
 @event('manager.db_cleanup')
 def db_cleanup(session):
     # Clean up old undownloaded releases
-    result = session.query(Release).\
-        filter(Release.downloaded == False).\
-        filter(Release.first_seen < datetime.now() - timedelta(days=120)).delete(False)
+    result = batched_delete(session, session.query(Release).
+                            filter(Release.downloaded == False).
+                            filter(Release.first_seen < datetime.now() - timedelta(days=120)))
     if result:
         log.verbose('Removed %d undownloaded episode releases.', result)
     # Clean up episodes without releases
-    result = session.query(Episode).filter(~Episode.releases.any()).filter(~Episode.begins_series.any()).delete(False)
+    result = batched_delete(session, session.query(Episode).
+                            filter(~Episode.releases.any()).filter(~Episode.begins_series.any()))
     if result:
         log.verbose('Removed %d episodes without releases.', result)
     # Clean up series without episodes that aren't in any tasks
-    result = session.query(Series).filter(~Series.episodes.any()).filter(~Series.in_tasks.any()).delete(False)
+    result = batched_delete(session, session.query(Series).
+                            filter(~Series.episodes.any()).filter(~Series.in_tasks.any()))
     if result:
         log.verbose('Removed %d series without episodes.', result)
 
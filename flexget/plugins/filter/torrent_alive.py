@@ -2,6 +2,8 @@ from __future__ import unicode_literals, division, absolute_import
 import logging
 import threading
 import socket
+from datetime import datetime, timedelta
+from Queue import Queue, Empty
 from urlparse import urlparse, SplitResult, urlsplit, urlunsplit
 import struct
 from random import randrange
@@ -11,42 +13,122 @@ from urllib2 import URLError
 
 from flexget import plugin
 from flexget.event import event
-from flexget.utils.tools import urlopener
+from flexget.utils.tools import urlopener, TimedDict
 from flexget.utils.bittorrent import bdecode
 
 log = logging.getLogger('torrent_alive')
 
+# Maximum amount of trackers scraped at once
+MAX_WORKERS = 10
+# The UDP tracker protocol allows at most this many info hashes in one scrape
+UDP_MAX_HASHES = 74
+# Trackers failing this many times in a row are not contacted again for BREAKER_TIME
+BREAKER_FAILURES = 3
+BREAKER_TIME = timedelta(minutes=10)
 
-class TorrentAliveThread(threading.Thread):
 
-    def __init__(self, tracker, info_hash):
-        threading.Thread.__init__(self)
-        self.tracker = tracker
-        self.info_hash = info_hash
-        self.tracker_seeds = 0
+class ScrapeError(Exception):
+    """Raised when a tracker could not be scraped."""
 
-    def run(self):
-        self.tracker_seeds = get_tracker_seeds(self.tracker, self.info_hash)
-        log.debug('%s seeds found from %s' % (self.tracker_seeds, get_scrape_url(self.tracker, self.info_hash)))
 
-
-def max_seeds_from_threads(threads):
+class ScrapeService(object):
     """
-    Joins the threads and returns the maximum seeds found from any of them.
-
-    :param threads: A list of started `TorrentAliveThread`
-    :return: Maximum seeds found from any of the threads
+    Scrapes trackers for the seeds of torrents. All info hashes wanted from a tracker are asked for in as few requests
+    as the protocol allows, trackers are scraped in a bounded pool of threads, and results are cached for a while so
+    that reruns of a task do not scrape again. Trackers which keep failing are skipped for a while.
     """
-    seeds = 0
-    for background in threads:
-        log.debug('Coming up next: %s' % background.tracker)
-        background.join()
-        seeds = max(seeds, background.tracker_seeds)
-        log.debug('Current hightest number of seeds found: %s' % seeds)
-    return seeds
+
+    def __init__(self, cache_time='15 minutes'):
+        self.cache = TimedDict(cache_time)
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def tracker_available(self, tracker):
+        with self.lock:
+            count, last_failure = self.failures.get(tracker, (0, None))
+        if count >= BREAKER_FAILURES and datetime.now() < last_failure + BREAKER_TIME:
+            return False
+        return True
+
+    def record_result(self, tracker, failed):
+        with self.lock:
+            if not failed:
+                self.failures.pop(tracker, None)
+                return
+            count, _ = self.failures.get(tracker, (0, None))
+            self.failures[tracker] = (count + 1, datetime.now())
+            if count + 1 == BREAKER_FAILURES:
+                log.verbose('Tracker %s failed %s times in a row, not scraping it for %s' %
+                            (tracker, BREAKER_FAILURES, BREAKER_TIME))
+
+    def scrape(self, wanted):
+        """
+        :param wanted: Iterable of (tracker, info_hash) pairs
+        :return: Dict mapping (tracker, info_hash) to seeds, for the pairs which could be scraped
+        """
+        results = {}
+        batches = {}
+        for tracker, info_hash in wanted:
+            key = (tracker, info_hash.upper())
+            if key in results or info_hash.upper() in batches.get(tracker, []):
+                continue
+            try:
+                results[key] = self.cache[key]
+                log.debug('Using cached seeds for %s from %s' % (info_hash, tracker))
+                continue
+            except KeyError:
+                pass
+            if not self.tracker_available(tracker):
+                log.debug('Not scraping %s, it has failed too many times recently' % tracker)
+                continue
+            batches.setdefault(tracker, []).append(info_hash.upper())
+        if not batches:
+            return results
+
+        jobs = Queue()
+        for job in batches.iteritems():
+            jobs.put(job)
+
+        def worker():
+            while True:
+                try:
+                    tracker, info_hashes = jobs.get_nowait()
+                except Empty:
+                    return
+                try:
+                    seeds = scrape_tracker(tracker, info_hashes)
+                except ScrapeError as e:
+                    log.debug('Error scraping %s: %s' % (tracker, e))
+                    self.record_result(tracker, failed=True)
+                    continue
+                except Exception as e:
+                    log.exception('Unexpected error scraping %s: %s' % (tracker, e))
+                    self.record_result(tracker, failed=True)
+                    continue
+                self.record_result(tracker, failed=False)
+                for info_hash, tracker_seeds in seeds.iteritems():
+                    log.debug('%s seeds found from %s for %s' % (tracker_seeds, tracker, info_hash))
+                    self.cache[(tracker, info_hash)] = tracker_seeds
+                    results[(tracker, info_hash)] = tracker_seeds
+
+        threads = [threading.Thread(target=worker, name='torrent_alive-%d' % i)
+                   for i in xrange(min(MAX_WORKERS, len(batches)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+scrape_service = ScrapeService()
 
 
 def get_scrape_url(tracker_url, info_hash):
+    """
+    :param info_hash: Info hash in hex, or a list of them
+    :return: Scrape url of the tracker asking for the given info hashes
+    """
     if 'announce' in tracker_url:
         v = urlsplit(tracker_url)
         sr = SplitResult(v.scheme, v.netloc, v.path.replace('announce', 'scrape'),
@@ -56,34 +138,33 @@ def get_scrape_url(tracker_url, info_hash):
         log.debug('`announce` not contained in tracker url, guessing scrape address.')
         result = tracker_url + '/scrape'
 
+    if isinstance(info_hash, basestring):
+        info_hash = [info_hash]
     result += '&' if '?' in result else '?'
-    result += 'info_hash=%s' % quote(info_hash.decode('hex'))
+    result += '&'.join('info_hash=%s' % quote(h.decode('hex')) for h in info_hash)
     return result
 
 
-def get_udp_seeds(url, info_hash):
+def scrape_udp(url, info_hashes):
+    """
+    :return: Dict mapping the info hashes to seeds
+    :raises ScrapeError: If the tracker could not be scraped
+    """
     parsed_url = urlparse(url)
-    port = None
     try:
         port = parsed_url.port
-    except ValueError as ve:
-        log.error('UDP Port Error, url was %s' % url)
-        return 0
+    except ValueError:
+        raise ScrapeError('UDP Port Error, url was %s' % url)
+    if port is None or port < 0 or port > 65535:
+        raise ScrapeError('UDP Port Error, port was %s' % port)
 
     log.debug('Checking for seeds from %s' % url)
 
     connection_id = 0x41727101980  # connection id is always this
     transaction_id = randrange(1, 65535)  # Random Transaction ID creation
 
-    if port is None:
-        log.error('UDP Port Error, port was None')
-        return 0
-
-    if port < 0 or port > 65535:
-        log.error('UDP Port Error, port was %s' % port)
-        return 0
-
-    # Create the socket
+    seeds = {}
+    clisocket = None
     try:
         clisocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         clisocket.settimeout(5.0)
@@ -98,68 +179,99 @@ def get_udp_seeds(url, info_hash):
         # check recieved packet for response
         action, transaction_id, connection_id = struct.unpack(b">LLQ", res)
 
-        #build packet hash out of decoded info_hash
-        packet_hash = info_hash.decode('hex')
-
-        # construct packet for scrape with decoded info_hash setting action byte to 2 for scape
-        packet = struct.pack(b">QLL", connection_id, 2, transaction_id) + packet_hash
-
-        clisocket.send(packet)
-        # set recieve size of 8 + 12 bytes
-        res = clisocket.recv(20)
-
-    except IOError as e:
-        log.warning('Socket Error: %s', e)
-        return 0
-    # Check for UDP error packet
-    (action,) = struct.unpack(b">L", res[:4])
-    if action == 3:
-        log.error('There was a UDP Packet Error 3')
-        return 0
-
-    # first 8 bytes are followed by seeders, completed and leechers for requested torrent
-    seeders, completed, leechers = struct.unpack(b">LLL", res[8:20])
-    log.debug('get_udp_seeds is returning: %s', seeders)
-    clisocket.close()
-    return seeders
+        for start in xrange(0, len(info_hashes), UDP_MAX_HASHES):
+            batch = info_hashes[start:start + UDP_MAX_HASHES]
+            # construct packet for scrape with decoded info_hashes setting action byte to 2 for scape
+            packet = struct.pack(b">QLL", connection_id, 2, transaction_id) + b''.join(h.decode('hex') for h in batch)
+            clisocket.send(packet)
+            # 8 byte header, followed by seeders, completed and leechers for each requested torrent
+            res = clisocket.recv(8 + 12 * len(batch))
+            # Check for UDP error packet
+            (action,) = struct.unpack(b">L", res[:4])
+            if action == 3:
+                raise ScrapeError('There was a UDP Packet Error 3')
+            for index, info_hash in enumerate(batch):
+                offset = 8 + 12 * index
+                if len(res) < offset + 12:
+                    break
+                seeders, completed, leechers = struct.unpack(b">LLL", res[offset:offset + 12])
+                seeds[info_hash] = seeders
+    except (IOError, struct.error) as e:
+        raise ScrapeError('Socket Error: %s' % e)
+    finally:
+        if clisocket:
+            clisocket.close()
+    log.debug('scrape_udp is returning: %s', seeds)
+    return seeds
 
 
-def get_http_seeds(url, info_hash):
-    url = get_scrape_url(url, info_hash)
-    if not url:
-        log.debug('if not url is true returning 0')
-        return 0
-    log.debug('Checking for seeds from %s' % url)
-    data = None
+def scrape_http(url, info_hashes):
+    """
+    :return: Dict mapping the info hashes to seeds
+    :raises ScrapeError: If the tracker could not be scraped
+    """
+    scrape_url = get_scrape_url(url, info_hashes)
+    log.debug('Checking for seeds from %s' % scrape_url)
     try:
-        data = bdecode(urlopener(url, log, retries=1, timeout=10).read()).get('files')
+        data = bdecode(urlopener(scrape_url, log, retries=1, timeout=10).read()).get('files')
     except URLError as e:
-        log.debug('Error scraping: %s' % e)
-        return 0
+        raise ScrapeError('Error scraping: %s' % e)
     except SyntaxError as e:
-        log.warning('Error decoding tracker response: %s' % e)
-        return 0
+        raise ScrapeError('Error decoding tracker response: %s' % e)
     except BadStatusLine as e:
-        log.warning('Error BadStatusLine: %s' % e)
-        return 0
+        raise ScrapeError('Error BadStatusLine: %s' % e)
     except IOError as e:
-        log.warning('Server error: %s' % e)
-        return 0
+        raise ScrapeError('Server error: %s' % e)
     if not data:
         log.debug('No data received from tracker scrape.')
-        return 0
-    log.debug('get_http_seeds is returning: %s' % data.values()[0]['complete'])
-    return data.values()[0]['complete']
+        return {}
+    if len(info_hashes) == 1 and len(data) == 1:
+        # Some trackers do not key the response by the requested hash
+        return {info_hashes[0]: data.values()[0]['complete']}
+    seeds = dict((key.encode('hex').upper(), value['complete']) for key, value in data.iteritems())
+    missing = [info_hash for info_hash in info_hashes if info_hash not in seeds]
+    if missing and len(info_hashes) > 1 and len(seeds) <= 1:
+        # Tracker does not support scraping several torrents at once
+        log.debug('%s ignored multi hash scrape, scraping torrents one by one' % url)
+        for info_hash in missing:
+            seeds.update(scrape_http(url, [info_hash]))
+    log.debug('scrape_http is returning: %s' % seeds)
+    return seeds
 
 
-def get_tracker_seeds(url, info_hash):
+def scrape_tracker(url, info_hashes):
+    """
+    :param info_hashes: List of info hashes in hex
+    :return: Dict mapping the info hashes to seeds
+    :raises ScrapeError: If the tracker could not be scraped
+    """
+    info_hashes = [info_hash.upper() for info_hash in info_hashes]
     if url.startswith('udp'):
-        return get_udp_seeds(url, info_hash)
+        return scrape_udp(url, info_hashes)
     elif url.startswith('http'):
-        return get_http_seeds(url, info_hash)
-    else:
-        log.warning('There has beena problem with the get_tracker_seeds')
+        return scrape_http(url, info_hashes)
+    raise ScrapeError('Unsupported tracker url %s' % url)
+
+
+def get_tracker_seeds(url, info_hash):
+    """Returns seeds for a single torrent from a single tracker, or 0 if the tracker could not be scraped."""
+    try:
+        return scrape_tracker(url, [info_hash]).get(info_hash.upper(), 0)
+    except ScrapeError as e:
+        log.warning('Error scraping %s: %s' % (url, e))
+        return 0
+
+
+def get_udp_seeds(url, info_hash):
+    if not url.startswith('udp'):
         return 0
+    return get_tracker_seeds(url, info_hash)
+
+
+def get_http_seeds(url, info_hash):
+    if not url.startswith('http'):
+        return 0
+    return get_tracker_seeds(url, info_hash)
 
 
 class TorrentAlive(object):
@@ -201,52 +313,38 @@ class TorrentAlive(object):
         config = self.prepare_config(config)
         min_seeds = config['min_seeds']
 
+        checks = []
         for entry in task.accepted:
             # If torrent_seeds is filled, we will have already filtered in filter phase
             if entry.get('torrent_seeds'):
                 log.debug('Not checking trackers for seeds, as torrent_seeds is already filled.')
                 continue
-            log.debug('Checking for seeds for %s:' % entry['title'])
             torrent = entry.get('torrent')
-            if torrent:
-                seeds = 0
-                info_hash = torrent.info_hash
-                announce_list = torrent.content.get('announce-list')
-                if announce_list:
-                    # Multitracker torrent
-                    threadlist = []
-                    for tier in announce_list:
-                        for tracker in tier:
-                            background = TorrentAliveThread(tracker, info_hash)
-                            try:
-                                background.start()
-                                threadlist.append(background)
-                            except threading.ThreadError:
-                                # If we can't start a new thread, wait for current ones to complete and continue
-                                log.debug('Reached max threads, finishing current threads.')
-                                seeds = max(seeds, max_seeds_from_threads(threadlist))
-                                background.start()
-                                threadlist = [background]
-                            log.debug('Started thread to scrape %s with info hash %s' % (tracker, info_hash))
-
-                    seeds = max(seeds, max_seeds_from_threads(threadlist))
-                    log.debug('Highest number of seeds found: %s' % seeds)
-                else:
-                    # Single tracker
-                    tracker = torrent.content['announce']
-                    try:
-                        seeds = get_tracker_seeds(tracker, info_hash)
-                    except URLError as e:
-                        log.debug('Error scraping %s: %s' % (tracker, e))
-
-                # Reject if needed
-                if seeds < min_seeds:
-                    entry.reject(reason='Tracker(s) had < %s required seeds. (%s)' % (min_seeds, seeds),
-                                 remember_time=config['reject_for'])
-                    # Maybe there is better match that has enough seeds
-                    task.rerun()
-                else:
-                    log.debug('Found %i seeds from trackers' % seeds)
+            if not torrent:
+                continue
+            announce_list = torrent.content.get('announce-list')
+            if announce_list:
+                # Multitracker torrent
+                trackers = [tracker for tier in announce_list for tracker in tier]
+            else:
+                trackers = [torrent.content['announce']]
+            checks.append((entry, torrent.info_hash.upper(), trackers))
+
+        # Scrape all trackers for all the entries at once
+        results = scrape_service.scrape((tracker, info_hash) for _, info_hash, trackers in checks
+                                        for tracker in trackers)
+
+        for entry, info_hash, trackers in checks:
+            log.debug('Checking for seeds for %s:' % entry['title'])
+            seeds = max([results.get((tracker, info_hash), 0) for tracker in trackers] or [0])
+            # Reject if needed
+            if seeds < min_seeds:
+                entry.reject(reason='Tracker(s) had < %s required seeds. (%s)' % (min_seeds, seeds),
+                             remember_time=config['reject_for'])
+                # Maybe there is better match that has enough seeds
+                task.rerun()
+            else:
+                log.debug('Found %i seeds from trackers' % seeds)
 
 
 @event('plugin.register')
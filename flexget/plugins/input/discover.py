@@ -2,13 +2,17 @@ from __future__ import unicode_literals, division, absolute_import
 import datetime
 import logging
 import random
+import threading
+import time
+from Queue import Queue, Empty
 
 from sqlalchemy import Column, Integer, DateTime, Unicode, Index
 
-from flexget import options, plugin
+from flexget import logger, options, plugin
 from flexget.event import event
 from flexget.plugin import get_plugin_by_name, PluginError, PluginWarning
 from flexget import db_schema
+from flexget.utils.database import batched_delete
 from flexget.utils.tools import parse_timedelta, multiply_timedelta
 
 log = logging.getLogger('discover')
@@ -37,9 +41,9 @@ Index('ix_discover_entry_title_task', DiscoverEntry.title, DiscoverEntry.task)
 @event('manager.db_cleanup')
 def db_cleanup(session):
     value = datetime.datetime.now() - parse_timedelta('7 days')
-    for de in session.query(DiscoverEntry).filter(DiscoverEntry.last_execution <= value).all():
-        log.debug('deleting %s' % de)
-        session.delete(de)
+    result = batched_delete(session, session.query(DiscoverEntry).filter(DiscoverEntry.last_execution <= value))
+    if result:
+        log.verbose('Removed %d old discover entries.' % result)
 
 
 class Discover(object):
@@ -55,6 +59,19 @@ class Discover(object):
           - piratebay
         interval: [1 hours|days|weeks]
         ignore_estimations: [yes|no]
+
+    Searches can be run in parallel. ``threads`` limits the amount of searches running at once, and
+    ``threads_per_plugin`` the amount running at once with any single search plugin. Searches still running after
+    ``timeout`` are given up on, and the results found so far are used::
+
+      discover:
+        ...
+        threads: 8
+        threads_per_plugin: 2
+        timeout: 10 minutes
+
+    With ``skip_idle`` scheduled runs of the task are skipped entirely until the interval of some known title has
+    passed. Titles new to the inputs are then discovered on the next run which is not skipped.
     """
 
     schema = {
@@ -68,7 +85,11 @@ class Discover(object):
             }},
             'interval': {'type': 'string', 'format': 'interval', 'default': '5 hours'},
             'ignore_estimations': {'type': 'boolean', 'default': False},
-            'limit': {'type': 'integer', 'minimum': 1}
+            'limit': {'type': 'integer', 'minimum': 1},
+            'threads': {'type': 'integer', 'minimum': 1, 'default': 1},
+            'threads_per_plugin': {'type': 'integer', 'minimum': 1},
+            'timeout': {'type': 'string', 'format': 'interval'},
+            'skip_idle': {'type': 'boolean', 'default': False}
         },
         'required': ['what', 'from'],
         'additionalProperties': False
@@ -114,14 +135,15 @@ class Discover(object):
                     entry_urls.update(urls)
         return entries
 
-    def execute_searches(self, config, entries):
+    def execute_searches(self, config, entries, task=None):
         """
         :param config: Discover plugin config
         :param entries: List of pseudo entries to search
+        :param task: Current task, used for log messages of parallel searches
         :return: List of entries found from search engines listed under `from` configuration
         """
 
-        result = []
+        searches = []
         for item in config['from']:
             if isinstance(item, dict):
                 plugin_name, plugin_config = item.items()[0]
@@ -131,31 +153,115 @@ class Discover(object):
             if not callable(getattr(search, 'search')):
                 log.critical('Search plugin %s does not implement search method' % plugin_name)
             for index, entry in enumerate(entries):
-                log.verbose('Searching for `%s` with plugin `%s` (%i of %i)' %
-                            (entry['title'], plugin_name, index + 1, len(entries)))
-                try:
-                    search_results = search.search(entry, plugin_config)
-                    if not search_results:
-                        log.debug('No results from %s' % plugin_name)
-                        entry.complete()
-                        continue
-                    log.debug('Discovered %s entries from %s' % (len(search_results), plugin_name))
-                    if config.get('limit'):
-                        search_results = sorted(search_results, reverse=True,
-                                                key=lambda x: x.get('search_sort'))[:config['limit']]
-                    for e in search_results:
-                        e['discovered_from'] = entry['title']
-                        e['discovered_with'] = plugin_name
-                        e.on_complete(self.entry_complete, query=entry, search_results=search_results)
-
-                    result.extend(search_results)
-
-                except (PluginError, PluginWarning) as err:
-                    log.debug('No results from %s: %s' % (plugin_name, err))
-                    entry.complete()
+                searches.append((plugin_name, plugin_config, search, entry, index))
+
+        if config.get('threads', 1) > 1 or config.get('timeout'):
+            outcomes = self.run_parallel(config, searches, len(entries), task)
+        else:
+            outcomes = [self.run_search(search, len(entries)) for search in searches]
+
+        # Results are processed in the configured order, no matter in which order the searches finished
+        result = []
+        for (plugin_name, plugin_config, search, entry, index), (search_results, err) in zip(searches, outcomes):
+            if err:
+                log.debug('No results from %s: %s' % (plugin_name, err))
+                entry.complete()
+                continue
+            if not search_results:
+                log.debug('No results from %s' % plugin_name)
+                entry.complete()
+                continue
+            log.debug('Discovered %s entries from %s' % (len(search_results), plugin_name))
+            if config.get('limit'):
+                search_results = sorted(search_results, reverse=True,
+                                        key=lambda x: x.get('search_sort'))[:config['limit']]
+            for e in search_results:
+                e['discovered_from'] = entry['title']
+                e['discovered_with'] = plugin_name
+                e.on_complete(self.entry_complete, query=entry, search_results=search_results)
+
+            result.extend(search_results)
 
         return sorted(result, reverse=True, key=lambda x: x.get('search_sort'))
 
+    def run_search(self, search, count):
+        """
+        Runs a single search from the list built by :meth:`execute_searches`.
+
+        :return: Tuple of the search results and the error which stopped the search, if any
+        """
+        plugin_name, plugin_config, instance, entry, index = search
+        log.verbose('Searching for `%s` with plugin `%s` (%i of %i)' % (entry['title'], plugin_name, index + 1, count))
+        try:
+            return instance.search(entry, plugin_config), None
+        except (PluginError, PluginWarning) as err:
+            return None, err
+
+    def run_parallel(self, config, searches, count, task=None):
+        """
+        Runs searches in a pool of ``threads`` worker threads, with at most ``threads_per_plugin`` of them using the
+        same search plugin at once. Searches which have not finished when ``timeout`` passes are given up on.
+
+        :return: List of (results, error) tuples in the same order as `searches`
+        """
+        threads = min(config.get('threads', 1), len(searches))
+        per_plugin = config.get('threads_per_plugin', threads)
+        limits = dict((plugin_name, threading.Semaphore(per_plugin)) for plugin_name, _, _, _, _ in searches)
+        deadline = None
+        if config.get('timeout'):
+            deadline = time.time() + self.interval_total_seconds(parse_timedelta(config['timeout']))
+        outcomes = [None] * len(searches)
+        # Queue searches for one title with all plugins next to each other, so that workers waiting for the limit
+        # of a single plugin are rare
+        jobs = Queue()
+        for position in sorted(range(len(searches)), key=lambda i: searches[i][4]):
+            jobs.put(position)
+        done = threading.Condition()
+        finished = [0]
+
+        def worker():
+            logger.set_task(task.name if task else '')
+            while True:
+                if deadline and time.time() >= deadline:
+                    return
+                try:
+                    position = jobs.get_nowait()
+                except Empty:
+                    return
+                search = searches[position]
+                with limits[search[0]]:
+                    try:
+                        outcome = self.run_search(search, count)
+                    except Exception as e:
+                        log.exception('Search with plugin %s failed unexpectedly' % search[0])
+                        outcome = None, e
+                with done:
+                    outcomes[position] = outcome
+                    finished[0] += 1
+                    done.notify()
+
+        for i in xrange(threads):
+            thread = threading.Thread(target=worker, name='discover-search-%d' % i)
+            thread.daemon = True
+            thread.start()
+
+        with done:
+            while finished[0] < len(searches):
+                if deadline:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    done.wait(remaining)
+                else:
+                    done.wait(1)
+            # Copy the results while holding the lock, searches finishing late must not change them
+            outcomes = list(outcomes)
+        missing = outcomes.count(None)
+        if missing:
+            log.warning('Discover timeout of %s passed with %s of %s searches unfinished, using the results found so '
+                        'far.' % (config['timeout'], missing, len(searches)))
+        return [outcome or (None, 'timed out') for outcome in outcomes]
+
     def entry_complete(self, entry, query=None, search_results=None, **kwargs):
         if entry.accepted:
             # One of the search results was accepted, transfer the acceptance back to the query entry which generated it
@@ -207,39 +313,54 @@ class Discover(object):
         interval = parse_timedelta(config['interval'])
         if task.options.discover_now:
             log.info('Ignoring interval because of --discover-now')
+        # Load the bookkeeping for all titles of this task at once
+        known = dict((de.title, de) for de in
+                     task.session.query(DiscoverEntry).filter(DiscoverEntry.task == task.name))
+        now = datetime.datetime.now()
         result = []
+        due_times = []
         interval_count = 0
         for entry in entries:
-            de = task.session.query(DiscoverEntry).\
-                filter(DiscoverEntry.title == entry['title']).\
-                filter(DiscoverEntry.task == task.name).first()
-
+            de = known.get(entry['title'])
             if not de:
                 log.debug('%s -> No previous run recorded' % entry['title'])
-                de = DiscoverEntry(entry['title'], task.name)
+                de = known[entry['title']] = DiscoverEntry(entry['title'], task.name)
                 task.session.add(de)
             if task.options.discover_now or not de.last_execution:
                 # First time we execute (and on --discover-now) we randomize time to avoid clumping
                 delta = multiply_timedelta(interval, random.random())
-                de.last_execution = datetime.datetime.now() - delta
+                de.last_execution = now - delta
             else:
                 next_time = de.last_execution + interval
                 log.debug('last_time: %r, interval: %s, next_time: %r, ',
                           de.last_execution, config['interval'], next_time)
-                if datetime.datetime.now() < next_time:
+                if now < next_time:
                     log.debug('interval not met')
                     interval_count += 1
+                    due_times.append(next_time)
                     entry.reject('discover interval not met')
                     entry.complete()
                     continue
-                de.last_execution = datetime.datetime.now()
+                de.last_execution = now
             log.debug('interval passed')
+            due_times.append(de.last_execution + interval)
             result.append(entry)
         if interval_count:
             log.verbose('Discover interval of %s not met for %s entries. Use --discover-now to override.' %
                         (config['interval'], interval_count))
+        # Remember when the next search is due, so that idle runs can be skipped
+        task.simple_persistence['next_due'] = min(due_times) if due_times else None
         return result
 
+    @plugin.priority(255)
+    def on_task_start(self, task, config):
+        if not config.get('skip_idle') or not task.options.cron or task.options.discover_now:
+            return
+        next_due = task.simple_persistence.get('next_due')
+        if next_due and next_due > datetime.datetime.now():
+            log.verbose('No discover searches are due before %s, skipping task.' % next_due)
+            task.abort('no discover searches due', silent=True)
+
     def on_task_input(self, task, config):
         task.no_entries_ok = True
         entries = self.execute_inputs(config, task)
@@ -251,7 +372,7 @@ class Discover(object):
         entries = self.interval_expired(config, task, entries)
         if not config.get('ignore_estimations', False):
             entries = self.estimated(entries)
-        return self.execute_searches(config, entries)
+        return self.execute_searches(config, entries, task)
 
 
 @event('plugin.register')
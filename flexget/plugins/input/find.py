@@ -5,13 +5,18 @@ import os
 import re
 import sys
 
-from flexget import plugin
+from sqlalchemy import Column, Integer, Unicode, Float, or_
+
+from flexget import db_schema, plugin
 from flexget.config_schema import one_or_more
 from flexget.event import event
 from flexget.entry import Entry
+from flexget.utils import json
 from flexget.utils.cached_input import cached
+from flexget.utils.library_index import LibraryIndex
 
 log = logging.getLogger('find')
+Base = db_schema.versioned_base('find', 0)
 # Default to utf-8 if we get None from getfilesystemencoding()
 FS_ENCODING = sys.getfilesystemencoding() or 'utf-8'
 
@@ -50,6 +55,27 @@ def fsdecode(filename, replace=False):
         raise TypeError('expected bytes or str, not %s' % type(filename).__name__)
 
 
+class FindDirectory(Base):
+    """Files of a directory already emitted by an incremental find task, with their size and mtime."""
+
+    __tablename__ = 'find_directories'
+
+    id = Column(Integer, primary_key=True)
+    task = Column(Unicode, index=True)
+    path = Column(Unicode)
+    regexp = Column(Unicode)
+    mtime = Column(Float)
+    _files = Column('files', Unicode)
+
+    @property
+    def files(self):
+        return json.loads(self._files) if self._files else {}
+
+    @files.setter
+    def files(self, value):
+        self._files = unicode(json.dumps(value))
+
+
 class InputFind(object):
     """
     Uses local path content as an input, recurses through directories and creates entries for files that match mask.
@@ -69,6 +95,17 @@ class InputFind(object):
           - /storage/movies/
           - /storage/tv/
         regexp: .*\.(avi|mkv)$
+
+    With incremental enabled only files that are new or have changed size or mtime since the last successful run are
+    produced. Directories whose listing has not changed since then are skipped without looking at their files, so
+    changes to existing files are only noticed when the directory itself changes as well.
+
+    Example::
+
+      find:
+        path: /storage/downloads/
+        recursive: yes
+        incremental: yes
     """
 
     schema = {
@@ -77,7 +114,8 @@ class InputFind(object):
             'path': one_or_more({'type': 'string', 'format': 'path'}),
             'mask': {'type': 'string'},
             'regexp': {'type': 'string', 'format': 'regex'},
-            'recursive': {'type': 'boolean'}
+            'recursive': {'type': 'boolean'},
+            'incremental': {'type': 'boolean'}
         },
         'required': ['path'],
         'additionalProperties': False
@@ -89,6 +127,7 @@ class InputFind(object):
         if isinstance(config['path'], basestring):
             config['path'] = [config['path']]
         config.setdefault('recursive', False)
+        config.setdefault('incremental', False)
         # If mask was specified, turn it in to a regexp
         if config.get('mask'):
             config['regexp'] = translate(config['mask'])
@@ -96,8 +135,35 @@ class InputFind(object):
         if not config.get('regexp'):
             config['regexp'] = '.'
 
-    @cached('find')
+    def __init__(self):
+        # task name -> FindDirectory updates to store once the task has completed
+        self.pending = {}
+
+    def make_entry(self, fs_path, name, mtime):
+        e = Entry()
+        e['title'] = os.path.splitext(name)[0]
+        try:
+            e['timestamp'] = datetime.fromtimestamp(mtime)
+        except ValueError as err:
+            log.debug('Error setting timestamp for %s: %s' % (fsdecode(fs_path, replace=True), err))
+        # We are done calling os.path functions, turn filepath back into a native string
+        filepath = fsdecode(fs_path)
+        e['location'] = filepath
+        # Windows paths need an extra / prepended to them for url
+        if not filepath.startswith('/'):
+            filepath = '/' + filepath
+        e['url'] = 'file://%s' % filepath
+        return e
+
     def on_task_input(self, task, config):
+        # Incremental results depend on earlier runs, they must never be replayed from the input cache
+        if config.get('incremental'):
+            self.prepare_config(config)
+            return self.incremental_input(task, config)
+        return self.full_input(task, config)
+
+    @cached('find')
+    def full_input(self, task, config):
         self.prepare_config(config)
         entries = []
         match = re.compile(config['regexp'], re.IGNORECASE).match
@@ -115,39 +181,96 @@ class InputFind(object):
                                 (fsdecode(fs_item[0], replace=True), fsdecode(fs_path, replace=True), e))
                     continue
                 for fs_name in fs_item[2]:
-                    e = Entry()
                     # Make sure filename is decodable
                     try:
-                        fsdecode(fs_name)
+                        name = fsdecode(fs_name)
                     except UnicodeDecodeError as e:
                         log.warning('Filename `%s` in `%s` is not decodable by declared filesystem encoding `%s`. '
                                     'Either your environment does not declare the correct encoding, or this filename '
                                     'is incorrectly encoded.' %
                                     (fsdecode(fs_name, replace=True), fsdecode(fs_item[0], replace=True), FS_ENCODING))
                         continue
-
-                    e['title'] = fsdecode(os.path.splitext(fs_name)[0])
                     # If mask fails continue
-                    if not match(fsdecode(fs_name)):
+                    if not match(name):
                         continue
                     fs_filepath = os.path.join(fs_item[0], fs_name)
                     try:
-                        e['timestamp'] = datetime.fromtimestamp(os.path.getmtime(fs_filepath))
-                    except ValueError as e:
-                        log.debug('Error setting timestamp for %s: %s' % (fsdecode(fs_filepath), e))
-                    # We are done calling os.path functions, turn filepath back into a native string
-                    filepath = fsdecode(fs_filepath)
-                    e['location'] = filepath
-                    # Windows paths need an extra / prepended to them for url
-                    if not filepath.startswith('/'):
-                        filepath = '/' + filepath
-                    e['url'] = 'file://%s' % filepath
-                    entries.append(e)
+                        mtime = os.path.getmtime(fs_filepath)
+                    except OSError as e:
+                        log.debug('Cannot access %s: %s' % (fsdecode(fs_filepath, replace=True), e))
+                        continue
+                    entries.append(self.make_entry(fs_filepath, name, mtime))
                 # If we are not searching recursively, break after first (base) directory
                 if not config['recursive']:
                     break
         return entries
 
+    def incremental_input(self, task, config):
+        """Produces entries only for files which are new or changed since the last successful run."""
+        entries = []
+        match = re.compile(config['regexp'], re.IGNORECASE).match
+        index = LibraryIndex(task.session)
+        pending = self.pending[task.name] = {}
+        for path in config['path']:
+            fs_path = os.path.expanduser(fsencode(path))
+            root_key = os.path.normpath(fs_path).decode('utf-8', 'replace')
+            prefix = root_key.rstrip(os.sep) + os.sep
+            known = dict((d.path, d) for d in task.session.query(FindDirectory).
+                         filter(FindDirectory.task == task.name).
+                         filter(or_(FindDirectory.path == root_key, FindDirectory.path.like(prefix + '%'))))
+            unchanged = 0
+            for record in index.walk(fs_path, recursive=config['recursive']):
+                state = known.pop(record.path, None)
+                if state is not None and state.regexp != config['regexp']:
+                    # Files matching the new mask have not been produced yet
+                    old_files = {}
+                elif state is not None and record.mtime is not None and state.mtime == record.mtime:
+                    # Listing has not changed since the last run, no new files here
+                    unchanged += 1
+                    continue
+                else:
+                    old_files = state.files if state is not None else {}
+                files = {}
+                for name in record.files:
+                    if not match(name):
+                        continue
+                    fs_filepath = os.path.join(fsencode(record.path), fsencode(name))
+                    # A single stat per file provides both the change check and the timestamp
+                    try:
+                        stat = os.stat(fs_filepath)
+                    except OSError as e:
+                        log.warning('Cannot access `%s`, encoding broken? %s' % (os.path.join(record.path, name), e))
+                        continue
+                    files[name] = [stat.st_size, stat.st_mtime]
+                    if old_files.get(name) != files[name]:
+                        entries.append(self.make_entry(fs_filepath, name, stat.st_mtime))
+                pending[record.path] = (state, config['regexp'], record.mtime, files)
+            if config['recursive']:
+                # Directories which were not walked no longer exist
+                for record_path, state in known.iteritems():
+                    pending[record_path] = (state, None, None, None)
+            log.verbose('%s directories unchanged in %s' % (unchanged, path))
+        return entries
+
+    def on_task_learn(self, task, config):
+        """Remembers the files produced once the task has completed successfully."""
+        pending = self.pending.pop(task.name, {})
+        for path, (state, regexp, mtime, files) in pending.iteritems():
+            if files is None:
+                if state is not None:
+                    task.session.delete(state)
+                continue
+            if state is None:
+                state = FindDirectory(task=task.name, path=path)
+                task.session.add(state)
+            state.regexp = regexp
+            state.mtime = mtime
+            state.files = files
+
+    def on_task_abort(self, task, config):
+        self.pending.pop(task.name, None)
+
+
 @event('plugin.register')
 def register_plugin():
     plugin.register(InputFind, 'find', api_ver=2)
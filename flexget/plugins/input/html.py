@@ -12,9 +12,79 @@ from flexget.entry import Entry
 from flexget.utils.soup import get_soup
 from flexget.utils.cached_input import cached
 
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
 log = logging.getLogger('html')
 
 
+class Link(object):
+    """Attributes and text of a single <a> element."""
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.texts = []
+        self.has_contents = False
+
+    @property
+    def text(self):
+        return ''.join(self.texts)
+
+
+class LinkCollector(object):
+    """
+    Parser target for :mod:`lxml` collecting links while the page is being parsed, without building a tree.
+    Links are returned in document order.
+    """
+
+    def __init__(self):
+        self.links = []
+        self.open = []
+
+    def start(self, tag, attrib):
+        for link in self.open:
+            link.has_contents = True
+        if tag == 'a':
+            link = Link(dict(attrib))
+            self.links.append(link)
+            self.open.append(link)
+
+    def end(self, tag):
+        if tag == 'a' and self.open:
+            self.open.pop()
+
+    def data(self, data):
+        for link in self.open:
+            link.has_contents = True
+            link.texts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.links
+
+
+def extract_links(text):
+    """Returns list of :class:`Link` on html page *text* using lxml."""
+    parser = etree.HTMLParser(target=LinkCollector())
+    parser.feed(text)
+    return parser.close()
+
+
+def soup_links(soup):
+    """Returns list of :class:`Link` for links in a BeautifulSoup tree."""
+    links = []
+    for element in soup.find_all('a'):
+        link = Link(element.attrs)
+        link.texts.append(element.text)
+        link.has_contents = bool(element.contents)
+        links.append(link)
+    return links
+
+
 class InputHtml(object):
     """
         Parses urls from html page. Usefull on sites which have direct download
@@ -38,6 +108,7 @@ class InputHtml(object):
         advanced.accept('text', key='password')
         advanced.accept('text', key='dump')
         advanced.accept('text', key='title_from')
+        advanced.accept('choice', key='parser').accept_choices(['auto', 'lxml', 'html5lib'])
         regexps = advanced.accept('list', key='links_re')
         regexps.accept('regexp')
         advanced.accept('boolean', key='increment')
@@ -68,6 +139,9 @@ class InputHtml(object):
         if isinstance(config, basestring):
             config = {'url': config}
         get_auth_from_url()
+        config.setdefault('parser', 'auto')
+        if config['parser'] == 'lxml' and etree is None:
+            raise plugin.PluginError('lxml is not installed', log)
         return config
 
     @cached('html')
@@ -125,53 +199,56 @@ class InputHtml(object):
         log.verbose('Requesting: %s' % url)
         page = task.requests.get(url, auth=auth)
         log.verbose('Response: %s (%s)' % (page.status_code, page.reason))
-        soup = get_soup(page.text)
-
         # dump received content into a file
         if dump_name:
+            soup = get_soup(page.text)
             log.verbose('Dumping: %s' % dump_name)
             data = soup.prettify()
             with open(dump_name, 'w') as f:
                 f.write(data)
+            links = soup_links(soup)
+        elif config['parser'] == 'html5lib' or etree is None:
+            links = soup_links(get_soup(page.text))
+        else:
+            links = extract_links(page.text)
 
-        return self.create_entries(url, soup, config)
+        return self.create_entries(url, links, config)
 
     def _title_from_link(self, link, log_link):
         title = link.text
-        # longshot from next element (?)
         if not title:
-            title = link.next.string
-            if title is None:
-                log.debug('longshot failed for %s' % log_link)
-                return None
-        return title or None
+            log.debug('no text in link %s' % log_link)
+            return None
+        return title
 
     def _title_from_url(self, url):
         parts = urllib.splitquery(url[url.rfind('/') + 1:])
         title = urllib.unquote_plus(parts[0])
         return title
 
-    def create_entries(self, page_url, soup, config):
+    def create_entries(self, page_url, links, config):
 
         queue = []
+        titles = set()
         duplicates = {}
         duplicate_limit = 4
 
         def title_exists(title):
             """Helper method. Return True if title is already added to entries"""
-            for entry in queue:
-                if entry['title'] == title:
-                    return True
+            return title in titles
 
-        for link in soup.find_all('a'):
+        # get only links matching regexp
+        regexps = [re.compile(regexp) for regexp in config.get('links_re', [])]
+
+        for link in links:
             # not a valid link
-            if not link.has_attr('href'):
+            if 'href' not in link.attrs:
                 continue
             # no content in the link
-            if not link.contents:
+            if not link.has_contents:
                 continue
 
-            url = link['href']
+            url = link.attrs['href']
             log_link = url
             log_link = log_link.replace('\n', '')
             log_link = log_link.replace('\r', '')
@@ -182,25 +259,18 @@ class InputHtml(object):
             elif not url.startswith('http://') or not url.startswith('https://'):
                 url = urlparse.urljoin(page_url, url)
 
-            # get only links matching regexp
-            regexps = config.get('links_re', None)
-            if regexps:
-                accept = False
-                for regexp in regexps:
-                    if re.search(regexp, url):
-                        accept = True
-                if not accept:
-                    continue
+            if regexps and not any(regexp.search(url) for regexp in regexps):
+                continue
 
             title_from = config.get('title_from', 'auto')
             if title_from == 'url':
                 title = self._title_from_url(url)
                 log.debug('title from url: %s' % title)
             elif title_from == 'title':
-                if not link.has_attr('title'):
+                if 'title' not in link.attrs:
                     log.warning('Link `%s` doesn\'t have title attribute, ignored.' % log_link)
                     continue
-                title = link['title']
+                title = link.attrs['title']
                 log.debug('title from title: %s' % title)
             elif title_from == 'auto':
                 title = self._title_from_link(link, log_link)
@@ -226,7 +296,7 @@ class InputHtml(object):
                                  'This may not work well, you might need to configure it yourself.' % switch_to)
                         config['title_from'] = switch_to
                         # start from the beginning  ...
-                        return self.create_entries(page_url, soup, config)
+                        return self.create_entries(page_url, links, config)
             elif title_from == 'link' or title_from == 'contents':
                 # link from link name
                 title = self._title_from_link(link, log_link)
@@ -263,6 +333,7 @@ class InputHtml(object):
             entry['title'] = title
 
             queue.append(entry)
+            titles.add(title)
 
         # add from queue to task
         return queue
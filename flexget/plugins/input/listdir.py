@@ -6,6 +6,7 @@ import logging
 from flexget import plugin
 from flexget.entry import Entry
 from flexget.event import event
+from flexget.utils.library_index import LibraryIndex
 
 log = logging.getLogger('listdir')
 
@@ -32,12 +33,18 @@ class Listdir(object):
         if isinstance(config, basestring):
             config = [config]
         entries = []
+        index = LibraryIndex(task.session)
         for path in config:
             path = os.path.expanduser(path)
-            for name in os.listdir(unicode(path)):
+            names = []
+            for record in index.walk(path, recursive=False):
+                names = [(name, True) for name in record.files] + [(name, False) for name in record.dirs]
+            if not names:
+                log.verbose('Nothing found in %s' % path)
+            for name, is_file in names:
                 e = Entry()
                 filepath = os.path.join(path, name)
-                if os.path.isfile(filepath):
+                if is_file:
                     e['title'] = os.path.splitext(name)[0]
                 else:
                     e['title'] = name
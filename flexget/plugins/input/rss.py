@@ -6,6 +6,7 @@ import xml.sax
 import posixpath
 import httplib
 from datetime import datetime
+from xml.etree.cElementTree import iterparse
 
 import feedparser
 from requests import RequestException
@@ -20,6 +21,67 @@ from flexget.utils.pathscrub import pathscrub
 
 log = logging.getLogger('rss')
 
+# Maximum amount of item ids remembered for stop_after_seen
+MAX_SEEN_IDS = 1000
+
+
+def _local_name(tag):
+    """Strips the namespace from an ElementTree tag name."""
+    return tag.rsplit('}', 1)[-1].lower()
+
+
+def iter_feed_items(source):
+    """
+    Incrementally parses RSS and Atom items from a file-like object. Items are discarded from the parse tree as soon as
+    they have been yielded, so memory use does not grow with the size of the feed.
+
+    :param source: File-like object containing the feed
+    :return: Generator of :class:`feedparser.FeedParserDict` instances, similar to the entries of a parsed feed
+    :raises SyntaxError: When the feed is not valid xml
+    """
+    stack = []
+    for event, elem in iterparse(source, events=(b'start', b'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if _local_name(elem.tag) not in ('item', 'entry'):
+            continue
+        item = feedparser.FeedParserDict()
+        enclosures = []
+        for child in elem:
+            name = _local_name(child.tag)
+            text = (child.text or '').strip()
+            href = child.get('url') if name == 'enclosure' else child.get('href')
+            if href and (name == 'enclosure' or (name == 'link' and child.get('rel') == 'enclosure')):
+                enclosure = feedparser.FeedParserDict(rel='enclosure', href=href)
+                for attr in ('length', 'type'):
+                    if child.get(attr):
+                        enclosure[attr] = child.get(attr)
+                enclosures.append(enclosure)
+            elif name == 'link' and href:
+                # Atom style links
+                if child.get('rel', 'alternate') == 'alternate':
+                    item.setdefault('link', href)
+            elif name in ('pubdate', 'published', 'updated') and text:
+                item.setdefault('published_parsed', feedparser._parse_date(text))
+            elif name == 'id' and text:
+                item.setdefault('guid', text)
+            elif name in ('summary', 'content') and text:
+                item.setdefault('description', text)
+            elif name == 'author' and not text:
+                # Atom author with a name element
+                item.setdefault('author', (child.findtext('{http://www.w3.org/2005/Atom}name') or '').strip())
+            elif text:
+                item.setdefault(name, text)
+        # FeedParserDict serves `enclosures` from the links with enclosure rel
+        item['links'] = enclosures
+        # Free the memory used by this item
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+        yield item
+
 
 class InputRSS(object):
     """
@@ -84,6 +146,18 @@ class InputRSS(object):
       rss:
         url: <url>
         group_links: yes
+
+    Very large feeds can be parsed incrementally by enabling stream mode. In stream mode items
+    are created while the feed is downloaded and other_fields are matched by element name.
+    Optionally parsing can be stopped when a number of items already seen on previous runs have
+    been encountered in a row. This assumes the feed lists the newest items first.
+
+    Example::
+
+      rss:
+        url: <url>
+        stream: yes
+        stop_after_seen: 20
     """
 
     schema = {
@@ -102,6 +176,8 @@ class InputRSS(object):
             'filename': {'type': 'boolean'},
             'group_links': {'type': 'boolean', 'default': False},
             'all_entries': {'type': 'boolean', 'default': True},
+            'stream': {'type': 'boolean', 'default': False},
+            'stop_after_seen': {'type': 'integer', 'minimum': 1},
             'other_fields': {'type': 'array', 'items': {
                 # Items can be a string, or a dict with a string value
                 'type': ['string', 'object'], 'additionalProperties': {'type': 'string'}
@@ -131,8 +207,27 @@ class InputRSS(object):
         config.setdefault('group_links', False)
         # set default for all_entries
         config.setdefault('all_entries', True)
+        config.setdefault('stream', False)
         return config
 
+    def stream_items(self, task, source, config):
+        """Wraps :func:`iter_feed_items`, handling invalid content the same way as feedparser bozo errors."""
+        items = 0
+        try:
+            for item in iter_feed_items(source):
+                items += 1
+                yield item
+        except SyntaxError as e:
+            if not items:
+                if task.options.debug:
+                    log.exception(e)
+                raise plugin.PluginError('Received invalid RSS content from task %s (%s)' % (task.name, config['url']))
+            msg = 'Error %s while parsing feed, but entries were produced, ignoring the error.' % e
+            if config.get('silent', False):
+                log.debug(msg)
+            else:
+                log.verbose(msg)
+
     def process_invalid_content(self, task, data, url):
         """If feedparser reports error, save the received data and log error."""
 
@@ -216,11 +311,12 @@ class InputRSS(object):
             try:
                 # Use the raw response so feedparser can read the headers and status values
                 response = task.requests.get(config['url'], timeout=60, headers=headers, raise_status=False, auth=auth)
-                content = response.content
+                if not config['stream']:
+                    content = response.content
             except RequestException as e:
                 raise plugin.PluginError('Unable to download the RSS for task %s (%s): %s' %
                                   (task.name, config['url'], e))
-            if config.get('ascii'):
+            if config.get('ascii') and not config['stream']:
                 # convert content to ascii (cleanup), can also help with parsing problems on malformed feeds
                 content = response.text.encode('ascii', 'ignore')
 
@@ -251,6 +347,12 @@ class InputRSS(object):
                     modified = response.headers['last-modified']
                     task.simple_persistence['%s_modified' % url_hash] = modified
                     log.debug('last modified %s saved for task %s', modified, task.name)
+            if config['stream']:
+                # Let urllib3 take care of gzip encoding while we read the raw stream
+                response.raw.decode_content = True
+                source = response.raw
+        elif config['stream']:
+            source = open(config['url'], 'rb')
         else:
             # This is a file, open it
             with open(config['url'], 'rb') as f:
@@ -259,6 +361,13 @@ class InputRSS(object):
                 # Just assuming utf-8 file in this case
                 content = content.decode('utf-8', 'ignore').encode('ascii', 'ignore')
 
+        if config['stream']:
+            try:
+                return self.create_entries(task, config, self.stream_items(task, source, config), url_hash,
+                                           all_entries)
+            finally:
+                source.close()
+
         if not content:
             log.error('No data recieved for rss feed.')
             return
@@ -302,22 +411,43 @@ class InputRSS(object):
 
         log.debug('encoding %s', rss.encoding)
 
-        last_entry_id = ''
         if not all_entries:
             # Test to make sure entries are in descending order
             if rss.entries and rss.entries[0].get('published_parsed') and rss.entries[-1].get('published_parsed'):
                 if rss.entries[0]['published_parsed'] < rss.entries[-1]['published_parsed']:
                     # Sort them if they are not
                     rss.entries.sort(key=lambda x: x['published_parsed'], reverse=True)
+
+        return self.create_entries(task, config, rss.entries, url_hash, all_entries)
+
+    def create_entries(self, task, config, items, url_hash, all_entries):
+        """
+        Creates Entries from parsed feed items.
+
+        :param items: Iterable of feed items, parsed by feedparser or :func:`iter_feed_items`
+        :param url_hash: Identifies the feed in simple persistence
+        :param bool all_entries: If False, stop at the position saved on last run
+        """
+        last_entry_id = ''
+        if not all_entries:
             last_entry_id = task.simple_persistence.get('%s_last_entry' % url_hash)
 
+        # Ids of items seen on earlier runs, used to stop parsing early
+        stop_after_seen = config.get('stop_after_seen')
+        if task.config_modified or task.options.nocache or task.options.retry:
+            stop_after_seen = None
+        seen_ids = set(task.simple_persistence.get('%s_seen_ids' % url_hash, []))
+        item_ids = []
+        seen_in_row = 0
+
         # new entries to be created
         entries = []
 
         # field name for url can be configured by setting link.
         # default value is auto but for example guid is used in some feeds
         ignored = 0
-        for entry in rss.entries:
+        first_entry_id = None
+        for entry in items:
 
             # Check if title field is overridden in config
             title_field = config.get('title', 'title')
@@ -330,13 +460,29 @@ class InputRSS(object):
             # Set the title from the source field
             entry.title = entry[title_field]
 
+            entry_id = entry.title + entry.get('guid', '')
+            if first_entry_id is None:
+                first_entry_id = entry_id
+
             # Check we haven't already processed this entry in a previous run
-            if last_entry_id == entry.title + entry.get('guid', ''):
+            if last_entry_id == entry_id:
                 log.verbose('Not processing entries from last run.')
                 # Let details plugin know that it is ok if this task doesn't produce any entries
                 task.no_entries_ok = True
                 break
 
+            if len(item_ids) < MAX_SEEN_IDS:
+                item_ids.append(entry_id)
+            if entry_id in seen_ids:
+                seen_in_row += 1
+                if stop_after_seen and seen_in_row >= stop_after_seen:
+                    log.verbose('Encountered %s items from previous runs in a row, not parsing the rest of the feed.',
+                                seen_in_row)
+                    task.no_entries_ok = True
+                    break
+            else:
+                seen_in_row = 0
+
             # remove annoying zero width spaces
             entry.title = entry.title.replace(u'\u200B', u'')
 
@@ -437,9 +583,11 @@ class InputRSS(object):
             add_entry(e)
 
         # Save last spot in rss
-        if rss.entries:
+        if first_entry_id is not None:
             log.debug('Saving location in rss feed.')
-            task.simple_persistence['%s_last_entry' % url_hash] = rss.entries[0].title + rss.entries[0].get('guid', '')
+            task.simple_persistence['%s_last_entry' % url_hash] = first_entry_id
+        if config.get('stop_after_seen') and item_ids:
+            task.simple_persistence['%s_seen_ids' % url_hash] = item_ids
 
         if ignored:
             if not config.get('silent'):
@@ -1,4 +1,5 @@
 from __future__ import unicode_literals, division, absolute_import
+import mmap
 import os
 import re
 import logging
@@ -10,6 +11,129 @@ from flexget.utils.cached_input import cached
 
 log = logging.getLogger('tail')
 
+# Amount of the file decoded and scanned at once
+CHUNK_SIZE = 4 * 1024 * 1024
+# Backreferences and inline flags change meaning when patterns are joined together, string anchors when the pattern
+# is applied to a whole chunk instead of a single line
+UNCOMBINABLE = re.compile(r'\\[1-9AZ]|\(\?P=|\(\?[aiLmsux]')
+
+
+def combine(regexps):
+    """
+    Joins compiled regexps into one, which matches lines any of them could match.
+
+    :return: Compiled regexp, or None if the regexps cannot be combined.
+    """
+    if any(UNCOMBINABLE.search(regexp.pattern) for regexp in regexps):
+        return None
+    try:
+        return re.compile('|'.join('(?:%s)' % regexp.pattern for regexp in regexps), re.MULTILINE)
+    except re.error:
+        # eg. same group name used in several fields
+        return None
+
+
+class TailParser(object):
+    """
+    Collects entries from lines of text, fields of an entry may be spread over several lines.
+
+    :param entry_config: Dict of field names and regexps, first group of the match is used as the value.
+    :param format_config: Dict of field names and format strings applied to complete entries.
+    """
+
+    def __init__(self, entry_config, format_config):
+        self.fields = [(field, re.compile(regexp)) for field, regexp in entry_config.iteritems()]
+        self.scanner = combine([regexp for field, regexp in self.fields])
+        self.format_config = format_config
+        self.entries = []
+        self.entry = Entry()
+        self.used = {}
+        # Where the line holding the first field of current entry is, see `resume_position`
+        self.started = None
+
+    def add_entry(self):
+        for k, v in self.format_config.iteritems():
+            self.entry[k] = v % self.entry
+        self.entries.append(self.entry)
+
+    def feed(self, line, position):
+        """Parses single line, *position* tells where the line is for :meth:`resume_position`."""
+        emitted = False
+        for field, regexp in self.fields:
+            match = regexp.search(line)
+            if match:
+                # check if used field detected, in such case start with new entry
+                if field in self.used:
+                    if self.entry.isvalid():
+                        log.info('Found field %s again before entry was completed. '
+                                 'Adding current incomplete, but valid entry and moving to next.' % field)
+                        self.add_entry()
+                        emitted = True
+                    else:
+                        log.info('Invalid data, entry field %s is already found once. Ignoring entry.' % field)
+                    # start new entry
+                    self.entry = Entry()
+                    self.used = {}
+
+                if not self.used:
+                    # Entry starting on the same line another one was added cannot be resumed without adding the
+                    # previous one again
+                    self.started = None if emitted else position
+                # add field to entry
+                self.entry[field] = match.group(1)
+                self.used[field] = True
+                log.debug('found field: %s value: %s' % (field, self.entry[field]))
+
+            # if all fields have been found
+            if len(self.used) == len(self.fields):
+                # check that entry has at least title and url
+                if not self.entry.isvalid():
+                    log.info('Invalid data, constructed entry is missing mandatory fields (title or url)')
+                else:
+                    self.add_entry()
+                    emitted = True
+                    log.debug('Added entry %s' % self.entry)
+                # start new entry
+                self.entry = Entry()
+                self.used = {}
+
+    def scan(self, text, position):
+        """
+        Parses lines of *text*, which must end with a newline.
+
+        :param position: Passed to :meth:`feed` along with offset of the line within *text*.
+        """
+        newline = '\n' if isinstance(text, unicode) else b'\n'
+        index = 0
+        length = len(text)
+        while index < length:
+            if self.scanner:
+                # Skip lines none of the fields can match in one go
+                match = self.scanner.search(text, index)
+                if not match:
+                    break
+                index = text.rfind(newline, 0, match.start()) + 1
+                if index >= length:
+                    break
+            end = text.find(newline, index) + 1 or length
+            self.feed(text[index:end], (position, text, index))
+            index = end
+
+    def resume_position(self, end, encoding=None):
+        """
+        Returns offset where parsing should continue next time.
+
+        Lines holding fields of an incomplete entry are parsed again, the rest of the entry may not have been written
+        yet.
+
+        :param end: Offset of the end of parsed data.
+        """
+        if not self.used or not self.started:
+            return end
+        offset, text, index = self.started
+        prefix = text[:index]
+        return offset + len(prefix.encode(encoding) if encoding else prefix)
+
 
 class InputTail(object):
 
@@ -30,6 +154,10 @@ class InputTail(object):
     decoded. List of encodings
     at http://docs.python.org/library/codecs.html#standard-encodings.
 
+    Only complete lines are parsed, a line still being written is parsed on
+    next execution. When the file is replaced (eg. log rotation) it is read
+    from the beginning.
+
     Example::
 
       tail:
@@ -53,9 +181,36 @@ class InputTail(object):
         format.accept_any_key('text')
         return root
 
-    def format_entry(self, entry, d):
-        for k, v in d.iteritems():
-            entry[k] = v % entry
+    def parse(self, file, size, last_pos, parser, encoding=None):
+        """
+        Parses *file* from *last_pos* up to *size* bytes with *parser*.
+
+        :return: Offset of the end of the last complete line.
+        """
+        # Offset of mapping must be multiple of allocation granularity
+        start = last_pos - last_pos % mmap.ALLOCATIONGRANULARITY
+        data = mmap.mmap(file.fileno(), size - start, access=mmap.ACCESS_READ, offset=start)
+        try:
+            pos = last_pos - start
+            length = len(data)
+            while pos < length:
+                end = data.rfind(b'\n', pos, pos + CHUNK_SIZE) + 1
+                if not end and pos + CHUNK_SIZE < length:
+                    # Line longer than chunk
+                    end = data.find(b'\n', pos + CHUNK_SIZE) + 1
+                if not end:
+                    break
+                text = data[pos:end]
+                if encoding:
+                    try:
+                        text = text.decode(encoding)
+                    except UnicodeError:
+                        raise plugin.PluginError('Failed to decode file using %s. Check encoding.' % encoding)
+                parser.scan(text, start + pos)
+                pos = end
+            return start + pos
+        finally:
+            data.close()
 
     @cached('tail')
     def on_task_input(self, task, config):
@@ -65,8 +220,14 @@ class InputTail(object):
 
         filename = os.path.expanduser(config['file'])
         encoding = config.get('encoding', None)
-        with open(filename, 'r') as file:
-            last_pos = task.simple_persistence.setdefault(filename, 0)
+        with open(filename, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            state = task.simple_persistence.get(filename, 0)
+            # Older versions stored only the position
+            if isinstance(state, dict):
+                last_pos, inode = state['position'], state['inode']
+            else:
+                last_pos, inode = state, None
             if task.options.tail_reset == filename or task.options.tail_reset == task.name:
                 if last_pos == 0:
                     log.info('Task %s tail position is already zero' % task.name)
@@ -74,71 +235,22 @@ class InputTail(object):
                     log.info('Task %s tail position (%s) reset to zero' % (task.name, last_pos))
                     last_pos = 0
 
-            if os.path.getsize(filename) < last_pos:
+            if inode is not None and inode != stat.st_ino:
+                log.info('File has been replaced since previous execution (rotated?), reading from the beginning')
+                last_pos = 0
+            elif stat.st_size < last_pos:
                 log.info('File size is smaller than in previous execution, reseting to beginning of the file')
                 last_pos = 0
 
-            file.seek(last_pos)
-
             log.debug('continuing from last position %s' % last_pos)
 
-            entry_config = config.get('entry')
-            format_config = config.get('format', {})
-
-            # keep track what fields have been found
-            used = {}
-            entries = []
-            entry = Entry()
-
-            # now parse text
-
-            while True:
-                line = file.readline()
-                if encoding:
-                    try:
-                        line = line.decode(encoding)
-                    except UnicodeError:
-                        raise plugin.PluginError('Failed to decode file using %s. Check encoding.' % encoding)
-
-                if not line:
-                    task.simple_persistence[filename] = file.tell()
-                    break
-
-                for field, regexp in entry_config.iteritems():
-                    #log.debug('search field: %s regexp: %s' % (field, regexp))
-                    match = re.search(regexp, line)
-                    if match:
-                        # check if used field detected, in such case start with new entry
-                        if field in used:
-                            if entry.isvalid():
-                                log.info('Found field %s again before entry was completed. \
-                                          Adding current incomplete, but valid entry and moving to next.' % field)
-                                self.format_entry(entry, format_config)
-                                entries.append(entry)
-                            else:
-                                log.info('Invalid data, entry field %s is already found once. Ignoring entry.' % field)
-                            # start new entry
-                            entry = Entry()
-                            used = {}
-
-                        # add field to entry
-                        entry[field] = match.group(1)
-                        used[field] = True
-                        log.debug('found field: %s value: %s' % (field, entry[field]))
-
-                    # if all fields have been found
-                    if len(used) == len(entry_config):
-                        # check that entry has at least title and url
-                        if not entry.isvalid():
-                            log.info('Invalid data, constructed entry is missing mandatory fields (title or url)')
-                        else:
-                            self.format_entry(entry, format_config)
-                            entries.append(entry)
-                            log.debug('Added entry %s' % entry)
-                            # start new entry
-                            entry = Entry()
-                            used = {}
-        return entries
+            parser = TailParser(config.get('entry'), config.get('format', {}))
+            end = last_pos
+            if stat.st_size > last_pos:
+                end = self.parse(file, stat.st_size, last_pos, parser, encoding)
+            task.simple_persistence[filename] = {'position': parser.resume_position(end, encoding),
+                                                 'inode': stat.st_ino}
+        return parser.entries
 
 
 @event('plugin.register')
@@ -1,10 +1,12 @@
 from __future__ import unicode_literals, division, absolute_import
 import logging
+import threading
 from datetime import datetime, timedelta
+from Queue import Queue, Empty
 
 from sqlalchemy import Table, Column, Integer, Float, String, Unicode, Boolean, DateTime, delete
 from sqlalchemy.schema import ForeignKey, Index
-from sqlalchemy.orm import relation, joinedload
+from sqlalchemy.orm import relation, joinedload, subqueryload
 
 from flexget import db_schema, plugin
 from flexget.event import event
@@ -228,6 +230,13 @@ class ImdbLookup(object):
 
         imdb_lookup: yes
 
+        Movies already cached are loaded for all entries at once. With prefetch, entries missing from the cache are
+        looked up in the metainfo phase by a pool of threads, instead of one by one when their fields are accessed:
+
+        imdb_lookup:
+          prefetch: yes
+          threads: 4
+
         Also provides imdb lookup functionality to all other imdb related plugins.
     """
 
@@ -250,16 +259,112 @@ class ImdbLookup(object):
         'movie_name': 'title',
         'movie_year': 'year'}
 
+    def __init__(self):
+        # Held while lookups write to the database. Prefetch threads each have their own connection, holding the lock
+        # keeps them from locking each other out, and from creating duplicate genres, actors etc.
+        self.store_lock = threading.RLock()
+
     def validator(self):
         from flexget import validator
-        return validator.factory('boolean')
+        root = validator.factory()
+        root.accept('boolean')
+        advanced = root.accept('dict')
+        advanced.accept('boolean', key='prefetch')
+        advanced.accept('integer', key='threads')
+        return root
 
     @plugin.priority(130)
     def on_task_metainfo(self, task, config):
         if not config:
             return
+        if not isinstance(config, dict):
+            config = {}
         for entry in task.entries:
             self.register_lazy_fields(entry)
+        misses = self.lookup_cached(task.entries)
+        if config.get('prefetch') and misses:
+            self.prefetch(misses, config.get('threads', 4))
+
+    def lookup_cached(self, entries):
+        """
+        Fills entries whose movie is already cached and not expired, using one query for all of them.
+
+        :return: List of entries which still need a lookup
+        """
+        # Entries are not hashable, so they are keyed by id
+        urls = {}
+        titles = set()
+        for entry in entries:
+            url = entry.get('imdb_url', eval_lazy=False)
+            if not url and entry.get('imdb_id', eval_lazy=False):
+                url = make_url(entry['imdb_id'])
+            if url:
+                imdb_id = extract_id(url)
+                if imdb_id:
+                    urls[id(entry)] = make_url(imdb_id)
+            elif entry.get('title', eval_lazy=False):
+                titles.add(entry['title'])
+        if not urls and not titles:
+            return []
+        session = Session()
+        try:
+            searches = {}
+            titles = list(titles)
+            for i in xrange(0, len(titles), 500):
+                for result in session.query(SearchResult).filter(SearchResult.title.in_(titles[i:i + 500])):
+                    searches[result.title] = result.url
+            for entry in entries:
+                if id(entry) not in urls and searches.get(entry.get('title', eval_lazy=False)):
+                    urls[id(entry)] = searches[entry['title']]
+            movies = {}
+            wanted = list(set(urls.values()))
+            for i in xrange(0, len(wanted), 500):
+                query = session.query(Movie).filter(Movie.url.in_(wanted[i:i + 500])).\
+                    options(subqueryload('genres'), subqueryload('actors'), subqueryload('directors'),
+                            subqueryload('languages'), joinedload('languages.language'))
+                for movie in query:
+                    movies[movie.url] = movie
+            misses = []
+            for entry in entries:
+                movie = movies.get(urls.get(id(entry)))
+                if movie and not movie.expired and movie.title:
+                    log.trace('Using cached imdb details for %s' % entry['title'])
+                    entry.update_using_map(self.field_map, movie)
+                else:
+                    misses.append(entry)
+            log.debug('Found %s of %s entries from imdb cache' % (len(entries) - len(misses), len(entries)))
+            return misses
+        finally:
+            session.close()
+
+    def prefetch(self, entries, threads):
+        """Looks up `entries` using a pool of threads. Requests to imdb are still limited by the domain delay."""
+        log.verbose('Prefetching imdb details for %s entries' % len(entries))
+        jobs = Queue()
+        for entry in entries:
+            jobs.put(entry)
+
+        def worker():
+            while True:
+                try:
+                    entry = jobs.get_nowait()
+                except Empty:
+                    return
+                try:
+                    self.lookup(entry)
+                except plugin.PluginError as e:
+                    log_once(unicode(e.value).capitalize(), logger=log)
+                    entry.unregister_lazy_fields(self.field_map, self.lazy_loader)
+                except Exception as e:
+                    # Leave the lazy fields in place, they will try again if needed
+                    log.warning('Prefetching imdb details for %s failed: %s' % (entry['title'], e))
+
+        pool = [threading.Thread(target=worker, name='imdb_lookup-%d' % i) for i in xrange(min(threads, len(entries)))]
+        for thread in pool:
+            thread.daemon = True
+            thread.start()
+        for thread in pool:
+            thread.join()
 
     def register_lazy_fields(self, entry):
         entry.register_lazy_fields(self.field_map, self.lazy_loader)
@@ -384,6 +489,9 @@ class ImdbLookup(object):
                     # every run
                     result = SearchResult(entry['title'], entry['imdb_url'])
                     session.add(result)
+                    # Don't keep a write transaction open while parsing the movie page
+                    with self.store_lock:
+                        session.commit()
                     log.verbose('Found %s' % (entry['imdb_url']))
                 else:
                     log_once('IMDB lookup failed for %s' % entry['title'], log, logging.WARN)
@@ -404,12 +512,8 @@ class ImdbLookup(object):
                 req_parse = True
 
             if req_parse:
-                if movie is not None:
-                    if movie.expired:
-                        log.verbose('Movie `%s` details expired, refreshing ...' % movie.title)
-                    # Remove the old movie, we'll store another one later.
-                    session.query(MovieLanguage).filter(MovieLanguage.movie_id == movie.id).delete()
-                    session.query(Movie).filter(Movie.url == entry['imdb_url']).delete()
+                if movie is not None and movie.expired:
+                    log.verbose('Movie `%s` details expired, refreshing ...' % movie.title)
 
                 # search and store to cache
                 if 'title' in entry:
@@ -417,20 +521,25 @@ class ImdbLookup(object):
                 else:
                     log.verbose('Parsing imdb for `%s`' % entry['imdb_id'])
                 try:
-                    movie = self._parse_new_movie(entry['imdb_url'], session)
+                    parser = ImdbParser()
+                    parser.parse(entry['imdb_url'])
                 except UnicodeDecodeError:
                     log.error('Unable to determine encoding for %s. Installing chardet library may help.' %
                               entry['imdb_url'])
                     # store cache so this will not be tried again
-                    movie = Movie()
-                    movie.url = entry['imdb_url']
-                    session.add(movie)
+                    with self.store_lock:
+                        self._remove_movie(entry['imdb_url'], session)
+                        movie = Movie()
+                        movie.url = entry['imdb_url']
+                        session.add(movie)
+                        session.commit()
                     raise plugin.PluginError('UnicodeDecodeError')
                 except ValueError as e:
                     # TODO: might be a little too broad catch, what was this for anyway? ;P
                     if manager.options.debug:
                         log.exception(e)
                     raise plugin.PluginError('Invalid parameter: %s' % entry['imdb_url'], log)
+                movie = self._store_movie(parser, entry['imdb_url'], session)
 
             for att in ['title', 'score', 'votes', 'year', 'genres', 'languages', 'actors', 'directors', 'mpaa_rating']:
                 log.trace('movie.%s: %s' % (att, getattr(movie, att)))
@@ -439,19 +548,24 @@ class ImdbLookup(object):
             entry.update_using_map(self.field_map, movie)
         finally:
             log.trace('committing session')
-            session.commit()
+            with self.store_lock:
+                session.commit()
 
-    def _parse_new_movie(self, imdb_url, session):
+    def _remove_movie(self, imdb_url, session):
+        """Removes the cached movie with `imdb_url`, a new one is stored in its place."""
+        for movie_id, in session.query(Movie.id).filter(Movie.url == imdb_url):
+            session.query(MovieLanguage).filter(MovieLanguage.movie_id == movie_id).delete()
+        session.query(Movie).filter(Movie.url == imdb_url).delete()
+
+    def _store_movie(self, parser, imdb_url, session):
         """
-        Get Movie object by parsing imdb page and save movie into the database.
+        Save movie parsed from imdb page into the database, replacing the cached one.
 
+        :param parser: :class:`ImdbParser` which has parsed the page
         :param imdb_url: IMDB url
         :param session: Session to be used
         :return: Newly added Movie
         """
-        parser = ImdbParser()
-        parser.parse(imdb_url)
-        # store to database
         movie = Movie()
         movie.photo = parser.photo
         movie.title = parser.name
@@ -462,29 +576,33 @@ class ImdbLookup(object):
         movie.mpaa_rating = parser.mpaa_rating
         movie.plot_outline = parser.plot_outline
         movie.url = imdb_url
-        for name in parser.genres:
-            genre = session.query(Genre).filter(Genre.name == name).first()
-            if not genre:
-                genre = Genre(name)
-            movie.genres.append(genre)  # pylint:disable=E1101
-        for index, name in enumerate(parser.languages):
-            language = session.query(Language).filter(Language.name == name).first()
-            if not language:
-                language = Language(name)
-            movie.languages.append(MovieLanguage(language, prominence=index))
-        for imdb_id, name in parser.actors.iteritems():
-            actor = session.query(Actor).filter(Actor.imdb_id == imdb_id).first()
-            if not actor:
-                actor = Actor(imdb_id, name)
-            movie.actors.append(actor)  # pylint:disable=E1101
-        for imdb_id, name in parser.directors.iteritems():
-            director = session.query(Director).filter(Director.imdb_id == imdb_id).first()
-            if not director:
-                director = Director(imdb_id, name)
-            movie.directors.append(director)  # pylint:disable=E1101
+        with self.store_lock:
+            self._remove_movie(imdb_url, session)
+            # Load all the existing related rows with one query each
+            genres = dict((genre.name, genre) for genre in
+                          session.query(Genre).filter(Genre.name.in_(parser.genres or [''])))
+            languages = dict((language.name, language) for language in
+                             session.query(Language).filter(Language.name.in_(parser.languages or [''])))
+            actors = dict((actor.imdb_id, actor) for actor in
+                          session.query(Actor).filter(Actor.imdb_id.in_(parser.actors.keys() or [''])))
+            directors = dict((director.imdb_id, director) for director in
+                             session.query(Director).filter(Director.imdb_id.in_(parser.directors.keys() or [''])))
+            for name in parser.genres:
+                movie.genres.append(genres.get(name) or genres.setdefault(name, Genre(name)))  # pylint:disable=E1101
+            for index, name in enumerate(parser.languages):
+                language = languages.get(name) or languages.setdefault(name, Language(name))
+                movie.languages.append(MovieLanguage(language, prominence=index))
+            for imdb_id, name in parser.actors.iteritems():
+                actor = actors.get(imdb_id) or actors.setdefault(imdb_id, Actor(imdb_id, name))
+                movie.actors.append(actor)  # pylint:disable=E1101
+            for imdb_id, name in parser.directors.iteritems():
+                director = directors.get(imdb_id) or directors.setdefault(imdb_id, Director(imdb_id, name))
+                movie.directors.append(director)  # pylint:disable=E1101
             # so that we can track how long since we've updated the info later
-        movie.updated = datetime.now()
-        session.add(movie)
+            movie.updated = datetime.now()
+            session.add(movie)
+            # New rows must be visible to other threads before the lock is released
+            session.commit()
         return movie
 
 @event('plugin.register')
@@ -1,5 +1,6 @@
 from __future__ import unicode_literals, division, absolute_import
 import logging
+from functools import partial
 
 from flexget import plugin
 from flexget.event import event
@@ -21,6 +22,12 @@ class PluginThetvdbLookup(object):
 
     thetvdb_lookup: yes
 
+    With mirror enabled, all episodes of a series are loaded at once from thetvdb full series dump, and kept up to
+    date from the bulk update files, so that episode lookups can be answered locally:
+
+    thetvdb_lookup:
+      mirror: yes
+
     Primarily used for passing thetvdb information to other plugins.
     Among these is the IMDB url for the series.
 
@@ -91,24 +98,36 @@ class PluginThetvdbLookup(object):
         'tvdb_episode': 'episodenumber',
         'tvdb_ep_id': lambda ep: 'S%02dE%02d' % (ep.seasonnumber, ep.episodenumber)}
 
+    def __init__(self):
+        # Lookup functions for both mirror settings. Entries of different tasks may be evaluated at any time, so the
+        # setting is bound to the functions instead of kept on the plugin. The same objects are needed to unregister.
+        self.lookups = dict((mirror, (partial(self.lazy_series_lookup, mirror=mirror),
+                                      partial(self.lazy_episode_lookup, mirror=mirror))) for mirror in (False, True))
+
     def validator(self):
         from flexget import validator
-        return validator.factory('boolean')
+        root = validator.factory()
+        root.accept('boolean')
+        advanced = root.accept('dict')
+        advanced.accept('boolean', key='mirror')
+        return root
 
-    def lazy_series_lookup(self, entry, field):
+    def lazy_series_lookup(self, entry, field, mirror=False):
         """Does the lookup for this entry and populates the entry fields."""
         try:
-            series = lookup_series(entry.get('series_name', eval_lazy=False), tvdb_id=entry.get('tvdb_id', eval_lazy=False))
+            series = lookup_series(entry.get('series_name', eval_lazy=False), tvdb_id=entry.get('tvdb_id', eval_lazy=False),
+                                   mirror=mirror)
             entry.update_using_map(self.series_map, series)
         except LookupError as e:
             log.debug('Error looking up tvdb series information for %s: %s' % (entry['title'], e.args[0]))
-            entry.unregister_lazy_fields(self.series_map, self.lazy_series_lookup)
+            series_lookup, episode_lookup = self.lookups[mirror]
+            entry.unregister_lazy_fields(self.series_map, series_lookup)
             # Also clear episode fields, since episode lookup cannot succeed without series lookup
-            entry.unregister_lazy_fields(self.episode_map, self.lazy_episode_lookup)
+            entry.unregister_lazy_fields(self.episode_map, episode_lookup)
 
         return entry[field]
 
-    def lazy_episode_lookup(self, entry, field):
+    def lazy_episode_lookup(self, entry, field, mirror=False):
         try:
             season_offset = entry.get('thetvdb_lookup_season_offset', 0)
             episode_offset = entry.get('thetvdb_lookup_episode_offset', 0)
@@ -122,7 +141,8 @@ class PluginThetvdbLookup(object):
                 log.debug('Using offset for tvdb lookup: season: %s, episode: %s' % (season_offset, episode_offset))
 
             lookupargs = {'name': entry.get('series_name', eval_lazy=False),
-                          'tvdb_id': entry.get('tvdb_id', eval_lazy=False)}
+                          'tvdb_id': entry.get('tvdb_id', eval_lazy=False),
+                          'mirror': mirror}
             if entry['series_id_type'] == 'ep':
                 lookupargs['seasonnum'] = entry['series_season'] + season_offset
                 lookupargs['episodenum'] = entry['series_episode'] + episode_offset
@@ -134,24 +154,26 @@ class PluginThetvdbLookup(object):
             entry.update_using_map(self.episode_map, episode)
         except LookupError as e:
             log.debug('Error looking up tvdb episode information for %s: %s' % (entry['title'], e.args[0]))
-            entry.unregister_lazy_fields(self.episode_map, self.lazy_episode_lookup)
+            entry.unregister_lazy_fields(self.episode_map, self.lookups[mirror][1])
 
         return entry[field]
 
     # Run after series and metainfo series
     @plugin.priority(110)
     def on_task_metainfo(self, task, config):
-        if not config:
+        # An empty dict enables the plugin with default settings
+        if config is False:
             return
+        series_lookup, episode_lookup = self.lookups[isinstance(config, dict) and config.get('mirror', False)]
 
         for entry in task.entries:
             # If there is information for a series lookup, register our series lazy fields
             if entry.get('series_name') or entry.get('tvdb_id', eval_lazy=False):
-                entry.register_lazy_fields(self.series_map, self.lazy_series_lookup)
+                entry.register_lazy_fields(self.series_map, series_lookup)
 
                 # If there is season and ep info as well, register episode lazy fields
                 if entry.get('series_id_type') in ('ep', 'sequence', 'date'):
-                    entry.register_lazy_fields(self.episode_map, self.lazy_episode_lookup)
+                    entry.register_lazy_fields(self.episode_map, episode_lookup)
                 # TODO: lookup for 'seq' and 'date' type series
 
 
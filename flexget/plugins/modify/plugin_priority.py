@@ -35,6 +35,7 @@ class PluginPriority(object):
                 log.debug('stored %s original value %s' % (phase, event.priority))
                 event.priority = priority
                 log.debug('set %s new value %s' % (phase, priority))
+        plugin.clear_phase_cache()
         log.debug('Changed priority for: %s' % ', '.join(names))
 
     def on_task_exit(self, task, config):
@@ -47,6 +48,7 @@ class PluginPriority(object):
             originals = self.priorities[name]
             for phase, priority in originals.iteritems():
                 plugin.plugins[name].phase_handlers[phase].priority = priority
+        plugin.clear_phase_cache()
         log.debug('Restored priority for: %s' % ', '.join(names))
         self.priorities = {}
 
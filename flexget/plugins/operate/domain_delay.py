@@ -9,19 +9,54 @@ log = logging.getLogger('domain_delay')
 
 class DomainDelay(object):
     """
-    Sets a minimum interval between requests to specific domains.
+    Sets a minimum interval between requests to specific domains while the task runs. Limits apply to subdomains as
+    well, and are shared with other tasks and plugins requesting the same domains. Optionally a number of requests can
+    be allowed back to back before the interval is enforced.
 
     Example::
       domain_delay:
         mysite.com: 5 seconds
+        othersite.com:
+          delay: 2 seconds
+          burst: 5
     """
 
-    schema = {'type': 'object', 'additionalProperties': {'type': 'string', 'format': 'interval'}}
+    schema = {
+        'type': 'object',
+        'additionalProperties': {
+            'type': ['string', 'object'],
+            # Simple form, just the delay
+            'format': 'interval',
+            # Advanced form, with burst size
+            'properties': {
+                'delay': {'type': 'string', 'format': 'interval'},
+                'burst': {'type': 'integer', 'minimum': 1}
+            },
+            'required': ['delay'],
+            'additionalProperties': False
+        }
+    }
 
     def on_task_start(self, task, config):
         for domain, delay in config.iteritems():
-            log.debug('Adding minimum interval of %s between requests to %s' % (delay, domain))
-            task.requests.set_domain_delay(domain, delay)
+            burst = 1
+            if isinstance(delay, dict):
+                burst = delay.get('burst', 1)
+                delay = delay['delay']
+            log.debug('Adding minimum interval of %s (burst %s) between requests to %s' % (delay, burst, domain))
+            task.requests.set_domain_delay(domain, delay, burst)
+
+    def on_task_exit(self, task, config):
+        # Limits of the task do not outlive it, changed settings apply on the next run
+        task.requests.release_domain_delays()
+        # Task gets a new requests session on each execution, counters only cover this run
+        for domain, stats in task.requests.throttle_stats.iteritems():
+            if not stats['throttled']:
+                continue
+            log.verbose('Throttled %s of %s requests to %s, waited %.2f seconds in total' %
+                        (stats['throttled'], stats['requests'], domain, stats['wait_time']))
+
+    on_task_abort = on_task_exit
 
 
 @event('plugin.register')
@@ -33,7 +33,7 @@ class UrlRewriteBakaBT(object):
         req = urllib2.Request(url, None, txheaders)
         page = urlopener(req, log)
         try:
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
         except Exception as e:
             raise UrlRewritingError(e)
         tag_a = soup.find('a', attrs={'class': 'download_link'})
@@ -34,7 +34,7 @@ class UrlRewriteDeadFrog(object):
         req = urllib2.Request(url, None, txheaders)
         page = urlopener(req, log)
         try:
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
         except Exception as e:
             raise UrlRewritingError(e)
         down_link = soup.find('a', attrs={'href': re.compile("download/\d+/.*\.torrent")})
@@ -30,7 +30,7 @@ class UrlRewriteDivxATope(object):
     def parse_download_page(self, url):
         try:
             page = requests.get(url).content
-            soup = get_soup(page, 'html.parser')
+            soup = get_soup(page, 'html.parser', cache=True)
             download_link = soup.findAll(href=re.compile('redirect.php'))
             download_href = download_link[0]['href']
             return download_href[download_href.index('url=') + 4:]
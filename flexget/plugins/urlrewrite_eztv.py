@@ -42,7 +42,7 @@ class UrlRewriteEztv(object):
 
         log.debug('Eztv mirror `%s` chosen', url)
         try:
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
             mirrors = soup.find_all('a', attrs={'class': re.compile(r'download_\d')})
         except Exception as e:
             raise UrlRewritingError(e)
@@ -33,7 +33,7 @@ class UrlRewriteFTDB(object):
     def parse_download_page(self, page_url):
         page = urlopener(page_url, log)
         try:
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
         except Exception as e:
             raise UrlRewritingError(e)
         tag_a = soup.find("a", {"class": "dl_link"})
@@ -36,7 +36,7 @@ class UrlRewriteGoogleCse(object):
             txheaders = {'User-agent': 'Mozilla/4.0 (compatible; MSIE 5.5; Windows NT)'}
             req = urllib2.Request(entry['url'], None, txheaders)
             page = urlopener(req, log)
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
             results = soup.find_all('a', attrs={'class': 'l'})
             if not results:
                 raise UrlRewritingError('No results')
@@ -66,7 +66,7 @@ class UrlRewriteGoogle(object):
     def url_rewrite(self, task, entry):
         log.debug('Requesting %s' % entry['url'])
         page = requests.get(entry['url'])
-        soup = get_soup(page.text)
+        soup = get_soup(page.text, cache=True)
 
         for link in soup.findAll('a', attrs={'href': re.compile(r'^/url')}):
             # Extract correct url from google internal link
@@ -35,7 +35,7 @@ class UrlRewriteNewPCT(object):
     def parse_download_page(self, url):
         page = requests.get(url)
         try:
-            soup = get_soup(page.text)
+            soup = get_soup(page.text, cache=True)
         except Exception as e:
             raise UrlRewritingError(e)
         torrent_id_prog = re.compile("'torrentID': '(\d+)'")
@@ -90,7 +90,7 @@ class UrlRewritePirateBay(object):
     def parse_download_page(self, url):
         page = requests.get(url).content
         try:
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
             tag_div = soup.find('div', attrs={'class': 'download'})
             if not tag_div:
                 raise UrlRewritingError('Unable to locate download link from url %s' % url)
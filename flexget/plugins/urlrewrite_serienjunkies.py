@@ -62,7 +62,7 @@ class UrlRewriteSerienjunkies(object):
     def parse_download(self, series_url, search_title, config, entry):
         page = requests.get(series_url).content
         try:
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
         except Exception as e:
             raise UrlRewritingError(e)
 
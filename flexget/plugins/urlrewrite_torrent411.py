@@ -34,7 +34,7 @@ class UrlRewriteTorrent411(object):
         page = urlopener(url, log)
         log.debug('%s opened', url)
         try:
-            soup = get_soup(page)
+            soup = get_soup(page, cache=True)
             torrent_url = 'http://www.t411.me' + soup.find(text='Télécharger').findParent().get('href')
         except Exception as e:
             raise UrlRewritingError(e)
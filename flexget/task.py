@@ -1,9 +1,9 @@
 from __future__ import unicode_literals, division, absolute_import
 import copy
 from functools import wraps
-import hashlib
 import itertools
 import logging
+import time
 
 from sqlalchemy import Column, Unicode, String, Integer
 
@@ -12,10 +12,11 @@ from flexget import db_schema
 from flexget.entry import EntryUnicodeError
 from flexget.event import fire_event, event
 from flexget.manager import Session
-from flexget.plugin import (get_plugins, task_phases, phase_methods, PluginWarning, PluginError,
-                            DependencyError, plugins as all_plugins, plugin_schemas)
+from flexget.plugin import (get_phase_plugins, load_lazy_plugins, task_phases, phase_methods, PluginWarning,
+                            PluginError, DependencyError, plugins as all_plugins, plugin_schemas)
 from flexget.utils import requests
 from flexget.utils.simple_persistence import SimpleTaskPersistence
+from flexget.utils.tools import config_fingerprint
 
 log = logging.getLogger('task')
 Base = db_schema.versioned_base('feed', 0)
@@ -177,8 +178,13 @@ class Task(object):
         self.name = unicode(name)
         self.manager = manager
         # raw_config should remain the untouched input config
+        fingerprint = None
         if config is None:
             config = manager.config['tasks'].get(name, {})
+            fingerprint = manager.task_fingerprints.get(self.name)
+        #: Fingerprint of the config as given, before any plugin has modified it
+        self.config_fingerprint = fingerprint or config_fingerprint(config)
+        # Plugins modify the config (eg. templates, series groups), work on a copy
         self.config = copy.deepcopy(config)
         self.prepared_config = None
         if options is None:
@@ -332,9 +338,10 @@ class Task(object):
           An iterator over configured :class:`flexget.plugin.PluginInfo` instances enabled on this task.
         """
         if phase:
-            plugins = sorted(get_plugins(phase=phase), key=lambda p: p.phase_handlers[phase], reverse=True)
+            plugins = get_phase_plugins(phase)
         else:
             plugins = all_plugins.itervalues()
+        # Filtered lazily, plugins on the start phase may change the config or disable builtins
         return (p for p in plugins if p.name in self.config or p.builtin)
 
     def __run_task_phase(self, phase):
@@ -349,6 +356,11 @@ class Task(object):
         """
         if phase not in phase_methods:
             raise Exception('%s is not a valid task phase' % phase)
+        if phase != 'abort':
+            # Import plugins that were not needed before this task, the config may have changed on the start phase
+            failed = load_lazy_plugins(self.config)
+            if failed:
+                self.abort('Plugin(s) %s could not be loaded' % ', '.join(failed))
         # warn if no inputs, filters or outputs in the task
         if phase in ['input', 'filter', 'output']:
             if not self.manager.unit_test:
@@ -359,7 +371,15 @@ class Task(object):
                 else:
                     log.warning('Task doesn\'t have any %s plugins, you should add (at least) one!' % phase)
 
-        for plugin in self.plugins(phase):
+        start_time = time.time()
+        try:
+            self.__run_plugins(phase, self.plugins(phase))
+        finally:
+            log.trace('%s phase took %.3f seconds' % (phase, time.time() - start_time))
+
+    def __run_plugins(self, phase, plugins):
+        """Runs each plugin in the `plugins` chain on `phase`."""
+        for plugin in plugins:
             # Abort this phase if one of the plugins disables it
             if phase in self.disabled_phases:
                 return
@@ -499,7 +519,7 @@ class Task(object):
         self.session = Session()
 
         # Save current config hash and set config_modidied flag
-        config_hash = hashlib.md5(str(sorted(self.config.items()))).hexdigest()
+        config_hash = self.config_fingerprint
         last_hash = self.session.query(TaskConfigHash).filter(TaskConfigHash.task == self.name).first()
         if self.is_rerun:
             # Restore the config to state right after start phase
@@ -536,7 +556,8 @@ class Task(object):
                     # run all plugins with this phase
                     self.__run_task_phase(phase)
                     if phase == 'start':
-                        # Store a copy of the config state after start phase to restore for reruns
+                        # Store a copy of the config state after start phase to restore for reruns. Plugins may
+                        # still modify nested values in later phases (eg. series groups).
                         self.prepared_config = copy.deepcopy(self.config)
         except TaskAbort:
             # Roll back the session before calling abort handlers
@@ -573,11 +594,13 @@ class Task(object):
 
     def __copy__(self):
         new = type(self)(self.manager, self.name, self.config, self.options)
+        # __init__ already made a copy of our config
+        config = new.config
         # Update all the variables of new instance to match our own
         new.__dict__.update(self.__dict__)
         # Some mutable objects need to be copies
         new.options = copy.copy(self.options)
-        new.config = copy.deepcopy(self.config)
+        new.config = config
         return new
 
     copy = __copy__
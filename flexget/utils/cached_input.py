@@ -1,13 +1,12 @@
 from __future__ import unicode_literals, division, absolute_import
 import copy
 import logging
-import hashlib
 from datetime import datetime, timedelta
 from sqlalchemy import Column, Integer, String, DateTime, PickleType, Unicode, ForeignKey
 from sqlalchemy.orm import relation
 from flexget import db_schema
-from flexget.utils.database import safe_pickle_synonym
-from flexget.utils.tools import parse_timedelta, TimedDict
+from flexget.utils.database import safe_pickle_synonym, batched_delete
+from flexget.utils.tools import parse_timedelta, TimedDict, config_fingerprint
 from flexget.entry import Entry
 from flexget.event import event
 from flexget.plugin import PluginError
@@ -42,7 +41,9 @@ class InputCacheEntry(Base):
 @event('manager.db_cleanup')
 def db_cleanup(session):
     """Removes old input caches from plugins that are no longer configured."""
-    result = session.query(InputCache).filter(InputCache.added < datetime.now() - timedelta(days=7)).delete()
+    # Entries are removed through the relationship cascade
+    expired = session.query(InputCache).filter(InputCache.added < datetime.now() - timedelta(days=7))
+    result = batched_delete(session, expired, orm_delete=True)
     if result:
         log.verbose('Removed %s old input caches.' % result)
 
@@ -52,11 +53,7 @@ def config_hash(config):
     :param dict config: Configuration
     :return: MD5 hash for *config*
     """
-    if isinstance(config, dict):
-        # this does in fact support nested dicts, they're sorted too!
-        return hashlib.md5(str(sorted(config.items()))).hexdigest()
-    else:
-        return hashlib.md5(str(config)).hexdigest()
+    return config_fingerprint(config)
 
 
 class cached(object):
@@ -1,8 +1,9 @@
 from __future__ import unicode_literals, division, absolute_import
 from datetime import datetime
+import time
 
 from sqlalchemy import extract, func
-from sqlalchemy.orm import synonym
+from sqlalchemy.orm import synonym, class_mapper
 from sqlalchemy.ext.hybrid import Comparator, hybrid_property
 
 from flexget.manager import Session
@@ -32,6 +33,43 @@ def with_session(func):
     return wrapper
 
 
+def batched_delete(session, query, batch_size=None, orm_delete=False):
+    """
+    Deletes rows matching `query` in batches, committing `session` after each batch so that the database is not
+    locked for long, and other threads get a chance to run in between. Meant for `manager.db_cleanup` handlers.
+
+    :param session: Session to delete and commit with.
+    :param query: Query for a single mapped class, selecting the rows to delete.
+    :param int batch_size: Maximum number of rows deleted per transaction. Defaults to the `database` config setting.
+    :param bool orm_delete: Load and delete the objects through the session, so that relationship cascades apply.
+    :returns: Number of rows deleted.
+    """
+    if batch_size is None:
+        # Not imported at module level, manager module is still being imported when this module is loaded
+        from flexget import manager
+        batch_size = getattr(manager.manager, 'db_cleanup_batch_size', manager.DB_CLEANUP_BATCH_SIZE)
+    model = query.column_descriptions[0]['type']
+    pk = class_mapper(model).primary_key[0]
+    deleted = 0
+    while True:
+        if orm_delete:
+            items = query.limit(batch_size).all()
+            for item in items:
+                session.delete(item)
+            count = len(items)
+        else:
+            ids = [row[0] for row in query.with_entities(pk).limit(batch_size)]
+            count = len(ids)
+            if ids:
+                session.query(model).filter(pk.in_(ids)).delete(synchronize_session=False)
+        session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+        # Let other threads use the database between batches
+        time.sleep(0)
+
+
 def pipe_list_synonym(name):
     """Converts pipe separated text into a list"""
 
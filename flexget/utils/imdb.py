@@ -3,9 +3,10 @@ import difflib
 import logging
 import re
 
+from bs4 import SoupStrainer
 from bs4.element import Tag
 
-from flexget.utils.soup import get_soup
+from flexget.utils.soup import get_soup, supports_parse_only
 from flexget.utils.requests import Session
 from flexget.utils.tools import str_to_int
 
@@ -145,7 +146,9 @@ class ImdbSearch(object):
             return movies
 
         # the god damn page has declared a wrong encoding
-        soup = get_soup(page.text)
+        # only the results table is needed, tree builders supporting it can skip the rest of the page
+        parse_only = SoupStrainer('table', 'findList') if supports_parse_only() else None
+        soup = get_soup(page.text, parse_only=parse_only)
 
         section_table = soup.find('table', 'findList')
         if not section_table:
@@ -231,6 +234,7 @@ class ImdbParser(object):
         url = make_url(self.imdb_id)
         self.url = url
         page = requests.get(url)
+        # Not shared with other callers, parts of the tree are removed below
         soup = get_soup(page.text)
 
         # get photo
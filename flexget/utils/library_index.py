@@ -0,0 +1,268 @@
+"""
+Persistent index of directory listings shared by the exists family of plugins.
+
+Listings are stored in the database together with the directory mtime. A later scan only has to stat each directory,
+directories that did not change are answered from the database. Plugins can attach their own parse results to a
+directory with :meth:`LibraryIndex.parsed`, these are thrown away together with the listing when the directory changes.
+
+When the daemon runs the :mod:`~flexget.utils.library_watcher`, directories not reported changed are not even stat'ed.
+"""
+from __future__ import unicode_literals, division, absolute_import
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+import sqlalchemy
+from sqlalchemy import Column, Integer, Unicode, Float, DateTime, or_
+
+from flexget import db_schema
+from flexget.manager import Session
+from flexget.event import event
+from flexget.utils import json, library_watcher
+from flexget.utils.database import batched_delete
+
+log = logging.getLogger('library_index')
+Base = db_schema.versioned_base('library_index', 0)
+
+# A directory modified less than this many seconds before the scan is listed again next time, changes made within
+# the timestamp resolution of the filesystem would go unnoticed otherwise
+MTIME_GRACE = 2
+
+
+def _decode(name):
+    if isinstance(name, unicode):
+        return name
+    return name.decode('utf-8', 'replace')
+
+
+def _encode(name):
+    if isinstance(name, unicode):
+        return name.encode('utf-8')
+    return name
+
+
+def _dumps(value):
+    # json.dumps gives ascii str by default, columns are unicode
+    return unicode(json.dumps(value))
+
+
+class LibraryDirectory(Base):
+
+    __tablename__ = 'library_index'
+
+    id = Column(Integer, primary_key=True)
+    path = Column(Unicode, index=True)
+    mtime = Column(Float)
+    scanned = Column(DateTime)
+    _dirs = Column('dirs', Unicode)
+    _files = Column('files', Unicode)
+    _parsed = Column('parsed', Unicode)
+
+    @property
+    def dirs(self):
+        return json.loads(self._dirs) if self._dirs else []
+
+    @property
+    def files(self):
+        return json.loads(self._files) if self._files else []
+
+    @property
+    def parsed(self):
+        """Parse results attached to this directory, decoded once per loaded record."""
+        if self.__dict__.get('_parsed_cache') is None:
+            self._parsed_cache = json.loads(self._parsed) if self._parsed else {}
+        return self._parsed_cache
+
+    def set_parsed(self, key, value):
+        """Attaches parse results, they are stored by :meth:`store_parsed`."""
+        self.parsed[key] = value
+        self._parsed_changed = True
+
+    def store_parsed(self):
+        """Encodes the parse results if they have changed since loading."""
+        if self.__dict__.get('_parsed_changed'):
+            self._parsed = _dumps(self._parsed_cache)
+            self._parsed_changed = False
+
+    def update(self, mtime, dirs, files):
+        self.mtime = mtime
+        self._dirs = _dumps(dirs)
+        self._files = _dumps(files)
+        self._parsed = None
+        self._parsed_cache = None
+        self._parsed_changed = False
+
+    def __repr__(self):
+        return '<LibraryDirectory(path=%s,mtime=%s)>' % (self.path, self.mtime)
+
+
+class LibraryIndex(object):
+    """
+    Walks directory trees using the listings stored in the database where possible.
+
+    :param session: Session used to load and store the listings, caller is responsible for committing.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def _load(self, path, recursive=True):
+        """Loads stored listings for *path* and everything below it in one query."""
+        query = self.session.query(LibraryDirectory)
+        if recursive:
+            prefix = path.rstrip(os.sep) + os.sep
+            query = query.filter(or_(LibraryDirectory.path == path, LibraryDirectory.path.like(prefix + '%')))
+        else:
+            query = query.filter(LibraryDirectory.path == path)
+        return dict((record.path, record) for record in query)
+
+    def _after_commit(self, func):
+        """Calls *func* once the session commits, the watcher must not trust listings that were never stored."""
+        self.session.info.setdefault('library_watcher', []).append(func)
+
+    def _forget(self, known, path):
+        """Removes stored listings of a directory which no longer exists, along with its subdirectories."""
+        prefix = path + os.sep
+        for key in [key for key in known if key == path or key.startswith(prefix)]:
+            self.session.delete(known.pop(key))
+
+    def _list(self, known, root, record, mtime):
+        """Lists directory *root* again and stores the listing, returns the record and paths of subdirectories."""
+        key = _decode(root)
+        subdirs, files = [], []
+        for name in os.listdir(root):
+            if os.path.isdir(os.path.join(root, name)):
+                subdirs.append(os.path.join(root, name))
+            else:
+                files.append(_decode(name))
+        dirs = [_decode(os.path.basename(subdir)) for subdir in subdirs]
+        if record is None:
+            record = LibraryDirectory(path=key)
+            self.session.add(record)
+            known[key] = record
+        else:
+            for removed in set(record.dirs) - set(dirs):
+                self._forget(known, os.path.join(key, removed))
+        record.update(mtime if time.time() - mtime > MTIME_GRACE else None, dirs, files)
+        return record, subdirs
+
+    def walk(self, path, recursive=True):
+        """
+        Walks *path* top-down following symlinks, like :func:`os.walk` does.
+
+        :param path: Directory to walk.
+        :param bool recursive: If False, only *path* itself is listed.
+        :return: Generator yielding :class:`LibraryDirectory` records, `dirs` and `files` contain unicode names.
+        """
+        path = os.path.normpath(_encode(path))
+        known = self._load(_decode(path), recursive)
+        watcher = library_watcher.watcher
+        watch = generation = None
+        trusted = False
+        if watcher is not None:
+            watch = watcher.watch(path)
+            generation = watcher.begin_walk(watch)
+            trusted = watcher.is_synced(watch, _decode(path))
+        now = datetime.now()
+        listed = cached = 0
+        stack = [path]
+        while stack:
+            root = stack.pop()
+            key = _decode(root)
+            record = known.get(key)
+            dirty = watcher.get_dirty(watch, key) if watch is not None else None
+            if trusted and dirty is None and record is not None and record.mtime is not None:
+                # Watcher would have reported any change to this directory
+                cached += 1
+                subdirs = [os.path.join(root, _encode(name)) for name in record.dirs]
+            else:
+                try:
+                    mtime = os.stat(root).st_mtime
+                except OSError as e:
+                    log.debug('Cannot access %s: %s' % (key, e))
+                    continue
+                if record is not None and record.mtime == mtime:
+                    cached += 1
+                    subdirs = [os.path.join(root, _encode(name)) for name in record.dirs]
+                else:
+                    try:
+                        record, subdirs = self._list(known, root, record, mtime)
+                    except OSError as e:
+                        log.debug('Cannot list %s: %s' % (key, e))
+                        continue
+                    listed += 1
+            # Only touched once a day so that unchanged libraries do not cause writes on every run
+            if not record.scanned or record.scanned < now - timedelta(days=1):
+                record.scanned = now
+            if dirty is not None:
+                self._after_commit(partial(watcher.clear_dirty, watch, key, dirty))
+            try:
+                yield record
+            finally:
+                # Parse results added while the record was being handled are encoded once
+                record.store_parsed()
+            if recursive:
+                stack.extend(reversed(subdirs))
+        if watch is not None and recursive:
+            self._after_commit(partial(watcher.end_walk, watch, _decode(path), generation))
+        log.debug('Walked %s, listed %s directories, %s unchanged' % (_decode(path), listed, cached))
+
+    def get_parsed(self, record, key):
+        """
+        :param record: :class:`LibraryDirectory` yielded from :meth:`walk`.
+        :param key: Name of the parse results.
+        :return: Stored parse results for a directory, or None if there are none.
+        """
+        return record.parsed.get(key)
+
+    def set_parsed(self, record, key, value):
+        """
+        Stores parse results for a directory until the directory changes.
+
+        :param record: :class:`LibraryDirectory` yielded from :meth:`walk`.
+        :param key: Unique name for the parse results, must include everything affecting the outcome.
+        :param value: Json serializable parse results.
+        """
+        # A directory modified during the scan is listed again next time, results for it would be outdated
+        if record.mtime is not None:
+            record.set_parsed(key, value)
+
+    def parsed(self, record, key, func):
+        """
+        Returns parse results for a directory, cached until the directory changes.
+
+        :param record: :class:`LibraryDirectory` yielded from :meth:`walk`.
+        :param key: Unique name for the parse results, must include everything affecting the outcome of *func*.
+        :param func: Called with *record* when there are no stored results, must return json serializable value.
+        """
+        results = self.get_parsed(record, key)
+        if results is None:
+            results = func(record)
+            self.set_parsed(record, key, results)
+        return results
+
+
+@sqlalchemy.event.listens_for(Session, 'after_commit')
+def update_watcher(session):
+    """Dirty flags are cleared and walked trees marked synced only once their listings have been committed."""
+    for func in session.info.pop('library_watcher', []):
+        func()
+
+
+@sqlalchemy.event.listens_for(Session, 'after_transaction_end')
+def discard_watcher_updates(session, transaction):
+    """Listings of a session rolled back or closed without committing never reach the database, keep them dirty."""
+    # Only once the outermost transaction has ended
+    if session.transaction is None:
+        session.info.pop('library_watcher', None)
+
+
+@event('manager.db_cleanup')
+def db_cleanup(session):
+    """Removes listings of directories that have not been scanned in a month."""
+    expired = session.query(LibraryDirectory).filter(LibraryDirectory.scanned < datetime.now() - timedelta(days=30))
+    result = batched_delete(session, expired)
+    if result:
+        log.verbose('Removed %s old directory listings from library index.' % result)
@@ -0,0 +1,425 @@
+"""
+Keeps the library index up to date from filesystem events while the daemon is running.
+
+Directories reported as changed are marked dirty, :class:`~flexget.utils.library_index.LibraryIndex` then only has to
+look at those instead of stat'ing the whole tree on every run. Uses inotify on Linux, on other platforms, when the
+kernel runs out of inotify watches or when a directory cannot be watched, directory mtimes are polled in the
+background instead.
+
+Enabled from the config::
+
+  library_watcher: yes
+
+  library_watcher:
+    method: poll
+    poll_interval: 10 minutes
+"""
+from __future__ import unicode_literals, division, absolute_import
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from flexget.config_schema import register_config_key
+from flexget.event import event
+from flexget.utils.tools import parse_timedelta
+
+log = logging.getLogger('library_watcher')
+
+# The running watcher, only set while the daemon is running with the watcher enabled
+watcher = None
+
+# inotify constants from <sys/inotify.h>
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Only events changing the directory listing are interesting
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct(str('iIII'))
+
+# How often watcher health is logged
+HEALTH_INTERVAL = 3600
+
+schema = {
+    'oneOf': [
+        {'type': 'boolean'},
+        {
+            'type': 'object',
+            'properties': {
+                'method': {'type': 'string', 'enum': ['auto', 'inotify', 'poll']},
+                'poll_interval': {'type': 'string', 'format': 'interval'}
+            },
+            'additionalProperties': False
+        }
+    ]
+}
+
+
+def _key(path):
+    """Returns the unicode form of *path* used as key in the library index."""
+    if isinstance(path, unicode):
+        return path
+    return path.decode('utf-8', 'replace')
+
+
+def load_libc():
+    """Returns libc with the inotify functions, or None when inotify is not available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library(str('c')) or str('libc.so.6'), use_errno=True)
+        for name in ('inotify_init1', 'inotify_add_watch', 'inotify_rm_watch'):
+            getattr(libc, name)
+    except (OSError, AttributeError) as e:
+        log.debug('inotify not available: %s' % e)
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class WatchedRoot(object):
+    """State of a single watched directory tree. Attributes are protected by the watcher lock."""
+
+    def __init__(self, path, method):
+        self.path = path
+        self.key = _key(path)
+        self.method = method
+        self.fd = None
+        # inotify watch descriptor -> directory
+        self.watches = {}
+        # polling: directory -> (mtime, subdirectories)
+        self.mtimes = {}
+        self.next_poll = 0
+        # directories whose listing has changed since they were last walked -> number of the last event for them
+        self.dirty = {}
+        # paths walked completely since the watch was set up, their stored listings can be trusted
+        self.synced = set()
+        # incremented whenever events may have been lost, walks in progress can then not be trusted either
+        self.generation = 0
+        self.ready = False
+        self.overflows = 0
+        self.events = 0
+        self.last_event = None
+        self.error = None
+
+    def covers(self, key):
+        return key == self.key or key.startswith(self.key.rstrip(os.sep) + os.sep)
+
+    def status(self):
+        return {
+            'path': self.key,
+            'method': self.method,
+            'ready': self.ready,
+            'watches': len(self.watches) if self.method == 'inotify' else len(self.mtimes),
+            'dirty': len(self.dirty),
+            'overflows': self.overflows,
+            'events': self.events,
+            'last_event': self.last_event,
+            'error': self.error
+        }
+
+
+class LibraryWatcher(threading.Thread):
+    """
+    Watches directory trees walked by the library index.
+
+    Trees are registered by the index the first time they are walked. Once watches are in place and the tree has
+    been walked completely once more, the index can skip every directory not reported dirty.
+
+    :param string method: `inotify`, `poll` or `auto` to use inotify when available.
+    :param int poll_interval: Seconds between polls of trees that are not watched with inotify.
+    """
+
+    def __init__(self, method='auto', poll_interval=300):
+        super(LibraryWatcher, self).__init__(name='library_watcher')
+        self.daemon = True
+        self.lock = threading.Lock()
+        self.roots = []
+        self.pending = []
+        self.poll_interval = poll_interval
+        self.libc = None
+        if method != 'poll':
+            self.libc = load_libc()
+            if not self.libc and method == 'inotify':
+                log.warning('inotify is not available on this system, polling for library changes instead.')
+        self._shutdown = threading.Event()
+        self._next_health = time.time() + HEALTH_INTERVAL
+
+    def stop(self):
+        self._shutdown.set()
+
+    def watch(self, path):
+        """
+        Returns the :class:`WatchedRoot` covering *path*, registering *path* to be watched if there is none yet.
+
+        :param path: Normalized bytestring path of a directory.
+        """
+        key = _key(path)
+        with self.lock:
+            for root in self.roots:
+                if root.covers(key):
+                    return root
+            root = WatchedRoot(path, 'inotify' if self.libc else 'poll')
+            self.roots.append(root)
+            self.pending.append(root)
+        log.debug('Watching %s for changes using %s' % (key, root.method))
+        return root
+
+    def begin_walk(self, root):
+        """Returns generation of *root* to be passed to :meth:`end_walk`, or None if the root is not ready yet."""
+        with self.lock:
+            return root.generation if root.ready else None
+
+    def end_walk(self, root, key, generation):
+        """Marks *key* as synced if no events were lost while it was being walked."""
+        if generation is None:
+            return
+        with self.lock:
+            if root.generation == generation:
+                root.synced.add(key)
+
+    def is_synced(self, root, key):
+        with self.lock:
+            if not root.ready:
+                return False
+            return any(key == synced or key.startswith(synced.rstrip(os.sep) + os.sep) for synced in root.synced)
+
+    def get_dirty(self, root, key):
+        """
+        Returns a marker if directory *key* has changed since it was last walked, None otherwise. The flag stays set
+        until the marker is passed to :meth:`clear_dirty`, once the new listing has been stored.
+        """
+        with self.lock:
+            return root.dirty.get(key)
+
+    def clear_dirty(self, root, key, marker):
+        """Clears the dirty flag of *key* unless the directory has changed again after *marker* was returned."""
+        with self.lock:
+            if root.dirty.get(key) == marker:
+                del root.dirty[key]
+
+    def status(self):
+        with self.lock:
+            return [root.status() for root in self.roots]
+
+    def log_health(self):
+        for status in self.status():
+            if status['error']:
+                log.warning('Library watcher for %(path)s: %(error)s' % status)
+            log.verbose('Library watcher for %(path)s: %(method)s, ready: %(ready)s, %(watches)s directories, '
+                        '%(events)s events, %(overflows)s overflows, %(dirty)s dirty' % status)
+
+    def _lost_events(self, root, reason):
+        """
+        Called with the lock held when changes may have been missed. Watches are set up again, and the next walk
+        after that rescans the whole tree.
+        """
+        root.generation += 1
+        root.synced.clear()
+        root.dirty.clear()
+        if root.ready:
+            root.ready = False
+            self.pending.append(root)
+        log.verbose('%s, %s will be rescanned on next use.' % (reason, root.key))
+
+    def _mark_dirty(self, root, path):
+        with self.lock:
+            root.events += 1
+            root.dirty[_key(path)] = root.events
+            root.last_event = time.time()
+
+    def _setup(self, root):
+        """Adds inotify watches for a tree, or takes the initial mtimes when polling."""
+        if root.method == 'inotify':
+            try:
+                # Watches are added again after lost events, existing ones are just updated
+                if root.fd is None:
+                    root.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+                if root.fd < 0:
+                    raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+                self._add_watches(root, root.path)
+            except OSError as e:
+                if root.fd is not None and root.fd >= 0:
+                    os.close(root.fd)
+                root.fd = None
+                root.watches = {}
+                if e.errno == errno.ENOSPC:
+                    root.error = 'ran out of inotify watches, increase fs.inotify.max_user_watches'
+                else:
+                    root.error = 'inotify failed: %s' % e
+                log.warning('Cannot watch %s (%s), polling for changes instead.' % (root.key, root.error))
+                root.method = 'poll'
+        if root.method == 'poll':
+            self._poll(root)
+            root.next_poll = time.time() + self.poll_interval
+        with self.lock:
+            root.ready = True
+        log.debug('Watches for %s ready' % root.key)
+
+    def _add_watches(self, root, path):
+        """Adds watches for *path* and all directories below it, new directories are marked dirty."""
+        for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+            wd = self.libc.inotify_add_watch(root.fd, dirpath, WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, os.strerror(error))
+                if error not in (errno.ENOENT, errno.ENOTDIR):
+                    # Changes to the directory would go unnoticed, the tree is polled instead
+                    raise OSError(error, os.strerror(error), dirpath)
+                # Directory vanished, parent gets an event for it
+                log.debug('Cannot watch %s: %s' % (_key(dirpath), os.strerror(error)))
+                continue
+            root.watches[wd] = dirpath
+            if root.ready:
+                self._mark_dirty(root, dirpath)
+
+    def _read(self, root):
+        """Processes pending inotify events of a tree."""
+        try:
+            data = os.read(root.fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                with self.lock:
+                    root.overflows += 1
+                    self._lost_events(root, 'inotify event queue overflowed')
+                continue
+            path = root.watches.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                del root.watches[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # Parent directory gets its own event, if this is the root it needs to be watched again
+                if path == root.path:
+                    with self.lock:
+                        self._lost_events(root, 'Watched directory disappeared')
+                continue
+            self._mark_dirty(root, path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._add_watches(root, os.path.join(path, name))
+                except OSError as e:
+                    # Setting the watches up again falls back to polling if the limit is still hit
+                    with self.lock:
+                        self._lost_events(root, 'Could not watch new directories (%s)' % e)
+
+    def _poll(self, root):
+        """Stats every directory of a tree, directories with changed mtime are marked dirty."""
+        seen = set()
+        stack = [root.path]
+        while stack:
+            path = stack.pop()
+            seen.add(path)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            known = root.mtimes.get(path)
+            if known and known[0] == mtime:
+                subdirs = known[1]
+            else:
+                try:
+                    subdirs = [os.path.join(path, name) for name in os.listdir(path)
+                               if os.path.isdir(os.path.join(path, name))]
+                except OSError:
+                    continue
+                root.mtimes[path] = (mtime, subdirs)
+                if root.ready:
+                    self._mark_dirty(root, path)
+            stack.extend(subdirs)
+        for path in set(root.mtimes) - seen:
+            del root.mtimes[path]
+
+    def run(self):
+        try:
+            while not self._shutdown.is_set():
+                with self.lock:
+                    pending, self.pending = self.pending, []
+                for root in pending:
+                    self._setup(root)
+                with self.lock:
+                    roots = list(self.roots)
+                watched = dict((root.fd, root) for root in roots if root.fd is not None)
+                if watched:
+                    try:
+                        readable = select.select(list(watched), [], [], 1)[0]
+                    except select.error as e:
+                        if e.args[0] != errno.EINTR:
+                            raise
+                        readable = []
+                    for fd in readable:
+                        self._read(watched[fd])
+                else:
+                    self._shutdown.wait(1)
+                now = time.time()
+                for root in roots:
+                    if root.method == 'poll' and root.ready and now >= root.next_poll:
+                        self._poll(root)
+                        root.next_poll = time.time() + self.poll_interval
+                if now >= self._next_health:
+                    self._next_health = now + HEALTH_INTERVAL
+                    self.log_health()
+        except Exception as e:
+            log.error('Library watcher crashed, changes are no longer tracked: %s' % e)
+            log.debug('Library watcher crashed', exc_info=True)
+        finally:
+            with self.lock:
+                for root in self.roots:
+                    root.ready = False
+                    if root.fd is not None:
+                        os.close(root.fd)
+                        root.fd = None
+
+
+@event('manager.daemon.started')
+def start_watcher(manager):
+    global watcher
+    config = manager.config.get('library_watcher')
+    if not config:
+        return
+    if not isinstance(config, dict):
+        config = {}
+    poll_interval = parse_timedelta(config.get('poll_interval', '5 minutes'))
+    poll_interval = poll_interval.days * 86400 + poll_interval.seconds
+    watcher = LibraryWatcher(config.get('method', 'auto'), poll_interval)
+    watcher.start()
+    log.verbose('Library watcher started.')
+
+
+@event('manager.shutdown')
+def stop_watcher(manager):
+    global watcher
+    if watcher is not None:
+        watcher.log_health()
+        watcher.stop()
+        watcher = None
+
+
+@event('config.register')
+def register_config():
+    register_config_key('library_watcher', schema)
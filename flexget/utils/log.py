@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 from sqlalchemy import Column, Integer, String, DateTime, Index
 from flexget import db_schema
 from flexget.utils.sqlalchemy_utils import table_schema
+from flexget.utils.database import batched_delete
 from flexget.manager import Session
 from flexget.event import event
 from flexget import logger as f_logger
@@ -46,7 +47,7 @@ def purge(session):
     """Purge old messages from database"""
     old = datetime.now() - timedelta(days=365)
 
-    result = session.query(LogMessage).filter(LogMessage.added < old).delete()
+    result = batched_delete(session, session.query(LogMessage).filter(LogMessage.added < old))
     if result:
         log.verbose('Purged %s entries from log_once table.' % result)
 
@@ -2,7 +2,9 @@ from __future__ import unicode_literals, division, absolute_import
 import urllib2
 import time
 import logging
-from datetime import timedelta, datetime
+import threading
+import weakref
+from datetime import timedelta
 from urlparse import urlparse
 import requests
 # Allow some request objects to be imported from here instead of requests
@@ -45,6 +47,176 @@ def set_unresponsive(url):
     unresponsive_hosts[host] = True
 
 
+class TokenBucket(object):
+    """
+    Thread safe token bucket used to rate limit requests to a domain.
+
+    Tokens are reserved rather than waited for while holding the lock, so callers limited by the same bucket queue up
+    behind each other without blocking requests to other domains.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param float rate: Number of tokens added per second
+        :param int burst: Maximum number of tokens that can be stored, i.e. requests allowed back to back
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_update = time.time()
+        self.lock = threading.Lock()
+        # Statistics about throttling done by this bucket
+        self.requests = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+
+    def reserve(self):
+        """
+        Takes a token from the bucket.
+
+        :return: Number of seconds the caller must wait before the reserved token may be used
+        :rtype: float
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_update) * self.rate)
+            self.last_update = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.requests += 1
+            if wait:
+                self.throttled += 1
+                self.wait_time += wait
+            return wait
+
+    def update(self, rate, burst):
+        """Changes the limits of this bucket, without losing the state of already reserved tokens."""
+        with self.lock:
+            self.rate = rate
+            self.burst = burst
+            self.tokens = min(self.tokens, burst)
+
+
+class _Owner(object):
+    """Owner of limits which are not tied to a session, instances can be weakly referenced unlike `object()`."""
+
+
+class DomainLimiter(object):
+    """
+    Keeps a :class:`TokenBucket` for each rate limited domain. Buckets are matched by domain suffix, so a limit on
+    `example.com` also applies to `www.example.com`. A single instance is shared by all :class:`Session` objects, so
+    concurrent requests to a domain respect a single limit.
+
+    Each limit belongs to an owner, usually the session which set it. When several owners limit the same domain the
+    most restrictive limit applies, limits of an owner are dropped again when it releases them or is garbage collected.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        # domain -> {owner: (rate, burst)}
+        self.limits = {}
+        self.lock = threading.Lock()
+        self.default_owner = _Owner()
+
+    def set_limit(self, domain, delay, burst=1, owner=None):
+        """
+        Registers a minimum interval between requests to `domain`, replacing any previous limit of the same owner.
+
+        :param domain: The domain to limit
+        :param delay: Minimum average interval between requests, timedelta or string like '3 seconds'. Zero removes
+            the limit of the owner.
+        :param int burst: Number of requests that may be done back to back before the interval is enforced
+        :param owner: Object owning the limit, limits without owner are kept for the lifetime of the limiter
+        """
+        delay = parse_timedelta(delay)
+        seconds = delay.days * 86400 + delay.seconds + delay.microseconds / 1000000
+        domain = domain.lower().strip('.')
+        owner = owner if owner is not None else self.default_owner
+        with self.lock:
+            limits = self.limits.setdefault(domain, weakref.WeakKeyDictionary())
+            if seconds <= 0:
+                limits.pop(owner, None)
+            else:
+                limits[owner] = (1 / seconds, burst)
+            self._refresh(domain)
+
+    def release(self, owner):
+        """Removes all limits of `owner`."""
+        with self.lock:
+            for domain, limits in self.limits.items():
+                if limits.pop(owner, None) is not None:
+                    self._refresh(domain)
+
+    def _refresh(self, domain):
+        """Applies the most restrictive limit of the current owners to the bucket of `domain`, lock must be held."""
+        limits = self.limits.get(domain)
+        if not limits:
+            self.limits.pop(domain, None)
+            self.buckets.pop(domain, None)
+            return None
+        # Lowest rate, and for equal rates the smallest burst
+        rate, burst = min(limits.values())
+        bucket = self.buckets.get(domain)
+        if bucket is None:
+            bucket = self.buckets[domain] = TokenBucket(rate, burst)
+        elif (bucket.rate, bucket.burst) != (rate, burst):
+            bucket.update(rate, burst)
+        return bucket
+
+    def get_bucket(self, url):
+        """
+        :return: Tuple of (domain, bucket) limiting requests to `url`, or (None, None) if the url is not limited
+        """
+        host = (urlparse(url).hostname or '').lower()
+        parts = host.split('.')
+        with self.lock:
+            # Try the most specific suffix first, www.example.com, then example.com, then com
+            for i in range(len(parts)):
+                domain = '.'.join(parts[i:])
+                if domain in self.limits:
+                    # Owners may have been garbage collected since the bucket was last updated
+                    bucket = self._refresh(domain)
+                    if bucket is not None:
+                        return domain, bucket
+        return None, None
+
+    def wait(self, url):
+        """
+        Blocks until a request to `url` is allowed.
+
+        :return: Tuple of the limited domain, or None if the url is not limited, and number of seconds waited
+        """
+        domain, bucket = self.get_bucket(url)
+        if bucket is None:
+            return None, 0.0
+        wait = bucket.reserve()
+        if wait:
+            log.debug('Waiting %.2f seconds until next request to %s' % (wait, domain))
+            time.sleep(wait)
+        return domain, wait
+
+    def stats(self):
+        """
+        :return: Dict mapping each limited domain to a dict with `requests`, `throttled` and `wait_time` (seconds)
+        """
+        with self.lock:
+            buckets = self.buckets.items()
+        return dict((domain, {'requests': b.requests, 'throttled': b.throttled, 'wait_time': b.wait_time})
+                    for domain, b in buckets)
+
+
+# Rate limits are shared by all sessions, so that concurrent requests to a domain respect a single limit
+domain_limiter = DomainLimiter()
+
+
+def set_domain_delay(domain, delay, burst=1):
+    """
+    Registers a minimum interval between requests to `domain` for all sessions, which is kept for the lifetime of the
+    process. See :meth:`DomainLimiter.set_limit`
+    """
+    domain_limiter.set_limit(domain, delay, burst)
+
+
 def _wrap_urlopen(url, timeout=None):
     """
     Handles alternate schemes using urllib, wraps the response in a requests.Response
@@ -82,8 +254,10 @@ class Session(requests.Session):
         self.timeout = timeout
         self.stream = True
         self.adapters['http://'].max_retries = max_retries
-        # Stores min intervals between requests for certain sites
-        self.domain_delay = {}
+        # Minimum intervals between requests to certain sites are shared by all sessions
+        self.domain_limiter = domain_limiter
+        # Throttling done for requests of this session, domain -> dict like :meth:`DomainLimiter.stats`
+        self.throttle_stats = {}
 
     def add_cookiejar(self, cookiejar):
         """
@@ -94,45 +268,50 @@ class Session(requests.Session):
         for cookie in cookiejar:
             self.cookies.set_cookie(cookie)
 
-    def set_domain_delay(self, domain, delay):
+    def set_domain_delay(self, domain, delay, burst=1):
         """
-        Registers a minimum interval between requests to `domain`
+        Registers a minimum interval between requests to `domain`. Limits are shared between all sessions, the limit
+        set by this session replaces its previous one and is dropped by :meth:`release_domain_delays`, or once the
+        session is garbage collected.
 
         :param domain: The domain to set the interval on
         :param delay: The amount of time between requests, can be a timedelta or string like '3 seconds'
+        :param burst: Number of requests allowed back to back before the interval is enforced
         """
-        self.domain_delay[domain] = {'delay': parse_timedelta(delay)}
+        self.domain_limiter.set_limit(domain, delay, burst, owner=self)
+
+    def release_domain_delays(self):
+        """Drops all limits set through :meth:`set_domain_delay` of this session."""
+        self.domain_limiter.release(self)
 
     def request(self, method, url, *args, **kwargs):
         """
         Does a request, but raises Timeout immediately if site is known to timeout, and records sites that timeout.
-        Also raises errors getting the content by default.
+        Also raises errors getting the content by default. The number of seconds spent waiting for the domain rate
+        limit is stored in the `throttle_wait` attribute of the response.
         """
 
         # Raise Timeout right away if site is known to timeout
         if is_unresponsive(url):
             raise requests.Timeout('Requests to this site have timed out recently. Waiting before trying again.')
 
-        # Check if we need to add a delay before request to this site
-        for domain, domain_dict in self.domain_delay.iteritems():
-            if domain in url:
-                next_req = domain_dict.get('next_req')
-                if next_req and datetime.now() < next_req:
-                    wait_time = next_req - datetime.now()
-                    seconds = wait_time.seconds + (wait_time.microseconds / 1000000.0)
-                    log.debug('Waiting %.2f seconds until next request to %s' % (seconds, domain))
-                    # Sleep until it is time for the next request
-                    time.sleep(seconds)
-                # Record the next allowable request time for this domain
-                domain_dict['next_req'] = datetime.now() + domain_dict['delay']
-                break
+        # Wait until the rate limit for this site allows another request
+        domain, waited = self.domain_limiter.wait(url)
+        if domain is not None:
+            stats = self.throttle_stats.setdefault(domain, {'requests': 0, 'throttled': 0, 'wait_time': 0.0})
+            stats['requests'] += 1
+            if waited:
+                stats['throttled'] += 1
+                stats['wait_time'] += waited
 
         kwargs.setdefault('timeout', self.timeout)
         raise_status = kwargs.pop('raise_status', True)
 
         # If we do not have an adapter for this url, pass it off to urllib
         if not any(url.startswith(adapter) for adapter in self.adapters):
-            return _wrap_urlopen(url, timeout=kwargs['timeout'])
+            result = _wrap_urlopen(url, timeout=kwargs['timeout'])
+            result.throttle_wait = waited
+            return result
 
         try:
             result = requests.Session.request(self, method, url, *args, **kwargs)
@@ -141,6 +320,7 @@ class Session(requests.Session):
             set_unresponsive(url)
             raise
 
+        result.throttle_wait = waited
         if raise_status:
             result.raise_for_status()
 
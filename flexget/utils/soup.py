@@ -1,5 +1,11 @@
 from __future__ import unicode_literals, division, absolute_import
-from bs4 import BeautifulSoup
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
 
 # Hack, hide DataLossWarnings
 # Based on html5lib code namespaceHTMLElements=False should do it, but nope ...
@@ -8,6 +14,100 @@ import warnings
 from html5lib.constants import DataLossWarning
 warnings.simplefilter('ignore', DataLossWarning)
 
+from flexget.config_schema import register_config_key
+from flexget.event import event
+
+# Tree builders, fastest first
+PARSERS = ['lxml', 'html5lib', 'html.parser']
+# Used when caller does not ask for a specific tree builder, set from the `html_parser` config key
+default_parser = 'html5lib'
+
+# Parsed documents of callers asking for it are kept around briefly, so that e.g. urlrewriters resolving the same page
+# again on a task rerun only parse it once
+CACHE_TIME = 60
+CACHE_SIZE = 20
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_parser(parser=None):
+    """
+    Returns name of the tree builder to use.
+
+    :param parser: Name of tree builder, `auto` picks the fastest one installed. Defaults to `html_parser` setting.
+    """
+    parser = parser or default_parser
+    if parser == 'auto':
+        for name in PARSERS:
+            if builder_registry.lookup(name):
+                return name
+    return parser
+
+
+def supports_parse_only(parser=None):
+    """
+    Returns whether the tree builder can build only parts of a document, html5lib always parses the whole document.
+
+    :param parser: Name of tree builder, see :func:`get_parser`.
+    """
+    builder = builder_registry.lookup(get_parser(parser))
+    return builder is not None and 'html5lib' not in builder.features
+
+
+def _prune(now):
+    """Drops expired and surplus trees, oldest first. Called with the cache lock held."""
+    while len(_cache) > CACHE_SIZE or (_cache and _cache.itervalues().next()[0] <= now - CACHE_TIME):
+        _cache.popitem(last=False)
+
+
+def get_soup(obj, parser=None, parse_only=None, cache=False):
+    """
+    Parses html into a BeautifulSoup tree.
+
+    :param obj: Html as a string or a file-like object.
+    :param parser: Tree builder to use, see :func:`get_parser`.
+    :param parse_only: :class:`bs4.SoupStrainer`, or tag name, to only build the matching parts of the tree.
+        Only for tree builders supporting it, see :func:`supports_parse_only`.
+    :param bool cache: Share the tree with other callers parsing an identical document within a minute. Only for
+        callers which never modify the tree.
+    """
+    if hasattr(obj, 'read'):
+        obj = obj.read()
+    parser = get_parser(parser)
+    if parse_only is not None and not isinstance(parse_only, SoupStrainer):
+        parse_only = SoupStrainer(parse_only)
+    now = time.time()
+    with _cache_lock:
+        _prune(now)
+    # Strainers cannot be compared, only complete documents are cached
+    if not cache or parse_only is not None:
+        return BeautifulSoup(obj, parser, parse_only=parse_only)
+
+    digest = hashlib.md5(obj.encode('utf-8') if isinstance(obj, unicode) else obj).hexdigest()
+    key = (digest, parser)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key][1]
+    soup = BeautifulSoup(obj, parser)
+    with _cache_lock:
+        _cache[key] = (now, soup)
+        _prune(now)
+    return soup
+
+
+@event('manager.execute.completed')
+def clear_cache(manager):
+    """Trees are not kept while the daemon is idle between executions."""
+    with _cache_lock:
+        _cache.clear()
+
+
+@event('manager.config_updated')
+def set_default_parser(manager):
+    global default_parser
+    default_parser = manager.config.get('html_parser', 'html5lib')
+
 
-def get_soup(obj, parser='html5lib'):
-    return BeautifulSoup(obj, parser)
+@event('config.register')
+def register_config():
+    register_config_key('html_parser', {'type': 'string', 'enum': ['auto'] + PARSERS})
@@ -3,6 +3,8 @@
 from __future__ import unicode_literals, division, absolute_import, print_function
 import urllib2
 import httplib
+import hashlib
+import json
 import os
 import socket
 import time
@@ -313,6 +315,15 @@ def console(text):
     print(unicode(text).encode(io_encoding, 'replace'))
 
 
+def config_fingerprint(config):
+    """
+    :param config: Configuration, made up of dicts, lists and scalar values
+    :return: MD5 hash of the canonical form of *config*, independent of dict ordering at any depth
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(',', ':'), default=unicode)
+    return hashlib.md5(canonical.encode('utf-8')).hexdigest()
+
+
 def parse_timedelta(value):
     """Parse a string like '5 days' into a timedelta object. Also allows timedeltas to pass through."""
     if isinstance(value, timedelta):
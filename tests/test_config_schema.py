@@ -149,3 +149,32 @@ class TestSchemaValidator(FlexGetBase):
         config = {"p": "foo"}
         config_schema.process_config(config, schema)
         assert config["p"] == "foo"
+
+    def test_task_errors_have_full_path(self):
+        config = {'tasks': {'good': {'accept_all': True}, 'bad': {'accept_all': 'aoeu'}}}
+        errors = config_schema.process_config(config)
+        assert [e.json_pointer for e in errors] == ['/tasks/bad/accept_all']
+        # The unchanged invalid task must be validated again and give the same errors
+        errors = config_schema.process_config({'tasks': {'bad': {'accept_all': 'aoeu'}}})
+        assert [e.json_pointer for e in errors] == ['/tasks/bad/accept_all']
+
+    def test_cached_task_config_is_copied(self):
+        first = {'tasks': {'a': {'accept_all': True}, 'b': {'accept_all': True}}}
+        assert not config_schema.process_config(first)
+        second = {'tasks': {'a': {'accept_all': True}}}
+        assert not config_schema.process_config(second)
+        assert second['tasks']['a'] == first['tasks']['a']
+        assert second['tasks']['a'] is not first['tasks']['a']
+        assert first['tasks']['a'] is not first['tasks']['b']
+
+    def test_failed_task_validation_not_cached(self):
+        config = {'tasks': {'a': {'test_late_plugin': True}}}
+        assert config_schema.process_config(config), 'unknown plugin should fail validation'
+        # Plugin becomes known without any schema being registered
+        schema = config_schema.get_schema()
+        schema['properties']['tasks']['additionalProperties']['properties']['test_late_plugin'] = {'type': 'boolean'}
+        try:
+            assert not config_schema.process_config({'tasks': {'a': {'test_late_plugin': True}}}), \
+                'failed validation result was reused'
+        finally:
+            del schema['properties']['tasks']['additionalProperties']['properties']['test_late_plugin']
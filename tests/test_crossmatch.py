@@ -14,9 +14,31 @@ class TestCrossmatch(FlexGetBase):
                 - title: entry 2
               action: reject
               fields: [title]
+
+          test_multiple_fields:
+            mock:
+            - {title: 'entry 1', genres: ['a', 'b']}
+            - {title: 'entry 2', genres: ['b']}
+            - {title: 'entry 3'}
+            crossmatch:
+              from:
+              - mock:
+                - {title: 'other 1', genres: ['a', 'b']}
+              - mock:
+                - {title: 'other 2', imdb_id: 'tt0000001'}
+                - {title: 'entry 3'}
+              action: accept
+              fields: [title, genres]
+              threads: 2
     """
 
     def test_reject_title(self):
         self.execute_task('test_title')
         assert self.task.find_entry('rejected', title='entry 2')
         assert len(self.task.rejected) == 1
+
+    def test_multiple_fields(self):
+        self.execute_task('test_multiple_fields')
+        assert self.task.find_entry('accepted', title='entry 1'), 'entry 1 should match on genres'
+        assert not self.task.find_entry('accepted', title='entry 2'), 'entry 2 should not match'
+        assert self.task.find_entry('accepted', title='entry 3'), 'entry 3 should match on title'
@@ -0,0 +1,239 @@
+from __future__ import unicode_literals, division, absolute_import
+import os
+import shutil
+import sys
+from argparse import Namespace
+from datetime import datetime, timedelta
+from StringIO import StringIO
+
+import sqlalchemy
+
+from flexget import db_schema
+from flexget.event import add_event_handler, remove_event_handler
+from flexget.manager import Session
+from flexget.plugins.cli.database import do_cli
+from flexget.task import TaskConfigHash
+from flexget.utils.database import batched_delete
+from flexget.utils.log import LogMessage
+from tests import FlexGetBase
+from tests.util import maketemp
+
+
+class TestDatabaseSettings(FlexGetBase):
+    __yaml__ = """
+        database:
+          profile: tuned
+          cache_size: -2000
+        tasks: {}
+    """
+
+    def setup(self):
+        super(TestDatabaseSettings, self).setup()
+        self.manager.update_db_settings()
+
+    def pragma(self, name):
+        session = Session()
+        try:
+            return session.execute('PRAGMA %s' % name).scalar()
+        finally:
+            session.close()
+
+    def test_profile(self):
+        settings = self.manager.db_settings
+        assert settings['synchronous'] == 'normal'
+        assert settings['busy_timeout'] == 30000, 'busy_timeout should be converted to milliseconds'
+        # Explicit settings override the profile
+        assert settings['cache_size'] == -2000
+        # Not supported by in memory databases
+        assert 'journal_mode' not in settings
+        assert 'mmap_size' not in settings
+
+    def test_pragmas_applied(self):
+        assert self.pragma('cache_size') == -2000
+        assert self.pragma('busy_timeout') == 30000
+        # 1 is NORMAL
+        assert self.pragma('synchronous') == 1
+
+    def test_settings_change(self):
+        self.manager.config['database'] = {'cache_size': -4000}
+        self.manager.update_db_settings()
+        assert self.manager.db_settings == {'cache_size': -4000}
+        assert self.pragma('cache_size') == -4000
+        # The in memory database must survive the change
+        assert self.pragma('page_count') > 0, 'database was lost'
+
+    def test_tune(self):
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            do_cli(self.manager, Namespace(db_action='tune'))
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert 'SingletonThreadPool' in output, output
+        lines = dict((line.split()[0], line.split()[1:]) for line in output.splitlines() if line.split())
+        assert lines['cache_size'] == ['-2000', '-2000'], output
+        assert lines['busy_timeout'] == ['30000', '30000'], output
+
+
+class TestDatabaseSettingsReload(FlexGetBase):
+    __yaml__ = """
+        database:
+          cache_size: -2000
+        tasks: {}
+    """
+
+    def setup(self):
+        super(TestDatabaseSettingsReload, self).setup()
+        self.test_home = maketemp()
+        self.manager.db_filename = os.path.join(self.test_home, 'db.sqlite')
+        self.manager.database_uri = 'sqlite:///%s' % self.manager.db_filename
+        self.manager.init_sqlalchemy()
+        self.manager.update_db_settings()
+
+    def teardown(self):
+        super(TestDatabaseSettingsReload, self).teardown()
+        shutil.rmtree(self.test_home)
+
+    def test_running_session(self):
+        session = Session()
+        try:
+            assert session.execute('PRAGMA cache_size').scalar() == -2000
+            connection = session.connection().connection.connection
+            self.manager.config['database'] = {'cache_size': -4000}
+            self.manager.update_db_settings()
+            # A task could be using the session while the config is reloaded
+            assert session.execute('PRAGMA cache_size').scalar() == -2000, 'connection in use should be kept'
+        finally:
+            session.close()
+        session = Session()
+        try:
+            assert session.connection().connection.connection is connection, 'pooled connection was closed'
+            assert session.execute('PRAGMA cache_size').scalar() == -4000, 'new settings were not applied'
+        finally:
+            session.close()
+
+
+class TestDatabaseDefaults(FlexGetBase):
+    __yaml__ = """
+        tasks: {}
+    """
+
+    def test_default(self):
+        self.manager.update_db_settings()
+        assert self.manager.db_settings == {}
+
+
+class TestSchemaVersionCache(FlexGetBase):
+    __yaml__ = """
+        tasks: {}
+    """
+
+    def setup(self):
+        super(TestSchemaVersionCache, self).setup()
+        db_schema.plugin_schemas['test_version_cache'] = {'version': 1, 'tables': []}
+
+    def teardown(self):
+        del db_schema.plugin_schemas['test_version_cache']
+        super(TestSchemaVersionCache, self).teardown()
+
+    def test_commit(self):
+        session = Session()
+        try:
+            db_schema.set_version('test_version_cache', 1, session=session)
+            assert db_schema.get_version('test_version_cache') is None, 'cache updated before commit'
+            session.commit()
+        finally:
+            session.close()
+        assert db_schema.get_version('test_version_cache') == 1
+
+    def test_rollback(self):
+        session = Session()
+        try:
+            db_schema.set_version('test_version_cache', 1, session=session)
+            session.rollback()
+            session.commit()
+        finally:
+            session.close()
+        assert db_schema.get_version('test_version_cache') is None, 'rolled back version was cached'
+
+
+class TestDbCleanup(FlexGetBase):
+    __yaml__ = """
+        database:
+          cleanup:
+            hours: [autogenerated in setup()]
+        tasks:
+          test1:
+            mock:
+              - {title: 'entry 1'}
+          test2:
+            mock:
+              - {title: 'entry 2'}
+    """
+
+    def setup(self):
+        super(TestDbCleanup, self).setup()
+        # Any hour but the current one
+        self.manager.config['database']['cleanup']['hours'] = [(datetime.now().hour + 12) % 24]
+        self.cleanups = []
+        add_event_handler('manager.db_cleanup', self.cleanup)
+
+    def teardown(self):
+        remove_event_handler('manager.db_cleanup', self.cleanup)
+        super(TestDbCleanup, self).teardown()
+
+    def cleanup(self, session):
+        self.cleanups.append(session)
+        return ['test1']
+
+    def add_messages(self, count, added):
+        session = Session()
+        try:
+            for i in range(count):
+                message = LogMessage('md5-%s-%s' % (added.year, i))
+                message.added = added
+                session.add(message)
+            session.commit()
+        finally:
+            session.close()
+
+    def test_batched_delete(self):
+        old = datetime.now() - timedelta(days=400)
+        self.add_messages(5, old)
+        self.add_messages(2, datetime.now())
+        for orm_delete in (False, True):
+            session = Session()
+            commits = []
+            sqlalchemy.event.listen(session, 'after_commit', lambda session: commits.append(session))
+            try:
+                query = session.query(LogMessage).filter(LogMessage.added < datetime.now() - timedelta(days=365))
+                assert batched_delete(session, query, batch_size=2, orm_delete=orm_delete) == 5
+                assert len(commits) == 3, 'each batch should be committed separately'
+                assert session.query(LogMessage).count() == 2, 'only matching rows should be removed'
+            finally:
+                session.close()
+            self.add_messages(5, old)
+
+    def test_hours(self):
+        self.manager.persist.pop('last_cleanup', None)
+        self.manager.db_cleanup()
+        assert not self.cleanups, 'scheduled cleanup should not run outside of the configured hours'
+        self.manager.config['database']['cleanup']['hours'] = [datetime.now().hour]
+        self.manager.db_cleanup()
+        assert len(self.cleanups) == 1, 'scheduled cleanup should run during the configured hours'
+
+    def test_force_ignores_hours(self):
+        self.manager.db_cleanup(force=True)
+        assert len(self.cleanups) == 1, 'forced cleanup should ignore the configured hours'
+
+    def test_changed_tasks(self):
+        self.execute_task('test1')
+        self.execute_task('test2')
+        self.manager.db_cleanup(force=True)
+        session = Session()
+        try:
+            hashes = dict((h.task, h.hash) for h in session.query(TaskConfigHash))
+        finally:
+            session.close()
+        assert hashes['test1'] == '', 'task returned by the cleanup handler should be marked changed'
+        assert hashes['test2'], 'other tasks should not be marked changed'
@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 
 from flexget.entry import Entry
 from flexget import plugin
+from flexget.manager import Session
+from flexget.plugins.input.discover import DiscoverEntry
 import flexget.validator
 from tests import FlexGetBase
 
@@ -44,6 +46,21 @@ class TestDiscover(FlexGetBase):
                   search_sort: 2
               from:
               - test_search: yes
+          test_sort_threads:
+            discover:
+              ignore_estimations: yes
+              threads: 3
+              threads_per_plugin: 2
+              what:
+              - mock:
+                - title: Foo
+                  search_sort: 1
+                - title: Bar
+                  search_sort: 3
+                - title: Baz
+                  search_sort: 2
+              from:
+              - test_search: yes
           test_interval:
             discover:
               ignore_estimations: yes
@@ -82,6 +99,10 @@ class TestDiscover(FlexGetBase):
         order = list(e.get('search_sort') for e in self.task.entries)
         assert order == sorted(order, reverse=True)
 
+    def test_sort_threads(self):
+        self.execute_task('test_sort_threads')
+        assert [e['title'] for e in self.task.entries] == ['Bar', 'Baz', 'Foo']
+
     def test_interval(self):
         self.execute_task('test_interval')
         assert len(self.task.entries) == 1
@@ -97,6 +118,27 @@ class TestDiscover(FlexGetBase):
         self.execute_task('test_interval')
         assert len(self.task.entries) == 0
 
+    def test_interval_mixed(self):
+        mock_config = self.manager.config['tasks']['test_interval']['discover']['what'][0]['mock']
+        mock_config.append({'title': 'Bar'})
+        self.execute_task('test_interval')
+        assert len(self.task.entries) == 2
+        # Foo has been waiting longer than the interval, Bar not
+        session = Session()
+        foo = session.query(DiscoverEntry).filter(DiscoverEntry.title == 'Foo').one()
+        foo.last_execution = datetime.now() - timedelta(days=1)
+        session.commit()
+        session.close()
+        mock_config.append({'title': 'Baz'})
+        self.execute_task('test_interval')
+        # Bar should be waiting for interval
+        assert sorted(e['title'] for e in self.task.entries) == ['Baz', 'Foo']
+        session = Session()
+        foo = session.query(DiscoverEntry).filter(DiscoverEntry.title == 'Foo').one()
+        assert foo.last_execution > datetime.now() - timedelta(minutes=1), 'search time of Foo was not updated'
+        assert session.query(DiscoverEntry).filter(DiscoverEntry.title == 'Baz').count() == 1
+        session.close()
+
     def test_estimates(self):
         mock_config = self.manager.config['tasks']['test_estimates']['discover']['what'][0]['mock']
         # It should not be searched before the release date
@@ -112,6 +154,60 @@ class TestDiscover(FlexGetBase):
         self.execute_task('test_emit_series')
         assert self.task.find_entry(title='My Show S01E01')
 
+
+class TestDiscoverSkipIdle(FlexGetBase):
+    __yaml__ = """
+        tasks:
+          test_idle:
+            discover:
+              ignore_estimations: yes
+              skip_idle: yes
+              what:
+              - mock:
+                - title: Foo
+              from:
+              - test_search: yes
+          test_due:
+            discover:
+              ignore_estimations: yes
+              skip_idle: yes
+              interval: 0 seconds
+              what:
+              - mock:
+                - title: Foo
+              from:
+              - test_search: yes
+    """
+
+    def test_skipped_on_cron(self):
+        self.execute_task('test_idle', options={'cron': True})
+        assert len(self.task.entries) == 1
+        # Nothing is due, the task should abort before running any inputs
+        self.execute_task('test_idle', abort_ok=True, options={'cron': True})
+        assert self.task.aborted, 'task should be skipped when nothing is due'
+        assert self.task.silent_abort, 'skipping the task should not be reported as an error'
+        assert not self.task.all_entries
+
+    def test_not_skipped_manually(self):
+        self.execute_task('test_idle')
+        self.execute_task('test_idle')
+        assert not self.task.aborted, 'only scheduled runs should be skipped'
+        # Ran, but the interval has not passed
+        assert len(self.task.entries) == 0
+
+    def test_not_skipped_discover_now(self):
+        self.execute_task('test_idle', options={'cron': True})
+        self.execute_task('test_idle', options={'cron': True, 'discover_now': True})
+        assert not self.task.aborted
+        assert len(self.task.entries) == 1
+
+    def test_not_skipped_when_due(self):
+        self.execute_task('test_due', options={'cron': True})
+        self.execute_task('test_due', options={'cron': True})
+        assert not self.task.aborted, 'task should run when a search is due'
+        assert len(self.task.entries) == 1
+
+
 class TestEmitSeriesInDiscover(FlexGetBase):
     __yaml__ = """
         tasks:
@@ -0,0 +1,117 @@
+from __future__ import unicode_literals, division, absolute_import
+
+from flexget.event import add_event_handler, remove_event_handler
+from flexget.utils.requests import DomainLimiter, Session, TokenBucket
+from tests import FlexGetBase
+
+
+class TestTokenBucket(object):
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        waits = [bucket.reserve() for _ in range(4)]
+        assert waits[:3] == [0, 0, 0], 'burst requests should not wait'
+        assert 0.9 < waits[3] <= 1, 'request after burst should wait for one token'
+        assert bucket.throttled == 1
+        assert bucket.requests == 4
+
+    def test_queued_reservations(self):
+        bucket = TokenBucket(rate=2)
+        waits = [bucket.reserve() for _ in range(3)]
+        assert waits[0] == 0
+        assert 0.4 < waits[1] <= 0.5
+        assert 0.9 < waits[2] <= 1, 'reservations should queue up behind each other'
+
+
+class TestDomainLimiter(object):
+
+    def test_suffix_match(self):
+        limiter = DomainLimiter()
+        limiter.set_limit('example.com', '2 seconds')
+        domain, bucket = limiter.get_bucket('http://www.example.com/path')
+        assert domain == 'example.com'
+        assert limiter.get_bucket('http://notexample.com/')[1] is None
+        assert limiter.get_bucket('http://example.com.evil.org/')[1] is None
+
+    def test_relax_limit(self):
+        limiter = DomainLimiter()
+        limiter.set_limit('example.com', '3 seconds')
+        limiter.set_limit('example.com', '1 seconds')
+        assert limiter.buckets['example.com'].rate == 1, 'new limit should replace the previous one'
+        limiter.set_limit('example.com', '0 seconds')
+        assert limiter.get_bucket('http://example.com/')[1] is None, 'zero delay should remove the limit'
+
+    def test_owners(self):
+        limiter = DomainLimiter()
+        first, second = Session(), Session()
+        limiter.set_limit('example.com', '3 seconds', owner=first)
+        limiter.set_limit('example.com', '2 seconds', burst=2, owner=second)
+        bucket = limiter.get_bucket('http://example.com/')[1]
+        assert bucket.rate == 1 / 3, 'most restrictive limit should apply'
+        limiter.set_limit('example.com', '1 seconds', owner=first)
+        assert bucket.rate == 1 / 2 and bucket.burst == 2, 'owner should be able to relax its own limit'
+        limiter.release(second)
+        assert limiter.get_bucket('http://example.com/')[1] is bucket, 'bucket state should be kept'
+        assert bucket.rate == 1, 'released limit should no longer apply'
+        del first
+        assert limiter.get_bucket('http://example.com/')[1] is None, 'limits of collected owners should be dropped'
+
+    def test_stats(self):
+        limiter = DomainLimiter()
+        limiter.set_limit('example.com', '1 seconds', burst=2)
+        limiter.get_bucket('http://example.com')[1].reserve()
+        stats = limiter.stats()
+        assert stats['example.com']['requests'] == 1
+        assert stats['example.com']['throttled'] == 0
+
+
+class TestSessionLimits(object):
+
+    def test_sessions_shared(self):
+        first, second = Session(), Session()
+        assert first.domain_limiter is second.domain_limiter
+        first.set_domain_delay('shared.example.com', '3 seconds')
+        second.set_domain_delay('shared.example.com', '2 seconds')
+        bucket = second.domain_limiter.get_bucket('http://shared.example.com/')[1]
+        assert bucket.rate == 1 / 3, 'sessions should share one budget per domain'
+        first.release_domain_delays()
+        assert bucket.rate == 1 / 2
+        second.release_domain_delays()
+        assert second.domain_limiter.get_bucket('http://shared.example.com/')[1] is None
+
+
+class TestDomainDelayPlugin(FlexGetBase):
+
+    __yaml__ = """
+        tasks:
+          test:
+            mock:
+              - {title: 'entry', url: 'http://localhost/entry'}
+            domain_delay:
+              example.com: 2 seconds
+              other.com:
+                delay: 1 seconds
+                burst: 3
+    """
+
+    def test_limits_while_running(self):
+        limits = []
+
+        def check_limits(task, keyword):
+            if keyword == 'mock':
+                limiter = Session().domain_limiter
+                limits.append((limiter.get_bucket('http://www.example.com/')[1].rate,
+                               limiter.get_bucket('http://other.com/')[1].burst))
+
+        add_event_handler('task.execute.before_plugin', check_limits)
+        try:
+            self.execute_task('test')
+        finally:
+            remove_event_handler('task.execute.before_plugin', check_limits)
+        assert limits == [(1 / 2, 3)], 'task limits should apply to all sessions while it runs'
+
+    def test_released_after_run(self):
+        self.execute_task('test')
+        limiter = self.task.requests.domain_limiter
+        assert limiter.get_bucket('http://example.com/')[1] is None, 'limits should be dropped after the task'
+        assert limiter.get_bucket('http://other.com/')[1] is None
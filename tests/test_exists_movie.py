@@ -0,0 +1,78 @@
+from __future__ import unicode_literals, division, absolute_import
+import os
+import shutil
+
+from flexget import plugin
+from flexget.utils.library_index import LibraryIndex
+from flexget.manager import Session
+from tests import FlexGetBase
+from tests.util import maketemp
+
+
+class TestExistsMovieOffline(FlexGetBase):
+
+    __yaml__ = """
+        tasks:
+          test:
+            mock:
+              - {title: 'Inception.2010.720p', imdb_id: 'tt1375666'}
+            accept_all: yes
+            disable_builtins: [seen]
+            exists_movie: path autogenerated in setup()
+    """
+
+    def setup(self):
+        FlexGetBase.setup(self)
+        self.test_home = maketemp()
+        movie_dir = os.path.join(self.test_home, 'Inception (2010)')
+        os.mkdir(movie_dir)
+        # recently modified directories are listed again on every run
+        os.utime(movie_dir, (0, 0))
+        os.utime(self.test_home, (0, 0))
+        self.manager.config['tasks']['test']['exists_movie'] = self.test_home
+        self.imdb_lookup = plugin.get_plugin_by_name('imdb_lookup').instance
+        self.lookups = []
+        self.fail = True
+
+        def imdb_id_lookup(movie_title=None, raw_title=None, session=None):
+            self.lookups.append(raw_title)
+            if self.fail:
+                raise plugin.PluginError('Connection timed out')
+            return 'tt1375666'
+
+        self.imdb_lookup.imdb_id_lookup = imdb_id_lookup
+
+    def teardown(self):
+        del self.imdb_lookup.imdb_id_lookup
+        shutil.rmtree(self.test_home)
+        FlexGetBase.teardown(self)
+
+    def test_failed_lookup_not_stored(self):
+        """Exists_movie plugin: directories whose lookup failed are looked up again on the next run"""
+        self.execute_task('test')
+        assert self.task.find_entry('accepted', title='Inception.2010.720p'), 'lookup failed, should be accepted'
+        self.fail = False
+        self.execute_task('test')
+        assert self.lookups == ['Inception (2010)'] * 2, 'failed lookup should be retried'
+        assert self.task.find_entry('rejected', title='Inception.2010.720p'), 'movie exists, should be rejected'
+        self.execute_task('test')
+        assert len(self.lookups) == 2, 'successful lookup should be stored'
+        assert self.task.find_entry('rejected', title='Inception.2010.720p'), 'movie exists, should be rejected'
+
+    def test_parsed_stored_once(self):
+        session = Session()
+        try:
+            index = LibraryIndex(session)
+            calls = []
+            for record in index.walk(self.test_home):
+                index.parsed(record, 'first', lambda record: calls.append('first') or 1)
+                index.parsed(record, 'second', lambda record: calls.append('second') or 2)
+                assert index.get_parsed(record, 'first') == 1
+            session.commit()
+            for record in index.walk(self.test_home):
+                assert index.parsed(record, 'first', lambda record: calls.append('first')) == 1
+                assert index.parsed(record, 'second', lambda record: calls.append('second')) == 2
+            assert calls.count('first') == calls.count('second'), 'both results should be stored'
+            assert 'first' in calls
+        finally:
+            session.close()
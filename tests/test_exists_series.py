@@ -177,3 +177,17 @@ class TestExistsSeries(FlexGetBase):
             'jinja2 s01e01 should have been rejected (exists)'
         assert self.task.find_entry('accepted', title='jinja s01e02'), \
             'jinja s01e02 should have been accepted'
+
+    def test_rescan_changed(self):
+        """Exists_series plugin: files added after a scan are found on the next run"""
+        self.execute_task('test')
+        assert self.task.find_entry('accepted', title='Foo.Bar.S01E03.XViD'), \
+            'Foo.Bar.S01E03.XViD should have been accepted'
+        new_dir = os.path.join(self.test_home, 'Foo.Bar.S01E03.XViD-GrpA')
+        os.makedirs(new_dir)
+        try:
+            self.execute_task('test')
+            assert self.task.find_entry('rejected', title='Foo.Bar.S01E03.XViD'), \
+                'Foo.Bar.S01E03.XViD should have been rejected (exists)'
+        finally:
+            os.rmdir(new_dir)
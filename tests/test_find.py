@@ -0,0 +1,56 @@
+from __future__ import unicode_literals, division, absolute_import
+import os
+import shutil
+
+from tests import FlexGetBase
+from tests.util import maketemp
+
+
+class TestFindIncremental(FlexGetBase):
+
+    __yaml__ = """
+        tasks:
+          test:
+            find:
+              path: autogenerated in setup()
+              mask: '*.mkv'
+              recursive: yes
+              incremental: yes
+    """
+
+    def setup(self):
+        FlexGetBase.setup(self)
+        # reruns must not be answered from the input cache, but earlier tests must not have filled it either
+        from flexget.utils.cached_input import cached
+        cached.cache.clear()
+        self.test_home = maketemp()
+        self.manager.config['tasks']['test']['find']['path'] = self.test_home
+        os.makedirs(os.path.join(self.test_home, 'sub'))
+        for name in ['a.mkv', 'b.txt', os.path.join('sub', 'c.mkv')]:
+            self.touch(name)
+
+    def teardown(self):
+        shutil.rmtree(self.test_home)
+        FlexGetBase.teardown(self)
+
+    def touch(self, name, content=''):
+        with open(os.path.join(self.test_home, name), 'w') as f:
+            f.write(content)
+
+    def test_incremental(self):
+        self.execute_task('test')
+        assert self.task.find_entry(title='a'), 'a.mkv should have been found'
+        assert self.task.find_entry(title='c'), 'sub/c.mkv should have been found'
+        assert not self.task.find_entry(title='b'), 'b.txt does not match mask'
+
+        self.execute_task('test')
+        assert not self.task.entries, 'unchanged files should not be produced again'
+
+        self.touch(os.path.join('sub', 'd.mkv'))
+        # changes to existing files are only noticed along with a change to the directory listing
+        self.touch('a.mkv', 'changed')
+        self.touch('e.txt')
+        self.execute_task('test')
+        assert self.task.find_entry(title='d'), 'new file should have been found'
+        assert self.task.find_entry(title='a'), 'changed file should have been found'
+        assert not self.task.find_entry(title='c'), 'unchanged file should not have been found'
@@ -0,0 +1,68 @@
+from __future__ import unicode_literals, division, absolute_import
+import importlib
+
+from nose.plugins.skip import SkipTest
+
+from flexget.utils.soup import get_soup
+
+html = importlib.import_module('flexget.plugins.input.html')
+
+PAGE = """
+<html>
+  <head><title>Downloads</title></head>
+  <body>
+    <ul>
+      <li><a href="/files/Some.Show.S01E01.torrent" title="Some Show S01E01">Some.Show.S01E01.torrent</a></li>
+      <li><a href="files/Other.Show.S02E03.torrent" title="Other Show S02E03"><b>Other</b>.Show.<i>S02E03</i></a></li>
+      <li><a href="http://mirror.example.com/Movie.2012.720p.mkv"><img src="cover.jpg"></a></li>
+      <li><a href="//cdn.example.com/Album%20Name.zip"><span>Album</span> <span>Name</span></a></li>
+      <li><a href="/empty"></a></li>
+      <li><a name="anchor">No href</a></li>
+    </ul>
+  </body>
+</html>
+"""
+
+URL = 'http://example.com/downloads/'
+
+
+class TestHtmlBackends(object):
+
+    def entries(self, config, backend):
+        config = dict(config, url=URL)
+        if backend == 'lxml':
+            if html.etree is None:
+                raise SkipTest('lxml is not installed')
+            links = html.extract_links(PAGE)
+        else:
+            links = html.soup_links(get_soup(PAGE, parser='html5lib'))
+        return [(entry['title'], entry['url']) for entry in html.InputHtml().create_entries(URL, links, config)]
+
+    def check(self, config, expected):
+        for backend in ('html5lib', 'lxml'):
+            entries = self.entries(config, backend)
+            assert entries == expected, '%s produced %s' % (backend, entries)
+
+    def test_nested_tags(self):
+        self.check({}, [
+            ('Some.Show.S01E01', 'http://example.com/files/Some.Show.S01E01.torrent'),
+            ('Other.Show.S02E03', 'http://example.com/downloads/files/Other.Show.S02E03.torrent'),
+            ('Album Name', 'http://cdn.example.com/Album%20Name.zip')])
+
+    def test_title_from_url(self):
+        # links without text are used when the title does not come from the link text
+        self.check({'title_from': 'url'}, [
+            ('Some.Show.S01E01', 'http://example.com/files/Some.Show.S01E01.torrent'),
+            ('Other.Show.S02E03', 'http://example.com/downloads/files/Other.Show.S02E03.torrent'),
+            ('Movie.2012.720p.mkv', 'http://mirror.example.com/Movie.2012.720p.mkv'),
+            ('Album Name.zip', 'http://cdn.example.com/Album%20Name.zip')])
+
+    def test_title_from_title(self):
+        self.check({'title_from': 'title'}, [
+            ('Some Show S01E01', 'http://example.com/files/Some.Show.S01E01.torrent'),
+            ('Other Show S02E03', 'http://example.com/downloads/files/Other.Show.S02E03.torrent')])
+
+    def test_links_re(self):
+        self.check({'links_re': [r'\.torrent$'], 'title_from': 'url'}, [
+            ('Some.Show.S01E01', 'http://example.com/files/Some.Show.S01E01.torrent'),
+            ('Other.Show.S02E03', 'http://example.com/downloads/files/Other.Show.S02E03.torrent')])
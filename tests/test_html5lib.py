@@ -1,5 +1,6 @@
 from __future__ import unicode_literals, division, absolute_import
-from flexget.utils.soup import get_soup
+from flexget.utils import soup as utils_soup
+from flexget.utils.soup import get_soup, supports_parse_only
 
 
 class TestHtml5Lib():
@@ -22,3 +23,34 @@ class TestHtml5Lib():
         assert em.parent.name == 'p'
 
         assert soup.find('p', attrs={'class': 'foo'})
+
+    def test_cache(self):
+        s = '<html><body><p>Cached</p></body></html>'
+        soup = get_soup(s, cache=True)
+        assert get_soup(s, cache=True) is soup, 'identical document should not be parsed again'
+        assert get_soup(s) is not soup, 'cache should only be used when asked for'
+
+    def test_cache_pruned(self):
+        s = '<html><body><p>Expired</p></body></html>'
+        soup = get_soup(s, cache=True)
+        cache_time, utils_soup.CACHE_TIME = utils_soup.CACHE_TIME, 0
+        try:
+            # expired trees are dropped by any call, not only when a new tree is cached
+            get_soup('<p>Other</p>')
+        finally:
+            utils_soup.CACHE_TIME = cache_time
+        assert get_soup(s, cache=True) is not soup, 'expired tree should have been dropped'
+
+        soup = get_soup(s, cache=True)
+        utils_soup.clear_cache(None)
+        assert get_soup(s, cache=True) is not soup, 'trees should not be kept after execution'
+
+    def test_parse_only(self):
+        s = '<html><body><table class="results"><tr><td>Result</td></tr></table><p>Other</p></body></html>'
+        soup = get_soup(s, parser='html.parser', parse_only='table')
+        assert soup.find('td').text == 'Result'
+        assert not soup.find('p'), 'only the table should have been parsed'
+
+    def test_supports_parse_only(self):
+        assert not supports_parse_only('html5lib'), 'html5lib ignores parse_only'
+        assert supports_parse_only('html.parser')
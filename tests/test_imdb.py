@@ -9,8 +9,19 @@
 """
 
 from __future__ import unicode_literals, division, absolute_import
+import importlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
 from tests import FlexGetBase
+from tests.util import maketemp
 from nose.plugins.attrib import attr
+from flexget import plugin
+from flexget.entry import Entry
+from flexget.manager import Session
+from flexget.plugins.metainfo.imdb_lookup import Movie, SearchResult, Genre, Actor, MovieLanguage
 
 
 class TestImdb(FlexGetBase):
@@ -263,3 +274,116 @@ class TestImdbLookup(FlexGetBase):
         assert self.task.entries[0]['imdb_score'], 'didn\'t get score'
         assert self.task.entries[0]['imdb_year'], 'didn\'t get year'
         assert self.task.entries[0]['imdb_plot_outline'], 'didn\'t get plot'
+
+
+class FakeImdbParser(object):
+    """Parses made up movies without going to imdb. The movie number in the url picks the genres and actors."""
+
+    parsed = []
+    lock = threading.Lock()
+
+    def parse(self, imdb_url):
+        number = int(imdb_url.rstrip('/')[-1])
+        # Give other prefetch threads a chance to run at the same time
+        time.sleep(0.01)
+        with self.lock:
+            self.parsed.append(imdb_url)
+        self.name = 'Movie %s' % number
+        self.original_name = None
+        self.photo = None
+        self.score = 7.0
+        self.votes = 100
+        self.year = 2000 + number
+        self.mpaa_rating = ''
+        self.plot_outline = None
+        self.genres = ['Drama', 'Genre %s' % number]
+        self.languages = ['English']
+        self.actors = {'nm0000001': 'Shared Actor', 'nm100000%s' % number: 'Actor %s' % number}
+        self.directors = {}
+
+
+class TestImdbLookupOffline(FlexGetBase):
+
+    __yaml__ = """
+        tasks:
+          prefetch:
+            mock:
+              - {title: 'Movie 1', imdb_url: 'http://www.imdb.com/title/tt0000001/'}
+              - {title: 'Movie 2', imdb_url: 'http://www.imdb.com/title/tt0000002/'}
+              - {title: 'Movie 3', imdb_url: 'http://www.imdb.com/title/tt0000003/'}
+              - {title: 'Movie 4', imdb_url: 'http://www.imdb.com/title/tt0000004/'}
+              - {title: 'Movie 5', imdb_url: 'http://www.imdb.com/title/tt0000005/'}
+              - {title: 'Movie 6', imdb_url: 'http://www.imdb.com/title/tt0000006/'}
+            imdb_lookup:
+              prefetch: yes
+              threads: 3
+            disable_builtins: yes
+    """
+
+    def setup(self):
+        # Prefetch threads need their own connections to the same database, in memory databases are per connection
+        self.database_uri = 'sqlite:///%s' % os.path.join(maketemp(), 'imdb.sqlite').replace('\\', '/')
+        super(TestImdbLookupOffline, self).setup()
+        self.module = importlib.import_module('flexget.plugins.metainfo.imdb_lookup')
+        self.parser = self.module.ImdbParser
+        self.module.ImdbParser = FakeImdbParser
+        FakeImdbParser.parsed = []
+        self.lookup = plugin.get_plugin_by_name('imdb_lookup').instance
+
+    def teardown(self):
+        self.module.ImdbParser = self.parser
+        super(TestImdbLookupOffline, self).teardown()
+
+    def store(self, number):
+        parser = FakeImdbParser()
+        url = 'http://www.imdb.com/title/tt000000%s/' % number
+        parser.parse(url)
+        session = Session()
+        try:
+            movie = self.lookup._store_movie(parser, url, session)
+            return movie.id
+        finally:
+            session.close()
+
+    def test_lookup_cached(self):
+        self.store(1)
+        self.store(2)
+        session = Session()
+        session.add(SearchResult('Movie 1 2001 720p', 'http://www.imdb.com/title/tt0000001/'))
+        session.query(Movie).filter(Movie.url == 'http://www.imdb.com/title/tt0000002/').\
+            update({'updated': datetime.now() - timedelta(days=3650)})
+        session.commit()
+        session.close()
+        by_title = Entry(title='Movie 1 2001 720p', url='')
+        expired = Entry(title='Movie 2', url='', imdb_url='http://www.imdb.com/title/tt0000002/')
+        unknown = Entry(title='Unknown Movie', url='')
+        misses = self.lookup.lookup_cached([by_title, expired, unknown])
+        assert [e['title'] for e in misses] == ['Movie 2', 'Unknown Movie']
+        assert by_title['imdb_name'] == 'Movie 1'
+        assert sorted(by_title['imdb_genres']) == ['Drama', 'Genre 1']
+        assert by_title['imdb_actors'] == {'nm0000001': 'Shared Actor', 'nm1000001': 'Actor 1'}
+        assert not FakeImdbParser.parsed[2:], 'cached lookups should not parse imdb'
+
+    def test_store_reuses_rows(self):
+        self.store(1)
+        self.store(2)
+        # Refreshing an expired movie replaces it
+        self.store(1)
+        session = Session()
+        assert session.query(Movie).count() == 2
+        assert sorted(name for name, in session.query(Genre.name)) == ['Drama', 'Genre 1', 'Genre 2']
+        assert session.query(Actor).filter(Actor.imdb_id == 'nm0000001').count() == 1
+        assert session.query(MovieLanguage).count() == 2
+        session.close()
+
+    def test_prefetch(self):
+        self.execute_task('prefetch')
+        assert len(FakeImdbParser.parsed) == 6, 'all movies should be parsed once: %s' % FakeImdbParser.parsed
+        for entry in self.task.entries:
+            assert entry.get('imdb_name', eval_lazy=False) == entry['title'], \
+                '%s was not prefetched' % entry['title']
+        session = Session()
+        assert session.query(Movie).count() == 6
+        assert session.query(Genre).filter(Genre.name == 'Drama').count() == 1, 'duplicate genres stored'
+        assert session.query(Actor).filter(Actor.imdb_id == 'nm0000001').count() == 1, 'duplicate actors stored'
+        session.close()
@@ -0,0 +1,155 @@
+from __future__ import unicode_literals, division, absolute_import
+import os
+import shutil
+import time
+
+from nose.plugins.skip import SkipTest
+
+from flexget.manager import Session
+from flexget.utils import library_watcher
+from flexget.utils.library_index import LibraryIndex
+from flexget.utils.library_watcher import LibraryWatcher
+from tests import FlexGetBase
+from tests.util import maketemp
+
+
+def wait_for(condition, timeout=10):
+    """Waits for the watcher thread to get *condition* true."""
+    end = time.time() + timeout
+    while not condition():
+        assert time.time() < end, 'timed out waiting for the watcher'
+        time.sleep(0.1)
+
+
+def make_library():
+    test_home = maketemp()
+    os.makedirs(os.path.join(test_home, 'Show', 'Season 1'))
+    return test_home
+
+
+def touch_dir(path):
+    # make sure the mtime differs even on filesystems with coarse timestamps
+    mtime = os.stat(path).st_mtime + 1
+    os.mkdir(os.path.join(path, 'Extras-%s' % len(os.listdir(path))))
+    os.utime(path, (mtime, mtime))
+
+
+class TestLibraryWatcher(object):
+
+    def setup(self):
+        self.test_home = make_library()
+        self.watcher = LibraryWatcher(method='poll', poll_interval=0)
+        self.watcher.start()
+
+    def teardown(self):
+        self.watcher.stop()
+        self.watcher.join()
+        shutil.rmtree(self.test_home)
+
+    def watch(self):
+        root = self.watcher.watch(self.test_home)
+        wait_for(lambda: self.watcher.begin_walk(root) is not None)
+        return root
+
+    def test_poll_marks_changed(self):
+        root = self.watch()
+        assert self.watcher.watch(os.path.join(self.test_home, 'Show')) is root, 'subpath should use existing watch'
+        self.watcher.end_walk(root, root.key, self.watcher.begin_walk(root))
+        assert self.watcher.is_synced(root, os.path.join(root.key, 'Show')), 'walked tree should be synced'
+
+        season = os.path.join(self.test_home, 'Show', 'Season 1')
+        touch_dir(season)
+        wait_for(lambda: self.watcher.get_dirty(root, season) is not None)
+        assert self.watcher.get_dirty(root, os.path.join(self.test_home, 'Show')) is None, \
+            'unchanged directory is dirty'
+        self.watcher.clear_dirty(root, season, self.watcher.get_dirty(root, season))
+        assert self.watcher.get_dirty(root, season) is None, 'dirty flag should be cleared'
+
+    def test_changed_again(self):
+        root = self.watch()
+        season = os.path.join(self.test_home, 'Show', 'Season 1')
+        touch_dir(season)
+        wait_for(lambda: self.watcher.get_dirty(root, season) is not None)
+        marker = self.watcher.get_dirty(root, season)
+        touch_dir(season)
+        wait_for(lambda: self.watcher.get_dirty(root, season) != marker)
+        self.watcher.clear_dirty(root, season, marker)
+        assert self.watcher.get_dirty(root, season) is not None, 'change after the walk should stay dirty'
+
+
+class TestLibraryWatcherInotify(object):
+
+    def setup(self):
+        if not library_watcher.load_libc():
+            raise SkipTest('inotify is not available')
+        self.test_home = make_library()
+        self.watcher = LibraryWatcher(method='inotify')
+        self.watcher.start()
+
+    def teardown(self):
+        self.watcher.stop()
+        self.watcher.join()
+        shutil.rmtree(self.test_home, ignore_errors=True)
+
+    def test_lost_events(self):
+        root = self.watcher.watch(self.test_home)
+        wait_for(lambda: self.watcher.begin_walk(root) is not None)
+        self.watcher.end_walk(root, root.key, self.watcher.begin_walk(root))
+        season = os.path.join(self.test_home, 'Show', 'Season 1')
+        os.mkdir(os.path.join(season, 'Extras'))
+        wait_for(lambda: self.watcher.get_dirty(root, season) is not None)
+        shutil.rmtree(self.test_home)
+        wait_for(lambda: not self.watcher.is_synced(root, root.key))
+        assert self.watcher.get_dirty(root, season) is None, 'whole tree is rescanned after lost events'
+
+
+class TestLibraryIndexWatcher(FlexGetBase):
+
+    __yaml__ = """
+        tasks: {}
+    """
+
+    def setup(self):
+        FlexGetBase.setup(self)
+        self.test_home = make_library()
+        for path in ('Show/Season 1', 'Show', ''):
+            os.utime(os.path.join(self.test_home, path), (0, 0))
+        self.watcher = LibraryWatcher(method='poll', poll_interval=0)
+        self.watcher.start()
+        library_watcher.watcher = self.watcher
+        self.root = self.watcher.watch(self.test_home)
+        wait_for(lambda: self.watcher.begin_walk(self.root) is not None)
+
+    def teardown(self):
+        library_watcher.watcher = None
+        self.watcher.stop()
+        self.watcher.join()
+        shutil.rmtree(self.test_home)
+        FlexGetBase.teardown(self)
+
+    def walk(self, commit):
+        session = Session()
+        try:
+            records = list(LibraryIndex(session).walk(self.test_home))
+            if commit:
+                session.commit()
+            return records
+        finally:
+            session.close()
+
+    def test_synced_after_commit(self):
+        self.walk(commit=False)
+        assert not self.watcher.is_synced(self.root, self.root.key), 'listings were not stored'
+        self.walk(commit=True)
+        assert self.watcher.is_synced(self.root, self.root.key), 'stored tree should be synced'
+
+    def test_dirty_until_commit(self):
+        self.walk(commit=True)
+        season = os.path.join(self.test_home, 'Show', 'Season 1')
+        touch_dir(season)
+        wait_for(lambda: self.watcher.get_dirty(self.root, season) is not None)
+        self.walk(commit=False)
+        assert self.watcher.get_dirty(self.root, season) is not None, 'new listing was not stored'
+        records = self.walk(commit=True)
+        assert self.watcher.get_dirty(self.root, season) is None, 'new listing was stored'
+        assert len(records) == 4, 'new directory should be listed'
@@ -0,0 +1,80 @@
+from __future__ import unicode_literals, division, absolute_import
+import os
+import shutil
+import socket
+
+import mock
+
+from flexget.manager import forward_to_daemon
+from flexget.options import get_parser
+from tests.util import maketemp
+
+
+class FakeIPCClient(object):
+    """Stands in for the daemon connection, records the calls made through it."""
+
+    calls = []
+    error = None
+
+    def __init__(self, port, password):
+        if self.error:
+            raise self.error
+        self.calls.append(('connect', port, password))
+
+    def execute(self, options):
+        self.calls.append(('execute', options))
+
+    def close(self):
+        self.calls.append(('close',))
+
+
+class TestForwardToDaemon(object):
+
+    def setup(self):
+        self.test_home = maketemp()
+        self.config = os.path.join(self.test_home, 'config.yml')
+        with open(self.config, 'w') as f:
+            f.write('tasks: {}\n')
+        self.lockfile = os.path.join(self.test_home, '.config-lock')
+        with open(self.lockfile, 'w') as f:
+            f.write(b'PID: %s\nport: 29709\npassword: secret\n' % os.getpid())
+        FakeIPCClient.calls = []
+        FakeIPCClient.error = None
+        self.patches = [mock.patch('flexget.manager.IPCClient', FakeIPCClient),
+                        mock.patch('flexget.logger.start', self.start_logging)]
+        for patch in self.patches:
+            patch.start()
+
+    def teardown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.test_home)
+
+    def start_logging(self, filename, level):
+        FakeIPCClient.calls.append(('log', filename))
+
+    def options(self, *args):
+        return get_parser().parse_args(['-c', self.config] + list(args))
+
+    def test_forwarded(self):
+        assert forward_to_daemon(self.options('execute', '--tasks', 'test'))
+        calls = FakeIPCClient.calls
+        assert calls[0] == ('log', os.path.join(self.test_home, 'flexget.log')), \
+            'logging should be started before forwarding'
+        assert calls[1] == ('connect', 29709, 'secret')
+        assert calls[2][0] == 'execute' and calls[2][1]['tasks'] == ['test']
+        assert calls[3] == ('close',)
+
+    def test_daemon_unreachable(self):
+        FakeIPCClient.error = socket.error('Connection refused')
+        assert not forward_to_daemon(self.options('execute')), 'should fall back to executing without the daemon'
+        assert not [call for call in FakeIPCClient.calls if call[0] == 'execute']
+
+    def test_no_daemon(self):
+        os.remove(self.lockfile)
+        assert not forward_to_daemon(self.options('execute'))
+        assert FakeIPCClient.calls == [], 'nothing should happen without a daemon'
+
+    def test_other_commands(self):
+        assert not forward_to_daemon(self.options('daemon', 'status'))
+        assert FakeIPCClient.calls == []
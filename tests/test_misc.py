@@ -4,7 +4,9 @@ import stat
 from tests import FlexGetBase
 from nose.plugins.attrib import attr
 from nose.tools import raises
+from flexget import plugin
 from flexget.entry import EntryUnicodeError, Entry
+from flexget.event import event
 
 
 class TestDisableBuiltins(FlexGetBase):
@@ -209,6 +211,19 @@ class TestHtmlUtils(object):
         assert encode_html('<3') == '&lt;3'
 
 
+class TestConfigFingerprint(object):
+
+    def test_ordering_independent(self):
+        from flexget.utils.tools import config_fingerprint
+        first = {'a': {'x': 1, 'y': [1, 2]}, 'b': 'text'}
+        second = {'b': 'text', 'a': {'y': [1, 2], 'x': 1}}
+        assert config_fingerprint(first) == config_fingerprint(second)
+
+    def test_detects_nested_change(self):
+        from flexget.utils.tools import config_fingerprint
+        assert config_fingerprint({'a': {'x': 1}}) != config_fingerprint({'a': {'x': 2}})
+
+
 class TestSetPlugin(FlexGetBase):
 
     __yaml__ = """
@@ -248,3 +263,40 @@ class TestSetPlugin(FlexGetBase):
         assert 'field' not in entry,\
                 '`field` should not have been created when jinja rendering fails'
         assert entry['otherfield'] == 'no series'
+
+
+class ConfigModifyingPlugin(object):
+    """Modifies its config like series does with groups, and reruns the task once."""
+
+    schema = {'type': 'object'}
+
+    def on_task_input(self, task, config):
+        task.seen_configs = getattr(task, 'seen_configs', []) + [dict(config, values=list(config['values']))]
+        config['values'].append('modified')
+        if not task.is_rerun:
+            task.rerun()
+
+
+@event('plugin.register')
+def register_config_modifying_plugin():
+    plugin.register(ConfigModifyingPlugin, 'test_config_modifying', api_ver=2, debug=True)
+
+
+class TestRerunConfig(FlexGetBase):
+
+    __yaml__ = """
+        tasks:
+          test:
+            test_config_modifying:
+              values: [original]
+    """
+
+    def setup(self):
+        # Registers the test plugin
+        plugin.load_plugins()
+        super(TestRerunConfig, self).setup()
+
+    def test_rerun_restores_nested_config(self):
+        self.execute_task('test')
+        assert [c['values'] for c in self.task.seen_configs] == [['original'], ['original']], \
+            'rerun did not start from the config as it was after start phase: %s' % self.task.seen_configs
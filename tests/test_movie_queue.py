@@ -0,0 +1,52 @@
+from __future__ import unicode_literals, division, absolute_import
+
+from flexget.plugins.filter.movie_queue import queue_add
+from tests import FlexGetBase
+
+
+class TestMovieQueue(FlexGetBase):
+    __yaml__ = """
+        tasks:
+          test:
+            mock:
+              - {title: 'The.Matrix.1999.720p.BluRay', imdb_id: 'tt0133093'}
+              - {title: 'Inception.2010.1080p', tmdb_id: 27205}
+              - {title: 'Some.Unrelated.Movie.2012.720p'}
+            movie_queue: yes
+    """
+
+    def test_matches(self):
+        queue_add(title='The Matrix', imdb_id='tt0133093', tmdb_id=603)
+        queue_add(title='Inception', imdb_id='tt1375666', tmdb_id=27205)
+        self.execute_task('test')
+        assert self.task.find_entry('accepted', title='The.Matrix.1999.720p.BluRay'), 'should match by imdb_id'
+        assert self.task.find_entry('accepted', title='Inception.2010.1080p'), 'should match by tmdb_id'
+        entry = self.task.find_entry(title='Some.Unrelated.Movie.2012.720p')
+        assert entry not in self.task.accepted, 'unrelated movie should not have been accepted'
+        assert not entry.get('imdb_id', eval_lazy=False), 'no lookup should be done for titles not in queue'
+
+    def test_title_gate(self):
+        from flexget.entry import Entry
+        from flexget.manager import Session
+        from flexget.plugins.filter.movie_queue import MovieQueueIndex, queue_del
+
+        cases = [
+            ('Ocean\'s Eleven', 'Oceans.Eleven.2001.720p.BluRay', True),
+            ('Schindler\'s List', 'Schindlers.List.1993.1080p', True),
+            ('Schindler\'s List', 'Schindler\'s List (1993) DVDRip', True),
+            ('Spider-Man', 'Spiderman.2002.DVDRip', True),
+            ('Spider-Man', 'Spider.Man.2002.DVDRip', True),
+            ('Spiderman', 'Spider-Man.2002.DVDRip', True),
+            ('Am\xe9lie', 'Le.Fabuleux.Destin.d.Amelie.Poulain.2001.720p', True),
+            ('Spider-Man 2', 'Some.Unrelated.Movie.2.2012.720p', False),
+            ('The Matrix', 'The.Hobbit.2012.720p', False)]
+        for title, release, expected in cases:
+            queue_add(title=title, imdb_id='tt0000001')
+            session = Session()
+            try:
+                index = MovieQueueIndex(session)
+                assert index.title_matches(Entry(title=release, url='')) == expected, \
+                    '%s should %sbe looked up for %s' % (release, '' if expected else 'not ', title)
+            finally:
+                session.close()
+            queue_del(imdb_id='tt0000001')
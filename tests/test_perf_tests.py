@@ -0,0 +1,52 @@
+from __future__ import unicode_literals, division, absolute_import
+import importlib
+import os
+import shutil
+import sys
+from argparse import Namespace
+from StringIO import StringIO
+
+from flexget.options import get_parser
+from flexget.utils import json
+from tests import FlexGetBase
+from tests.util import maketemp
+
+perf_tests = importlib.import_module('flexget.plugins.cli.perf_tests')
+
+
+class TestBenchmark(FlexGetBase):
+    __yaml__ = """
+        tasks: {}
+    """
+
+    def setup(self):
+        super(TestBenchmark, self).setup()
+        self.test_home = maketemp()
+
+    def teardown(self):
+        shutil.rmtree(self.test_home)
+        super(TestBenchmark, self).teardown()
+
+    def test_arguments(self):
+        options = get_parser().parse_args(['perf-test', 'benchmark', '--scale', '1k', '10k', '--scenario', 'seen'])
+        options = getattr(options, 'perf-test')
+        assert options.scales == ['1k', '10k']
+        assert options.scenarios == ['seen']
+
+    def test_template_scenario(self):
+        output = os.path.join(self.test_home, 'report.json')
+        options = Namespace(scales=['1k'], scenarios=['template'], repeat=1, seed=0, output=output)
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            perf_tests.benchmark(self.manager, options)
+        finally:
+            sys.stdout = stdout
+        with open(output) as f:
+            report = json.load(f)
+        assert len(report['results']) == 1
+        result = report['results'][0]
+        assert result['scenario'] == 'template' and result['scale'] == '1k'
+        assert result['error'] is None, 'scenario aborted: %s' % result['error']
+        assert result['aborted'] == 0
+        assert len(result['seconds']) == 1 and result['best'] == result['seconds'][0]
+        assert result['entries'] == 1000 and result['accepted'] == 1000
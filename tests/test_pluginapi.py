@@ -1,12 +1,17 @@
 from __future__ import unicode_literals, division, absolute_import
 import os
+import sys
 import glob
+from argparse import Namespace
+from StringIO import StringIO
 
 from nose.tools import raises
 
 from tests import FlexGetBase
-from flexget import plugin, plugins
-from flexget.event import event
+from tests.util import maketemp
+from flexget import config_base, config_schema, plugin, plugins
+from flexget.event import event, add_event_handler, remove_event_handler
+from flexget.plugins.cli.doc import print_doc
 
 
 class TestPluginApi(object):
@@ -61,6 +66,50 @@ class TestPluginApi(object):
         assert 'test_html' in plugin.plugins
 
 
+class TestPhasePlugins(FlexGetBase):
+    __yaml__ = """
+        tasks:
+          test:
+            mock:
+              - {title: 'entry 1'}
+            accept_all: yes
+            plugin_priority:
+              accept_all: 300
+    """
+
+    def chain(self, phase='filter'):
+        return [p.name for p in plugin.get_phase_plugins(phase)]
+
+    def test_cached(self):
+        chain = plugin.get_phase_plugins('filter')
+        assert plugin.get_phase_plugins('filter') is chain, 'chain should be cached'
+        plugin.clear_phase_cache()
+        assert plugin.get_phase_plugins('filter') is not chain, 'cache was not cleared'
+        assert list(plugin.get_phase_plugins('filter')) == list(chain)
+
+    def test_sorted(self):
+        chain = plugin.get_phase_plugins('filter')
+        priorities = [p.phase_handlers['filter'].priority for p in chain]
+        assert priorities == sorted(priorities, reverse=True), 'plugins should be in priority order'
+
+    def test_plugin_priority(self):
+        original = self.chain()
+        assert original[0] != 'accept_all'
+        chains = []
+
+        def before_plugin(task, keyword):
+            if keyword == 'accept_all':
+                chains.append(self.chain())
+
+        add_event_handler('task.execute.before_plugin', before_plugin)
+        try:
+            self.execute_task('test')
+        finally:
+            remove_event_handler('task.execute.before_plugin', before_plugin)
+        assert chains and chains[0][0] == 'accept_all', 'cached chain was not sorted again for the new priority'
+        assert self.chain() == original, 'chain should be restored after the task'
+
+
 class TestExternalPluginLoading(FlexGetBase):
     __yaml__ = """
         tasks:
@@ -80,3 +129,118 @@ class TestExternalPluginLoading(FlexGetBase):
     def test_external_plugin_loading(self):
         self.execute_task('ext_plugin')
         assert self.task.find_entry(title='test entry'), 'External plugin did not create entry'
+
+
+LAZY_PLUGIN = """
+from __future__ import unicode_literals, division, absolute_import
+
+from flexget import plugin
+from flexget.event import event
+
+
+class LazyTestPlugin(object):
+    \"\"\"Lazy test plugin docs\"\"\"
+
+    schema = {'type': 'boolean'}
+
+    def on_task_input(self, task, config):
+        return []
+
+    def on_task_filter(self, task, config):
+        pass
+
+
+@event('plugin.register')
+def register_plugin():
+    plugin.register(LazyTestPlugin, 'lazy_test_plugin', api_ver=2)
+"""
+
+
+class TestLazyPluginLoading(object):
+    module = 'flexget.plugins.lazy_test_plugin'
+
+    def setup(self):
+        self.tmp = maketemp()
+        self.plugin_dir = os.path.join(self.tmp, 'plugins')
+        os.mkdir(self.plugin_dir)
+        self.plugin_file = os.path.join(self.plugin_dir, 'lazy_test_plugin.py')
+        with open(self.plugin_file, 'w') as f:
+            f.write(LAZY_PLUGIN)
+        os.environ['FLEXGET_PLUGIN_PATH'] = self.plugin_dir
+        self.manifest = os.path.join(self.tmp, '.plugin_manifest.json')
+
+    def teardown(self):
+        del os.environ['FLEXGET_PLUGIN_PATH']
+        self.forget_plugin()
+
+    def forget_plugin(self):
+        """Makes the test plugin look like it was never loaded."""
+        plugin.plugins.pop('lazy_test_plugin', None)
+        plugin._lazy_modules.pop(self.module, None)
+        sys.modules.pop(self.module, None)
+
+    def test_manifest_written(self):
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        assert os.path.exists(self.manifest), 'manifest was not written to the given directory'
+        assert not isinstance(plugin.plugins['lazy_test_plugin'], plugin.PluginStub), \
+            'plugins should be imported when there is no manifest'
+
+    def test_lazy_load(self):
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        self.forget_plugin()
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        stub = plugin.plugins['lazy_test_plugin']
+        assert isinstance(stub, plugin.PluginStub), 'plugin should be registered from the manifest'
+        assert self.module not in sys.modules, 'plugin module should not be imported'
+        assert 'filter' in stub.phases
+        assert plugin.load_lazy_plugins(['lazy_test_plugin']) == []
+        assert self.module in sys.modules, 'plugin module was not imported on demand'
+        assert plugin.plugins['lazy_test_plugin'].instance is not None
+
+    def test_phase_schema(self):
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        self.forget_plugin()
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        assert isinstance(plugin.plugins['lazy_test_plugin'], plugin.PluginStub)
+        assert 'lazy_test_plugin' in [p.name for p in plugin.get_plugins(phase='input')], \
+            'phases should be known from the manifest'
+        config = {'tasks': {'test': {'inputs': [{'lazy_test_plugin': True}]}}}
+        errors = config_schema.process_config(config)
+        assert not errors, 'lazy input plugin should be valid in inputs: %s' % [e.message for e in errors]
+        assert self.module not in sys.modules, 'validating should not import the plugin module'
+
+    def test_get_plugin_by_name_loads(self):
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        self.forget_plugin()
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        loaded = plugin.get_plugin_by_name('lazy_test_plugin')
+        assert not isinstance(loaded, plugin.PluginStub)
+        assert loaded.instance is not None
+
+    def test_doc_loads(self):
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        self.forget_plugin()
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            print_doc(None, Namespace(doc='lazy_test_plugin'))
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert 'Lazy test plugin docs' in output, 'docs not printed for lazy plugin: %s' % output
+
+    def test_stale_manifest(self):
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        self.forget_plugin()
+        mtime = os.path.getmtime(self.plugin_file)
+        os.utime(self.plugin_file, (mtime + 10, mtime + 10))
+        plugin.load_plugins(lazy=True, manifest_dir=self.tmp)
+        assert not isinstance(plugin.plugins['lazy_test_plugin'], plugin.PluginStub), \
+            'outdated manifest should not be used'
+        assert self.module in sys.modules
+
+    def test_config_base(self):
+        config = os.path.join(self.tmp, 'config.yml')
+        open(config, 'w').close()
+        assert config_base(['-c', config, 'execute']) == os.path.normpath(self.tmp)
+        assert config_base(['-c', os.path.join(self.tmp, 'missing.yml')]) is None
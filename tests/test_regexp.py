@@ -91,6 +91,17 @@ class TestRegexp(FlexGetBase):
                 - genre1
                 - genre2:
                     not: genre3
+
+          test_first_match:
+            regexp:
+              accept:
+                - nomatch
+                - exp1: '/first'
+                - regexp1: '/second'
+                - (e)xp\\1
+                - regexp:
+                    path: '/third'
+                    not: regexp[15]
     """
 
     def test_accept(self):
@@ -139,3 +150,12 @@ class TestRegexp(FlexGetBase):
         self.execute_task('test_match_in_list')
         assert self.task.find_entry('accepted', title='expression'), '\'expression\' should have been accepted'
         assert self.task.find_entry('entries', title='regular') not in self.task.accepted, '\'regular\' should not have been accepted'
+
+    def test_first_match(self):
+        """Regexps are tried in configured order, even when combined into a single search"""
+        self.execute_task('test_first_match')
+        assert self.task.find_entry('accepted', title='regexp1', path='/first'), \
+            'regexp1 should have been accepted by the first matching regexp'
+        assert self.task.find_entry('accepted', title='regexp2', path='/third'), 'regexp2 should have been accepted'
+        assert not self.task.find_entry('accepted', title='regexp5'), 'regexp5 should not have been accepted'
+        assert not self.task.find_entry('accepted', title='regular'), 'regular should not have been accepted'
@@ -34,6 +34,14 @@ class TestInputRSS(FlexGetBase):
           test_all_entries_yes:
             rss:
               all_entries: yes
+          test_stream:
+            rss:
+              stream: yes
+              other_fields: ['Otherfield']
+          test_stop_after_seen:
+            rss:
+              stream: yes
+              stop_after_seen: 2
     """
 
     def test_rss(self):
@@ -125,6 +133,32 @@ class TestInputRSS(FlexGetBase):
         self.execute_task('test_all_entries_yes')
         assert self.task.entries, 'Entries should have been produced on second run.'
 
+    def test_stream(self):
+        self.execute_task('test_stream')
+        assert self.task.find_entry(title='Normal', url='http://localhost/normal',
+                                    description='Description, normal'), \
+            'RSS entry missing: normal'
+        for num in range(1, 4):
+            assert self.task.find_entry(title='Multiple enclosures', url='http://localhost/enclosure%d' % num,
+                                        filename='enclosure%d' % num), \
+                'RSS entry missing: enclosure%d' % num
+        e = self.task.find_entry(title='Messy enclosure')
+        assert e and e.get('filename') == 'enclosure.mp3', 'Messy RSS enclosure: wrong filename'
+        assert self.task.find_entry(title='Guid link', url='http://localhost/guid'), 'RSS entry missing: guid'
+        assert self.task.find_entry(title='Other fields', otherfield='otherfield'), \
+            'Specified other_field not attached to entry'
+        assert not self.task.find_entry(description='Description, empty title'), \
+            'RSS entry without title should be skipped'
+
+    def test_stop_after_seen(self):
+        self.execute_task('test_stop_after_seen')
+        first_run = len(self.task.entries)
+        assert first_run > 1, 'Entries should have been produced on first run.'
+        from flexget.utils.cached_input import cached
+        cached.cache.clear()
+        self.execute_task('test_stop_after_seen')
+        assert len(self.task.entries) == 1, 'Parsing should have stopped after 2 items seen on the previous run.'
+
 
 class TestRssOnline(FlexGetBase):
 
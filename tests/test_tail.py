@@ -0,0 +1,103 @@
+from __future__ import unicode_literals, division, absolute_import
+import importlib
+import os
+import re
+import shutil
+
+from tests import FlexGetBase
+from tests.util import maketemp
+
+tail = importlib.import_module('flexget.plugins.input.tail')
+
+
+class TestTail(FlexGetBase):
+
+    __yaml__ = """
+        tasks:
+          test:
+            tail:
+              file: autogenerated in setup()
+              entry:
+                title: 'TITLE: (.*)'
+                url: 'URL: (.*)'
+          test_encoding:
+            tail:
+              file: autogenerated in setup()
+              encoding: utf-8
+              entry:
+                title: 'TITLE: (.*)'
+                url: 'URL: (.*)'
+          test_uncombinable:
+            tail:
+              file: autogenerated in setup()
+              entry:
+                title: '\\ATITLE: (.*)'
+                url: 'URL: (.*)'
+    """
+
+    def setup(self):
+        FlexGetBase.setup(self)
+        self.test_home = maketemp()
+        self.log_file = os.path.join(self.test_home, 'irc.log')
+        for task in self.manager.config['tasks'].itervalues():
+            task['tail']['file'] = self.log_file
+        self.write('')
+
+    def teardown(self):
+        shutil.rmtree(self.test_home)
+        FlexGetBase.teardown(self)
+
+    def write(self, text, mode='wb'):
+        with open(self.log_file, mode) as f:
+            f.write(text.encode('utf-8'))
+
+    def execute(self, task='test'):
+        # the input cache would replay entries of the previous run
+        from flexget.utils.cached_input import cached
+        cached.cache.clear()
+        self.execute_task(task)
+        return [(entry['title'], entry['url']) for entry in self.task.entries]
+
+    def test_split_across_runs(self):
+        self.write('TITLE: Foo\nURL: http://foo\nTITLE: Bar\n')
+        assert self.execute() == [('Foo', 'http://foo')]
+        self.write('URL: http://bar\nTITLE: Baz\nURL: http://ba', mode='ab')
+        assert self.execute() == [('Bar', 'http://bar')], 'entry started on previous run should be completed'
+        self.write('z\n', mode='ab')
+        assert self.execute() == [('Baz', 'http://baz')], 'line still being written should be parsed on next run'
+        assert self.execute() == [], 'entries should not be produced again'
+
+    def test_rotation(self):
+        self.write('TITLE: Foo\nURL: http://foo\n')
+        assert self.execute() == [('Foo', 'http://foo')]
+        rotated = os.path.join(self.test_home, 'irc.log.new')
+        with open(rotated, 'wb') as f:
+            f.write(b'TITLE: Bar\nURL: http://bar\nTITLE: Baz\nURL: http://baz\n')
+        os.rename(rotated, self.log_file)
+        assert self.execute() == [('Bar', 'http://bar'), ('Baz', 'http://baz')], \
+            'replaced file should be read from the beginning'
+
+    def test_truncation(self):
+        self.write('TITLE: Foo\nURL: http://foo\nTITLE: Bar\nURL: http://bar\n')
+        assert len(self.execute()) == 2
+        self.write('TITLE: Baz\nURL: http://baz\n')
+        assert self.execute() == [('Baz', 'http://baz')], 'truncated file should be read from the beginning'
+
+    def test_encoding(self):
+        # multibyte characters make character and byte offsets differ
+        title = '\xc4\xe4' * 10
+        self.write('TITLE: %s\nURL: http://one\nTITLE: \xd6\xf6\n' % title)
+        assert self.execute('test_encoding') == [(title, 'http://one')]
+        self.write('URL: http://two\n', mode='ab')
+        assert self.execute('test_encoding') == [('\xd6\xf6', 'http://two')], \
+            'parsing should resume at the start of the incomplete entry'
+
+    def test_uncombinable(self):
+        self.write('Re: TITLE: Foo\nTITLE: Bar\nURL: http://bar\n')
+        assert self.execute('test_uncombinable') == [('Bar', 'http://bar')]
+
+    def test_combine(self):
+        assert tail.combine([re.compile('TITLE: (.*)'), re.compile('URL: (.*)')])
+        for pattern in (r'\ATITLE: (.*)', r'URL: (.*)\Z', r'(?i)TITLE: (.*)', r'(\w+) \1'):
+            assert tail.combine([re.compile(pattern), re.compile('URL: (.*)')]) is None, \
+                '%s should not be combined' % pattern
@@ -1,7 +1,12 @@
 from __future__ import unicode_literals, division, absolute_import
+import importlib
+import zipfile
+from datetime import datetime
+from StringIO import StringIO
+
 from nose.plugins.attrib import attr
 from flexget.manager import Session
-from flexget.plugins.api_tvdb import lookup_episode
+from flexget.plugins.api_tvdb import lookup_episode, ingest_xml, TVDBSeries, TVDBEpisode
 from tests import FlexGetBase
 
 
@@ -153,3 +158,148 @@ class TestThetvdbFavorites(FlexGetBase):
         self.execute_task('test_strip_dates')
         assert self.task.find_entry(title='Hawaii Five-0'), \
             'series Hawaii Five-0 (2010) should have date stripped'
+
+
+SERIES_XML = b"""<?xml version="1.0" encoding="UTF-8" ?>
+<Data>
+<Series><id>1</id><SeriesName>Test Show</SeriesName><Status>Continuing</Status></Series>
+<Banners><Banner><id>5</id><BannerPath>fake.jpg</BannerPath></Banner></Banners>
+<Episode><id>11</id><seriesid>1</seriesid><SeasonNumber>1</SeasonNumber><EpisodeNumber>1</EpisodeNumber>
+<EpisodeName>Pilot</EpisodeName></Episode>
+<Episode><id>12</id><seriesid>1</seriesid><SeasonNumber>1</SeasonNumber><EpisodeNumber>2</EpisodeNumber>
+<EpisodeName>Second</EpisodeName></Episode>
+</Data>
+"""
+
+UPDATE_XML = b"""<?xml version="1.0" encoding="UTF-8" ?>
+<Data time="1400000000">
+<Series><id>1</id><SeriesName>Test Show</SeriesName><Status>Ended</Status></Series>
+<Series><id>2</id><SeriesName>Unknown Show</SeriesName></Series>
+<Episode><id>13</id><seriesid>1</seriesid><SeasonNumber>1</SeasonNumber><EpisodeNumber>3</EpisodeNumber>
+<EpisodeName>Third</EpisodeName></Episode>
+<Episode><id>21</id><seriesid>2</seriesid><SeasonNumber>1</SeasonNumber><EpisodeNumber>1</EpisodeNumber>
+<EpisodeName>Unknown</EpisodeName></Episode>
+</Data>
+"""
+
+# Update files without full records only list the ids of changed items
+EXPIRE_XML = b"""<?xml version="1.0" encoding="UTF-8" ?>
+<Data time="1400000000">
+<Series><id>1</id><time>1400000000</time></Series>
+<Episode><id>11</id><Series>1</Series><time>1400000000</time></Episode>
+</Data>
+"""
+
+
+class TestTvdbMirror(FlexGetBase):
+    """Offline tests for bulk loading data from thetvdb xml files."""
+
+    __yaml__ = """
+        templates:
+          global:
+            # Access a tvdb field to cause lazy loading to occur
+            set:
+              afield: "{{ tvdb_series_name }} {{ tvdb_ep_name }}"
+            accept_all: yes
+            disable_builtins: yes
+        tasks:
+          test_mirror:
+            mock:
+              - {title: 'Test.Show.S01E02.hdtv', tvdb_id: 1}
+            metainfo_series: yes
+            thetvdb_lookup:
+              mirror: yes
+          test_empty_config:
+            mock:
+              - {title: 'Test.Show.S01E02.hdtv', tvdb_id: 1}
+            metainfo_series: yes
+            thetvdb_lookup: {}
+    """
+
+    def setup(self):
+        super(TestTvdbMirror, self).setup()
+        self.api_tvdb = importlib.import_module('flexget.plugins.api_tvdb')
+        self.download_zip = self.api_tvdb.download_zip
+        self.downloads = []
+        self.api_tvdb.download_zip = self.fake_download_zip
+        self.mirrors = dict(self.api_tvdb._mirrors)
+        for kind in ('xml', 'zip', 'banner'):
+            self.api_tvdb._mirrors[kind] = set(['http://mirror.invalid'])
+        # Don't expire everything because of a first run
+        self.api_tvdb.persist['last_local'] = datetime.now()
+
+    def teardown(self):
+        self.api_tvdb.download_zip = self.download_zip
+        self.api_tvdb._mirrors.clear()
+        self.api_tvdb._mirrors.update(self.mirrors)
+        super(TestTvdbMirror, self).teardown()
+
+    def fake_download_zip(self, url, name):
+        self.downloads.append(url)
+        data = StringIO()
+        archive = zipfile.ZipFile(data, 'w')
+        archive.writestr(name, SERIES_XML)
+        archive.close()
+        return zipfile.ZipFile(StringIO(data.getvalue()))
+
+    def ingest(self, xml, known_only=False):
+        session = Session()
+        try:
+            result = ingest_xml(StringIO(xml), session, known_only=known_only)
+            session.commit()
+        finally:
+            session.close()
+        return result
+
+    def test_ingest(self):
+        assert self.ingest(SERIES_XML) == (1, 2)
+        session = Session()
+        series = session.query(TVDBSeries).filter(TVDBSeries.id == 1).one()
+        assert series.seriesname == 'Test Show'
+        assert sorted((ep.seasonnumber, ep.episodenumber, ep.episodename) for ep in series.episodes) == \
+            [(1, 1, 'Pilot'), (1, 2, 'Second')]
+        session.close()
+
+    def test_ingest_known_only(self):
+        self.ingest(SERIES_XML)
+        # Only the known series is updated, and no episodes are added since it is not mirrored
+        assert self.ingest(UPDATE_XML, known_only=True) == (1, 0)
+        session = Session()
+        assert session.query(TVDBSeries).filter(TVDBSeries.id == 1).one().status == 'Ended'
+        assert not session.query(TVDBSeries).filter(TVDBSeries.id == 2).first()
+        assert not session.query(TVDBEpisode).filter(TVDBEpisode.id == 13).first()
+        session.query(TVDBSeries).filter(TVDBSeries.id == 1).update({'mirrored': True})
+        session.commit()
+        session.close()
+        # New episodes are added for mirrored series
+        assert self.ingest(UPDATE_XML, known_only=True) == (1, 1)
+        session = Session()
+        assert session.query(TVDBEpisode).filter(TVDBEpisode.id == 13).one().episodename == 'Third'
+        assert not session.query(TVDBEpisode).filter(TVDBEpisode.id == 21).first()
+        session.close()
+
+    def test_ingest_expires_id_only_records(self):
+        self.ingest(SERIES_XML)
+        assert self.ingest(EXPIRE_XML, known_only=True) == (0, 0)
+        session = Session()
+        assert session.query(TVDBSeries).filter(TVDBSeries.id == 1).one().expired
+        assert session.query(TVDBEpisode).filter(TVDBEpisode.id == 11).one().expired
+        assert not session.query(TVDBEpisode).filter(TVDBEpisode.id == 12).one().expired
+        session.close()
+
+    def test_mirror_lookup(self):
+        self.execute_task('test_mirror')
+        entry = self.task.find_entry(title='Test.Show.S01E02.hdtv')
+        assert entry['afield'] == 'Test Show Second', 'lookup not answered from mirror: %s' % entry['afield']
+        assert len(self.downloads) == 1, 'series should be mirrored once: %s' % self.downloads
+        session = Session()
+        assert session.query(TVDBSeries).filter(TVDBSeries.id == 1).one().mirrored
+        session.close()
+
+    def test_empty_config(self):
+        # Empty config enables the plugin without mirroring
+        self.ingest(SERIES_XML)
+        self.execute_task('test_empty_config')
+        entry = self.task.find_entry(title='Test.Show.S01E02.hdtv')
+        assert entry['afield'] == 'Test Show Second', 'thetvdb_lookup was not enabled: %s' % entry['afield']
+        assert not self.downloads
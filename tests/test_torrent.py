@@ -1,5 +1,6 @@
 from __future__ import unicode_literals, division, absolute_import
 import os
+import importlib
 
 from nose.plugins.attrib import attr
 from tests import FlexGetBase, with_filecopy
@@ -312,6 +313,44 @@ class TestTorrentAlive(FlexGetBase):
         assert get_udp_seeds('udp://127.0.0.1:PORT/announce','HASH') == 0
         assert get_udp_seeds('udp://127.0.0.1:65536/announce','HASH') == 0
 
+
+class TestScrapeService(object):
+
+    def setup(self):
+        # Plugin modules are not set as attributes of their package by the plugin loader
+        torrent_alive = importlib.import_module('flexget.plugins.filter.torrent_alive')
+        self.module = torrent_alive
+        self.original = torrent_alive.scrape_tracker
+        self.calls = []
+
+        def fake_scrape(url, info_hashes):
+            self.calls.append((url, list(info_hashes)))
+            if 'dead' in url:
+                raise torrent_alive.ScrapeError('dead tracker')
+            return dict((info_hash, 5) for info_hash in info_hashes)
+
+        torrent_alive.scrape_tracker = fake_scrape
+
+    def teardown(self):
+        self.module.scrape_tracker = self.original
+
+    def test_batches_and_caches(self):
+        service = self.module.ScrapeService()
+        wanted = [('http://a/announce', 'AA'), ('http://a/announce', 'BB'), ('udp://b:80', 'AA')]
+        results = service.scrape(wanted)
+        assert results == {('http://a/announce', 'AA'): 5, ('http://a/announce', 'BB'): 5, ('udp://b:80', 'AA'): 5}
+        assert sorted(self.calls) == [('http://a/announce', ['AA', 'BB']), ('udp://b:80', ['AA'])]
+        # Second scrape should come from cache
+        assert service.scrape(wanted) == results
+        assert len(self.calls) == 2
+
+    def test_circuit_breaker(self):
+        service = self.module.ScrapeService()
+        for i in range(self.module.BREAKER_FAILURES + 2):
+            assert service.scrape([('http://dead/announce', 'AA')]) == {}
+        assert len(self.calls) == self.module.BREAKER_FAILURES
+
+
 class TestRtorrentMagnet(FlexGetBase):
     __tmp__ = True
     __yaml__ = """
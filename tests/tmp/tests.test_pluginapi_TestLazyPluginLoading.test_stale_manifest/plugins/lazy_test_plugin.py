@@ -0,0 +1,22 @@
+
+from __future__ import unicode_literals, division, absolute_import
+
+from flexget import plugin
+from flexget.event import event
+
+
+class LazyTestPlugin(object):
+    """Lazy test plugin docs"""
+
+    schema = {'type': 'boolean'}
+
+    def on_task_input(self, task, config):
+        return []
+
+    def on_task_filter(self, task, config):
+        pass
+
+
+@event('plugin.register')
+def register_plugin():
+    plugin.register(LazyTestPlugin, 'lazy_test_plugin', api_ver=2)